@@ -1,248 +1,457 @@
-from flask import Flask, request, redirect, jsonify
-from database import init_db, get_db_connection
-from datetime import datetime
-import markdown
+from flask import Flask, request, redirect, jsonify, render_template, make_response
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
+from database import (init_db, init_app, get_db_connection, data_version,
+                      run_write, execute_write)
+from fragment_cache import cached_fragment, get_fragment, put_fragment
+from search import build_match_query, search_practices, search_notes
+from markdown_cache import render_markdown, invalidate as invalidate_markdown
+from scheduler import GRADES, GRADE_CARD_SQL
+from forecast import forecast
+from rebalance import rebalance, check_tolerance, DEFAULT_TOLERANCE
+from importer import DEFAULT_SUBJECT, DEFAULT_TOPIC, ImportFileError, guess_format, import_file
+import dedup
+import query_cache
+from reviews import (MAX_BATCH_SIZE, RATE_PRACTICE_SQL, INCREMENT_PRACTICE_DATE_SQL,
+                     write_reviews)
+import metrics
+from datetime import datetime, timedelta
+from functools import lru_cache, wraps
+from urllib.parse import urlencode
+import hashlib
+import os
+import time
 
 app = Flask(__name__)
+# SQLite tuning profile ('fast' or 'safe'); override with FLASK_SQLITE_PROFILE etc.
+app.config['SQLITE_PROFILE'] = 'fast'
+# Review scheduler used by /grade-practice: 'fsrs' or 'sm2'
+app.config['SCHEDULER'] = 'fsrs'
+# Request/SQL instrumentation served at /metrics (FLASK_METRICS=true); when
+# off, nothing is hooked in. Slower queries and requests are logged.
+app.config['METRICS'] = False
+app.config['METRICS_SLOW_QUERY_MS'] = metrics.SLOW_QUERY_MS
+app.config['METRICS_SLOW_REQUEST_MS'] = metrics.SLOW_REQUEST_MS
+# Send writes through one writer thread that group-commits them (writer.py)
+app.config['WRITE_QUEUE'] = True
+# Adding a card whose content already exists: 'skip', 'merge' or 'allow'
+# (dedup.py); imports can override it per upload. Notes are always added.
+app.config['DUPLICATE_POLICY'] = dedup.DEFAULT_POLICY
+# Cards sent per /api/cards request; the practice page prefetches this many
+app.config['CARD_PREFETCH'] = 10
+app.config.from_prefixed_env()
+# Templates are compiled once per process; drop the whitespace around tags
+app.jinja_env.trim_blocks = True
+app.jinja_env.lstrip_blocks = True
+init_app(app)
+metrics.init_app(app)
 
 # Initialize database on app startup
 with app.app_context():
     init_db()
 
 
-def format_date(date_string):
-    """Format date string to human-readable format."""
+@lru_cache(maxsize=4096)
+def format_timestamp(epoch):
+    """Format epoch seconds as local time: Monday, December 10, 2025 at 2:30 PM."""
+    if epoch is None:
+        return ''
+    return datetime.fromtimestamp(epoch).strftime('%A, %B %d, %Y at %I:%M %p')
+
+
+app.add_template_filter(format_timestamp)
+
+
+@lru_cache(maxsize=256)
+def local_period(text):
+    """Return the epoch seconds (start, end) of a local YYYY, YYYY-MM or
+    YYYY-MM-DD period, or None if `text` is not one.
+
+    The boundaries are local midnights, so a day is 23 or 25 hours long
+    across a DST change.
+    """
     try:
-        if isinstance(date_string, str):
-            # Parse ISO format datetime
-            dt = datetime.fromisoformat(date_string.replace('Z', '+00:00'))
+        parts = [int(part) for part in text.split('-')]
+        if len(parts) == 1:
+            start, end = datetime(parts[0], 1, 1), datetime(parts[0] + 1, 1, 1)
+        elif len(parts) == 2:
+            year, month = parts
+            start = datetime(year, month, 1)
+            end = datetime(year + month // 12, month % 12 + 1, 1)
+        elif len(parts) == 3:
+            start = datetime(*parts)
+            end = start + timedelta(days=1)
+        else:
+            return None
+        return int(start.timestamp()), int(end.timestamp())
+    except (ValueError, OverflowError):
+        return None
+
+
+def encode_cursor(row, bucket='due'):
+    """Encode a row's sort key as a (due or day, stars, id) page cursor."""
+    return f'{row[bucket]}|{row["stars"]}|{row["id"]}'
+
+
+def parse_cursor(cursor, bucket=str):
+    """Parse a page cursor back into (due or day, stars, id), or None if invalid.
+
+    `bucket` converts the first field: int for due times, str for days.
+    """
+    try:
+        key, stars, row_id = cursor.rsplit('|', 2)
+        return (bucket(key), int(stars), int(row_id))
+    except ValueError:
+        return None
+
+
+def lookup_id(conn, table, name):
+    """Return the id of `name` in a subjects/topics lookup table, or None."""
+    row = query_cache.fetchone(conn, f'SELECT id FROM {table} WHERE name = ?', (name,))
+    return row['id'] if row else None
+
+
+def fetch_practice_page(conn, conditions, params, limit, after=None, before=None, offset=0, last=False):
+    """Fetch one page of practices ordered by (due, stars, id).
+
+    With an `after` or `before` cursor the page is found with an index-friendly
+    seek instead of scanning past every earlier row. `last` seeks from the end
+    of the deck, and `offset` is only used for direct page jumps.
+    """
+    conditions = list(conditions)
+    params = list(params)
+    descending = False
+
+    if after:
+        conditions.append('(due, stars, id) > (?, ?, ?)')
+        params.extend(after)
+    elif before:
+        conditions.append('(due, stars, id) < (?, ?, ?)')
+        params.extend(before)
+        descending = True
+    elif last:
+        descending = True
+
+    query = 'SELECT * FROM spaced_repetition'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    direction = 'DESC' if descending else 'ASC'
+    query += f' ORDER BY due {direction}, stars {direction}, id {direction} LIMIT ?'
+    params.append(limit)
+    if offset and not (after or before or last):
+        query += ' OFFSET ?'
+        params.append(offset)
+
+    rows = conn.execute(query, params).fetchall()
+    if descending:
+        rows.reverse()
+    return rows
+
+
+def practice_conditions(conn, args):
+    """Return (conditions, params) for the /practice filters in `args`."""
+    conditions = []
+    params = []
+
+    # Subjects/topics are matched by their integer lookup id; an unknown
+    # name maps to NULL, which matches nothing
+    if args.get('subject'):
+        conditions.append('subject_id = ?')
+        params.append(lookup_id(conn, 'subjects', args['subject']))
+    if args.get('topic'):
+        conditions.append('topic_id = ?')
+        params.append(lookup_id(conn, 'topics', args['topic']))
+    if args.get('stars'):
+        # store as int if provided
+        try:
+            params.append(int(args['stars']))
+            conditions.append('stars = ?')
+        except ValueError:
+            pass
+
+    filter_type = args.get('filter', 'all')
+    condition, condition_params = practice_date_condition(filter_type, args.get('date', ''))
+    if condition:
+        conditions.append(condition)
+        params.extend(condition_params)
+    elif filter_type == 'due':
+        conditions.append('due <= ?')
+        params.append(int(time.time()))
+
+    # Full-text search on question, answer, subject and topic
+    match_q = build_match_query(args.get('q', ''))
+    if match_q:
+        conditions.append(
+            'id IN (SELECT rowid FROM practice_fts WHERE practice_fts MATCH ?)')
+        params.append(match_q)
+    return conditions, params
+
+
+def render_practice_card(conn, practice):
+    """Return a card's HTML, cached until any of the row's values change."""
+    return cached_fragment(('practice_card', tuple(practice)), lambda: render_template(
+        '_practice_card.html', practice=practice, grades=GRADES,
+        answer_html=Markup(render_markdown(conn, practice['answer']))))
+
+
+def note_date_condition(filter_type, filter_date):
+    """Return (condition, params) for the notes date filter.
+
+    The filter date (YYYY-MM-DD or a prefix of one) is compared with the
+    indexed local day bucket, so every filter is a range of days.
+    """
+    if not filter_date or filter_type not in ('before', 'after', 'on'):
+        return None, []
+    if filter_type == 'before':
+        return 'day < ?', [filter_date]
+    if filter_type == 'after':
+        return 'day >= ?', [filter_date]
+    if len(filter_date) == 10:
+        return 'day = ?', [filter_date]
+    # The days starting with filter_date
+    return 'day >= ? AND day < ?', [filter_date, filter_date + '\U0010ffff']
+
+
+def practice_date_condition(filter_type, filter_date):
+    """Return (condition, params) for the practice date filter on due times.
+
+    Unlike the notes' day bucket, due is an epoch time, so the local period
+    is turned into epoch bounds once per request. A date that is not
+    YYYY[-MM[-DD]] is ignored.
+    """
+    period = local_period(filter_date) if filter_date else None
+    if period is None or filter_type not in ('before', 'after', 'on'):
+        return None, []
+    start, end = period
+    if filter_type == 'before':
+        return 'due < ?', [start]
+    if filter_type == 'after':
+        return 'due >= ?', [start]
+    return 'due >= ? AND due < ?', [start, end]
+
+
+def count_notes(conn, conditions, params, by_day):
+    """Count the notes matching `conditions`.
+
+    When they only involve the day bucket, the per-day counts in note_days
+    are summed instead, which touches one row per day rather than per note.
+    Counts are cached until a note changes (query_cache.py).
+    """
+    if by_day:
+        query = 'SELECT COALESCE(SUM(note_count), 0) FROM note_days'
+        if conditions:
+            # '' counts the notes without a date, which no filter matches
+            query += " WHERE day != '' AND " + ' AND '.join(conditions)
+    else:
+        query = 'SELECT COUNT(*) FROM notes'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+    return query_cache.fetchone(conn, query, params)[0]
+
+
+def fetch_note_page(conn, conditions, params, limit, newest_first=False,
+                    after=None, before=None, offset=0, last=False):
+    """Fetch one page of notes ordered by day (oldest or newest first), stars, id.
+
+    Like fetch_practice_page, `after`/`before` cursors seek through the
+    (day, stars) indexes and `offset` is only used for direct page jumps.
+    Newest-first still orders stars and ids ascending within a day, so its
+    seeks bound the day and compare (stars, id) on the boundary day.
+    """
+    conditions = list(conditions)
+    params = list(params)
+    reverse = False
+
+    if after:
+        day, stars, note_id = after
+        if newest_first:
+            conditions.append('day <= ? AND (day < ? OR (stars, id) > (?, ?))')
+            params.extend([day, day, stars, note_id])
         else:
-            dt = date_string
-        # Format as: Monday, December 10, 2025 at 2:30 PM
-        return dt.strftime('%A, %B %d, %Y at %I:%M %p')
-    except:
-        return date_string
+            conditions.append('(day, stars, id) > (?, ?, ?)')
+            params.extend(after)
+    elif before:
+        day, stars, note_id = before
+        if newest_first:
+            conditions.append('day >= ? AND (day > ? OR (stars, id) < (?, ?))')
+            params.extend([day, day, stars, note_id])
+        else:
+            conditions.append('(day, stars, id) < (?, ?, ?)')
+            params.extend(before)
+        reverse = True
+    elif last:
+        reverse = True
+
+    query = 'SELECT * FROM notes'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    day_direction = 'DESC' if newest_first != reverse else 'ASC'
+    direction = 'DESC' if reverse else 'ASC'
+    query += f' ORDER BY day {day_direction}, stars {direction}, id {direction} LIMIT ?'
+    params.append(limit)
+    if offset and not (after or before or last):
+        query += ' OFFSET ?'
+        params.append(offset)
+
+    rows = conn.execute(query, params).fetchall()
+    if reverse:
+        rows.reverse()
+    return rows
+
+
+def _build_id():
+    """Hash of the templates and static files, so a deploy changes every ETag."""
+    digest = hashlib.sha1()
+    for folder in (app.template_folder, app.static_folder):
+        folder = os.path.join(app.root_path, folder)
+        for name in sorted(os.listdir(folder)):
+            with open(os.path.join(folder, name), 'rb') as f:
+                digest.update(name.encode('utf-8') + b'\0' + f.read())
+    return digest.hexdigest()
+
+
+BUILD_ID = _build_id()
+# Most cards one /api/cards request returns
+MAX_CARD_BATCH = 100
+
+
+def conditional(*names, unless=None):
+    """Answer a GET with 304 Not Modified when the client's copy is current.
+
+    The ETag is derived from the data_versions counters of `names` and the
+    query string, so a current copy is recognised without querying any rows
+    or rendering. No Last-Modified is sent: it only has whole seconds, so
+    a second write in the same second would still validate.
+    Responses carry Cache-Control: no-cache, letting browsers and a reverse
+    proxy keep the page but revalidate it on every use. `unless` skips all
+    of this for requests whose page also depends on something else.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or (unless and unless()):
+                return view(*args, **kwargs)
+
+            versions = data_version(get_db_connection(), *names)
+            etag = hashlib.sha1(repr(
+                (BUILD_ID, request.path, request.query_string, versions)).encode()).hexdigest()
+
+            if is_resource_modified(request.environ, etag=etag):
+                response = make_response(view(*args, **kwargs))
+            else:
+                response = app.response_class(status=304)
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
 
 
 @app.route('/', methods=['GET', 'POST'])
+@conditional('notes')
 def home():
     if request.method == 'POST':
         text = request.form.get('text')
         if text:
-            conn = get_db_connection()
-            conn.execute('INSERT INTO notes (text) VALUES (?)', (text,))
-            conn.commit()
-            conn.close()
+            # A note typed by hand is kept even if its text repeats an older
+            # one; the redirect would have no way to say it was skipped
+            run_write(lambda conn: dedup.insert_note(conn, text, 'allow'))
         return redirect('/')
 
     # Pagination settings
-    page = request.args.get('page', 1, type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
     notes_per_page = 20
     offset = (page - 1) * notes_per_page
+    # Keyset cursors carried in the page links
+    after_arg = request.args.get('after', '', type=str)
+    before_arg = request.args.get('before', '', type=str)
+    last = request.args.get('last', '', type=str) == '1'
 
     # Date filter settings
     filter_type = request.args.get('filter', 'all', type=str)
     filter_date = request.args.get('date', '', type=str)
     sort_order = request.args.get('sort', 'asc', type=str)
-    # Search term for notes (used in template only)
+    # Full-text search term for notes
     filter_q = request.args.get('q', '', type=str)
 
-    conn = get_db_connection()
-    items = conn.execute('SELECT * FROM items').fetchall()
+    # Keep filters/search in the pagination links
+    params_parts = {}
+    if filter_type and filter_type != 'all':
+        params_parts['filter'] = filter_type
+    if filter_date:
+        params_parts['date'] = filter_date
+    if sort_order != 'asc':
+        params_parts['sort'] = sort_order
+    if filter_q:
+        params_parts['q'] = filter_q
+
+    def page_link(**link_params):
+        return '/?' + urlencode({**link_params, **params_parts})
+
+    def render_notes_table():
+        # Build parameterized query based on filter
+        conditions = []
+        params = []
+
+        condition, condition_params = note_date_condition(filter_type, filter_date)
+        if condition:
+            conditions.append(condition)
+            params.extend(condition_params)
+
+        match_q = build_match_query(filter_q)
+        if match_q:
+            conditions.append(
+                'id IN (SELECT rowid FROM notes_fts WHERE notes_fts MATCH ?)')
+            params.append(match_q)
+
+        # Get total count of notes with filter; without a search the date
+        # filter is on days only, so note_days can be summed
+        total_notes = count_notes(conn, conditions, params, by_day=not match_q)
+
+        # Calculate total pages
+        total_pages = (total_notes + notes_per_page - 1) // notes_per_page
+        current_page = max(total_pages, 1) if last else page
+
+        # Sort by day first, then by stars (ascending) within the same day
+        page_size = notes_per_page
+        if last and total_notes:
+            page_size = total_notes - (total_pages - 1) * notes_per_page
+        notes = fetch_note_page(conn, conditions, params, page_size,
+                                newest_first=sort_order == 'desc',
+                                after=parse_cursor(after_arg), before=parse_cursor(before_arg),
+                                offset=offset, last=last)
+
+        # Next/Previous seek from the notes on this page
+        if notes:
+            next_link = page_link(page=current_page + 1, after=encode_cursor(notes[-1], 'day'))
+            prev_link = page_link(page=current_page - 1, before=encode_cursor(notes[0], 'day'))
+        else:
+            next_link = page_link(page=current_page + 1)
+            prev_link = page_link(page=current_page - 1)
 
-    # Build query based on filter
-    query = 'SELECT * FROM notes'
-    query_count = 'SELECT COUNT(*) as count FROM notes'
-
-    if filter_type == 'before' and filter_date:
-        query += f' WHERE date < "{filter_date}"'
-        query_count += f' WHERE date < "{filter_date}"'
-    elif filter_type == 'after' and filter_date:
-        query += f' WHERE date > "{filter_date}"'
-        query_count += f' WHERE date > "{filter_date}"'
-    elif filter_type == 'on' and filter_date:
-        query += f' WHERE date LIKE "{filter_date}%"'
-        query_count += f' WHERE date LIKE "{filter_date}%"'
-
-    # Get total count of notes with filter
-    total_notes = conn.execute(query_count).fetchone()['count']
-
-    # Get paginated notes with sort order
-    # Sort by date first, then by stars (ascending) within the same day
-    order_direction = 'DESC' if sort_order == 'desc' else 'ASC'
-    query += f' ORDER BY DATE(date) {order_direction}, stars ASC LIMIT ? OFFSET ?'
-    notes = conn.execute(query, (notes_per_page, offset)).fetchall()
-    conn.close()
+        return render_template('_notes_table.html', notes=notes, page=current_page,
+                               total_pages=total_pages, total_notes=total_notes,
+                               first_link=page_link(page=1), prev_link=prev_link,
+                               next_link=next_link,
+                               last_link=page_link(page=total_pages, last=1))
 
-    # Calculate total pages
-    total_pages = (total_notes + notes_per_page - 1) // notes_per_page
-
-    items_html = ''
-    if items:
-        items_html = '<ul>'
-        for item in items:
-            items_html += f'<li>{item["name"]}: {item["description"]}</li>'
-        items_html += '</ul>'
-    else:
-        items_html = '<p>No items in the database yet.</p>'
-
-    notes_html = ''
-    if notes:
-        notes_html = '<table border="1" style="width:100%; border-collapse: collapse;">'
-        notes_html += '<tr><th style="padding: 10px;">Text</th><th style="padding: 10px;">Date</th><th style="padding: 10px;">Importance</th><th style="padding: 10px;">Actions</th><th style="padding: 10px;">Change Date</th></tr>'
-        for note in notes:
-            formatted_date = format_date(note["date"])
-            try:
-                stars = note["stars"] if note["stars"] else 0
-            except (IndexError, KeyError):
-                stars = 0
-            star_html = '⭐' * stars if stars > 0 else '✩ (0 stars)'
-
-            # Star rating buttons
-            star_buttons = '<div style="display: flex; gap: 3px; flex-wrap: wrap;">'
-            for star_count in range(1, 6):
-                star_buttons += f'<a href="/rate-note/{note["id"]}/{star_count}" style="padding: 3px 8px; background-color: #FFD700; color: black; text-decoration: none; border-radius: 3px; font-size: 12px; cursor: pointer;">{"⭐" * star_count}</a>'
-            star_buttons += '</div>'
-
-            date_buttons = '<div style="display: flex; gap: 5px; flex-wrap: wrap;">'
-            for days in [1, 3, 7, 14, 30]:
-                date_buttons += f'<a href="/increment-date/{note["id"]}/{days}" style="padding: 3px 8px; background-color: #FF9800; color: white; text-decoration: none; border-radius: 3px; font-size: 12px;">+{days}d</a>'
-            date_buttons += '</div>'
-            notes_html += f'<tr><td style="padding: 10px;">{note["text"]}</td><td style="padding: 10px;">{formatted_date}</td><td style="padding: 10px;">{star_html}</td><td style="padding: 10px;"><a href="/delete/{note["id"]}" style="margin-right: 10px; padding: 5px 10px; background-color: #f44336; color: white; text-decoration: none; border-radius: 4px;">Delete</a><a href="/edit/{note["id"]}" style="padding: 5px 10px; background-color: #2196F3; color: white; text-decoration: none; border-radius: 4px;">Edit</a></td><td style="padding: 10px;">{date_buttons}</td></tr>'
-            notes_html += f'<tr><td colspan="5" style="padding: 5px 10px; background-color: #fafafa;"><strong>Rate:</strong> {star_buttons}</td></tr>'
-        notes_html += '</table>'
-
-        # Add pagination controls
-        notes_html += '<div style="margin-top: 20px; text-align: center;">'
-        notes_html += f'<p>Page {page} of {total_pages} (Total: {total_notes} notes)</p>'
-        notes_html += '<div>'
-
-        if page > 1:
-            notes_html += f'<a href="/?page=1" style="margin: 0 5px;">First</a>'
-            notes_html += f'<a href="/?page={page-1}" style="margin: 0 5px;">Previous</a>'
-
-        notes_html += f'<span style="margin: 0 10px;">Page {page}</span>'
-
-        if page < total_pages:
-            notes_html += f'<a href="/?page={page+1}" style="margin: 0 5px;">Next</a>'
-            notes_html += f'<a href="/?page={total_pages}" style="margin: 0 5px;">Last</a>'
-
-        notes_html += '</div></div>'
-    else:
-        notes_html = '<p>No notes yet.</p>'
-
-    navbar = '''
-        <nav style="background-color: #333; padding: 0; margin: 0; position: sticky; top: 0; z-index: 1000;">
-            <ul style="list-style: none; margin: 0; padding: 0; display: flex;">
-                <li style="margin: 0;"><a href="/" style="display: block; padding: 15px 20px; color: white; text-decoration: none; background-color: #333; transition: background-color 0.3s;">Home</a></li>
-                <li style="margin: 0;"><a href="/practice" style="display: block; padding: 15px 20px; color: white; text-decoration: none; background-color: #333; transition: background-color 0.3s;">Spaced Repetition</a></li>
-            </ul>
-        </nav>
-    '''
-
-    return f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Home</title>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                max-width: 900px;
-                margin: 0 auto;
-                padding: 20px;
-            }}
-            nav ul li a:hover {{
-                background-color: #555 !important;
-            }}
-            textarea {{
-                width: 100%;
-                padding: 10px;
-                margin: 10px 0;
-                font-size: 14px;
-            }}
-            button {{
-                padding: 10px 20px;
-                font-size: 16px;
-                cursor: pointer;
-                background-color: #4CAF50;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }}
-            button:hover {{
-                background-color: #45a049;
-            }}
-            h2 {{
-                color: #333;
-                border-bottom: 2px solid #4CAF50;
-                padding-bottom: 10px;
-            }}
-            table {{
-                width: 100%;
-                border-collapse: collapse;
-                margin-top: 20px;
-            }}
-            table th, table td {{
-                border: 1px solid #ddd;
-                padding: 12px;
-                text-align: left;
-            }}
-            table th {{
-                background-color: #4CAF50;
-                color: white;
-            }}
-            table tr:nth-child(even) {{
-                background-color: #f2f2f2;
-            }}
-        </style>
-    </head>
-    <body>
-        {navbar}
-        <h1>Welcome to the Home Page</h1>
-        <p>This is a simple Flask application with SQLite database.</p>
-        
-        <h2>Add a Note</h2>
-        <form method="post">
-            <textarea name="text" placeholder="Enter your note here..." required></textarea>
-            <button type="submit">Save Note</button>
-        </form>
-        
-        <h2>Filter Notes by Date</h2>
-        <form method="get" style="margin-bottom: 20px; padding: 15px; background-color: #f9f9f9; border-radius: 4px;">
-            <label for="filter" style="margin-right: 10px; font-weight: bold;">Filter Type:</label>
-            <select name="filter" id="filter" style="padding: 8px; margin-right: 20px;">
-                <option value="all" {"selected" if filter_type == "all" else ""}>All Notes</option>
-                <option value="before" {"selected" if filter_type == "before" else ""}>Before Date</option>
-                <option value="after" {"selected" if filter_type == "after" else ""}>After Date</option>
-                <option value="on" {"selected" if filter_type == "on" else ""}>On Date</option>
-            </select>
-            <label for="date" style="margin-right: 10px; font-weight: bold;">Date:</label>
-            <input type="date" name="date" id="date" value="{filter_date}" style="padding: 8px; margin-right: 20px;">
-            <label for="sort" style="margin-right: 10px; font-weight: bold;">Sort Order:</label>
-            <select name="sort" id="sort" style="padding: 8px; margin-right: 20px;">
-                <option value="asc" {"selected" if sort_order == "asc" else ""}>Oldest First (Ascending)</option>
-                <option value="desc" {"selected" if sort_order == "desc" else ""}>Newest First (Descending)</option>
-            </select>
-            <label for="q" style="margin-right: 10px; font-weight: bold;">Search:</label>
-            <input type="text" name="q" id="q" value="{filter_q}" placeholder="Search question or answer" style="padding: 8px; margin-right: 20px;">
-            <button type="submit" style="padding: 8px 16px; background-color: #2196F3; color: white; border: none; border-radius: 4px; cursor: pointer;">Filter</button>
-            <a href="/" style="padding: 8px 16px; background-color: #999; color: white; text-decoration: none; border-radius: 4px; display: inline-block; margin-left: 10px;">Clear Filter</a>
-        </form>
-        
-        <h2>Notes:</h2>
-        {notes_html}
-    </body>
-    </html>
-    '''
+    # The notes table only changes when a note does, so a cached copy for
+    # this page and filter skips both queries
+    conn = get_db_connection()
+    notes_version, = data_version(conn, 'notes')
+    notes_table = cached_fragment(
+        ('notes_table', notes_version, page, after_arg, before_arg, last,
+         filter_type, filter_date, sort_order, filter_q),
+        render_notes_table)
+
+    return render_template('home.html', notes_table=notes_table,
+                           filter_type=filter_type, filter_date=filter_date,
+                           sort_order=sort_order, filter_q=filter_q)
 
 
 @app.route('/delete/<int:note_id>', methods=['GET'])
 def delete_note(note_id):
-    conn = get_db_connection()
-    conn.execute('DELETE FROM notes WHERE id = ?', (note_id,))
-    conn.commit()
-    conn.close()
+    execute_write('DELETE FROM notes WHERE id = ?', (note_id,))
     return redirect('/')
 
 
@@ -251,97 +460,30 @@ def edit_note(note_id):
     if request.method == 'POST':
         text = request.form.get('text')
         if text:
-            conn = get_db_connection()
-            conn.execute('UPDATE notes SET text = ? WHERE id = ?',
-                         (text, note_id))
-            conn.commit()
-            conn.close()
+            run_write(lambda conn: dedup.update_note(conn, note_id, text))
         return redirect('/')
 
     conn = get_db_connection()
     note = conn.execute('SELECT * FROM notes WHERE id = ?',
                         (note_id,)).fetchone()
-    conn.close()
 
     if note is None:
         return redirect('/')
 
-    return f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Edit Note</title>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                max-width: 900px;
-                margin: 0 auto;
-                padding: 20px;
-            }}
-            textarea {{
-                width: 100%;
-                padding: 10px;
-                margin: 10px 0;
-                font-size: 14px;
-            }}
-            button {{
-                padding: 10px 20px;
-                font-size: 16px;
-                cursor: pointer;
-                background-color: #4CAF50;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                margin-right: 10px;
-            }}
-            button:hover {{
-                background-color: #45a049;
-            }}
-            a {{
-                padding: 10px 20px;
-                font-size: 16px;
-                background-color: #999;
-                color: white;
-                text-decoration: none;
-                border-radius: 4px;
-            }}
-            a:hover {{
-                background-color: #777;
-            }}
-            h1 {{
-                color: #333;
-            }}
-        </style>
-    </head>
-    <body>
-        <h1>Edit Note</h1>
-        <form method="post">
-            <textarea name="text" required>{note["text"]}</textarea>
-            <button type="submit">Update Note</button>
-            <a href="/">Cancel</a>
-        </form>
-    </body>
-    </html>
-    '''
+    return render_template('edit_note.html', note=note)
 
 
 @app.route('/increment-date/<int:note_id>/<int:days>', methods=['GET'])
 def increment_date(note_id, days):
-    from datetime import datetime, timedelta
-
-    conn = get_db_connection()
-    note = conn.execute('SELECT * FROM notes WHERE id = ?',
-                        (note_id,)).fetchone()
-
-    if note:
-        current_date = datetime.fromisoformat(
-            note['date'].replace('Z', '+00:00'))
-        new_date = current_date + timedelta(days=days)
-        conn.execute('UPDATE notes SET date = ? WHERE id = ?',
-                     (new_date.isoformat(), note_id))
-        conn.commit()
-
-    conn.close()
+    # One statement on the epoch time, so concurrent bumps all count; days
+    # are added in local time, like INCREMENT_PRACTICE_DATE_SQL
+    modifier = f'+{days} days'
+    execute_write(
+        """UPDATE notes
+           SET date_ts = CAST(strftime('%s', date_ts, 'unixepoch', 'localtime', ?, 'utc') AS INTEGER),
+               date = strftime('%Y-%m-%dT%H:%M:%S', date_ts, 'unixepoch', 'localtime', ?)
+           WHERE id = ?""",
+        (modifier, modifier, note_id))
     return redirect('/')
 
 
@@ -349,45 +491,121 @@ def increment_date(note_id, days):
 def rate_note(note_id, stars):
     """Rate a note with 1-5 stars."""
     if 1 <= stars <= 5:
-        conn = get_db_connection()
-        conn.execute('UPDATE notes SET stars = ? WHERE id = ?',
-                     (stars, note_id))
-        conn.commit()
-        conn.close()
+        execute_write('UPDATE notes SET stars = ? WHERE id = ?', (stars, note_id))
 
     return redirect('/')
 
 
 @app.route('/increment-practice-date/<int:practice_id>/<int:days>', methods=['GET'])
 def increment_practice_date(practice_id, days):
-    """Increment the date of a spaced repetition practice item."""
-    from datetime import timedelta
+    """Increment the date (and due time) of a spaced repetition practice item."""
+    modifier = f'+{days} days'
+    execute_write(INCREMENT_PRACTICE_DATE_SQL, (modifier, modifier, practice_id))
+
+    return redirect('/practice')
 
-    conn = get_db_connection()
-    practice = conn.execute('SELECT * FROM spaced_repetition WHERE id = ?',
-                            (practice_id,)).fetchone()
 
-    if practice:
-        current_date = datetime.fromisoformat(
-            practice['date'].replace('Z', '+00:00'))
-        new_date = current_date + timedelta(days=days)
-        conn.execute('UPDATE spaced_repetition SET date = ? WHERE id = ?',
-                     (new_date.isoformat(), practice_id))
-        conn.commit()
+@app.route('/grade-practice/<int:practice_id>/<int:grade>', methods=['GET'])
+def grade_practice(practice_id, grade):
+    """Grade a review (1=Again .. 4=Easy) and schedule the item's next review."""
+    if grade in GRADES:
+        execute_write(GRADE_CARD_SQL, (app.config['SCHEDULER'], grade,
+                                       int(time.time()), practice_id))
 
-    conn.close()
     return redirect('/practice')
 
 
+@app.route('/api/reviews', methods=['POST'])
+def sync_reviews():
+    """Apply a batch of queued review events in one transaction.
+
+    Body: {"reviews": [{"card_id", "idempotency_key", "client_ts",
+    "grade" | "stars" | "days"}, ...]}. Resending a batch is safe.
+    """
+    body = request.get_json(silent=True)
+    reviews = body.get('reviews') if isinstance(body, dict) else None
+    if not isinstance(reviews, list):
+        return jsonify({'error': 'expected {"reviews": [...]}'}), 400
+    if len(reviews) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'at most {MAX_BATCH_SIZE} reviews per batch'}), 413
+
+    algorithm = app.config['SCHEDULER']
+    result = run_write(lambda conn: write_reviews(conn, reviews, algorithm))
+    return jsonify(result)
+
+
+@app.route('/api/import', methods=['POST'])
+def import_route():
+    """Import cards from an uploaded CSV, TSV or Anki .apkg file.
+
+    Multipart form: file, plus optional format, columns (e.g.
+    "question,answer"), subject, topic and duplicates (the duplicate policy,
+    default DUPLICATE_POLICY). Returns the import report.
+    """
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'expected a multipart "file" upload'}), 400
+    file_format = request.form.get('format') or guess_format(upload.filename)
+    columns = request.form.get('columns')
+    try:
+        report = import_file(
+            # One transaction for the whole file, however long it takes
+            upload.stream, file_format, lambda fn: run_write(fn, timeout=None),
+            columns=[c.strip() for c in columns.split(',')] if columns else None,
+            subject=request.form.get('subject') or DEFAULT_SUBJECT,
+            topic=request.form.get('topic') or DEFAULT_TOPIC,
+            policy=request.form.get('duplicates') or app.config['DUPLICATE_POLICY'])
+    except ImportFileError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(report)
+
+
+@app.route('/next-due', methods=['GET'])
+def next_due():
+    """Return the next due practice item (one index seek) and the due count."""
+    now = int(time.time())
+    conn = get_db_connection()
+    practice = conn.execute(
+        'SELECT * FROM spaced_repetition WHERE due <= ? ORDER BY due LIMIT 1',
+        (now,)).fetchone()
+    due_count = conn.execute(
+        'SELECT COUNT(*) AS count FROM spaced_repetition WHERE due <= ?',
+        (now,)).fetchone()['count']
+    return jsonify({'practice': dict(practice) if practice else None,
+                    'due_count': due_count})
+
+
+@app.route('/api/forecast', methods=['GET'])
+def forecast_route():
+    """Return projected daily review load and expected retention for the next `days` days."""
+    days = request.args.get('days', 30, type=int)
+    conn = get_db_connection()
+    return jsonify(forecast(conn, days))
+
+
+@app.route('/api/rebalance', methods=['GET', 'POST'])
+def rebalance_route():
+    """Spread due dates to flatten review peaks.
+
+    GET previews the before/after daily histogram; POST applies it.
+    """
+    try:
+        tolerance = check_tolerance(request.args.get('tolerance', DEFAULT_TOLERANCE, type=float))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    days = min(max(request.args.get('days', 60, type=int), 1), 365)
+    if request.method == 'GET':
+        return jsonify(rebalance(get_db_connection(), tolerance, days=days))
+    # Planned and applied in one write on the writer, like every other write
+    return jsonify(run_write(
+        lambda conn: rebalance(conn, tolerance, dry_run=False, days=days)))
+
+
 @app.route('/rate-practice/<int:practice_id>/<int:stars>', methods=['GET'])
 def rate_practice(practice_id, stars):
     """Rate a practice item with 1-5 stars."""
     if 1 <= stars <= 5:
-        conn = get_db_connection()
-        conn.execute('UPDATE spaced_repetition SET stars = ? WHERE id = ?',
-                     (stars, practice_id))
-        conn.commit()
-        conn.close()
+        execute_write(RATE_PRACTICE_SQL, (stars, practice_id))
 
     return redirect('/practice')
 
@@ -401,117 +619,36 @@ def edit_practice(practice_id):
         question = request.form.get('question')
         answer = request.form.get('answer')
         if subject and topic and question and answer:
-            conn = get_db_connection()
-            conn.execute(
-                'UPDATE spaced_repetition SET subject = ?, topic = ?, question = ?, answer = ? WHERE id = ?',
-                (subject, topic, question, answer, practice_id)
-            )
-            conn.commit()
-            conn.close()
+            def update(conn):
+                old = conn.execute('SELECT answer FROM spaced_repetition WHERE id = ?',
+                                   (practice_id,)).fetchone()
+                dedup.update_practice(conn, practice_id, subject, topic, question, answer)
+                # Drop the stale rendering of the previous answer
+                if old and old['answer'] != answer:
+                    invalidate_markdown(conn, old['answer'])
+
+            run_write(update)
         return redirect('/practice')
 
     conn = get_db_connection()
     practice = conn.execute('SELECT * FROM spaced_repetition WHERE id = ?',
                             (practice_id,)).fetchone()
-    conn.close()
 
     if practice is None:
         return redirect('/practice')
 
-    return f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Edit Practice Item</title>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                max-width: 900px;
-                margin: 0 auto;
-                padding: 20px;
-            }}
-            input, textarea {{
-                width: 100%;
-                padding: 10px;
-                margin: 10px 0;
-                font-size: 14px;
-                box-sizing: border-box;
-            }}
-            button {{
-                padding: 10px 20px;
-                font-size: 16px;
-                cursor: pointer;
-                background-color: #4CAF50;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                margin-right: 10px;
-            }}
-            button:hover {{
-                background-color: #45a049;
-            }}
-            a {{
-                padding: 10px 20px;
-                font-size: 16px;
-                background-color: #999;
-                color: white;
-                text-decoration: none;
-                border-radius: 4px;
-            }}
-            a:hover {{
-                background-color: #777;
-            }}
-            h1 {{
-                color: #333;
-            }}
-            .form-group {{
-                margin-bottom: 15px;
-            }}
-            .form-group label {{
-                display: block;
-                font-weight: bold;
-                margin-bottom: 5px;
-            }}
-        </style>
-    </head>
-    <body>
-        <h1>Edit Practice Item</h1>
-        <form method="post">
-            <div class="form-group">
-                <label for="subject">Subject:</label>
-                <input type="text" name="subject" id="subject" value="{practice["subject"]}" required>
-            </div>
-            <div class="form-group">
-                <label for="topic">Topic:</label>
-                <input type="text" name="topic" id="topic" value="{practice["topic"]}" required>
-            </div>
-            <div class="form-group">
-                <label for="question">Question:</label>
-                <textarea name="question" id="question" required>{practice["question"]}</textarea>
-            </div>
-            <div class="form-group">
-                <label for="answer">Answer:</label>
-                <textarea name="answer" id="answer" required>{practice["answer"]}</textarea>
-            </div>
-            <button type="submit">Update Practice Item</button>
-            <a href="/practice">Cancel</a>
-        </form>
-    </body>
-    </html>
-    '''
+    return render_template('edit_practice.html', practice=practice)
 
 
 @app.route('/delete-practice/<int:practice_id>', methods=['GET'])
 def delete_practice(practice_id):
     """Delete a practice item."""
-    conn = get_db_connection()
-    conn.execute('DELETE FROM spaced_repetition WHERE id = ?', (practice_id,))
-    conn.commit()
-    conn.close()
+    execute_write('DELETE FROM spaced_repetition WHERE id = ?', (practice_id,))
     return redirect('/practice')
 
 
 @app.route('/practice', methods=['GET', 'POST'])
+@conditional('practices', 'facets', unless=lambda: request.args.get('filter') == 'due')
 def practice():
     """Display all spaced repetition practice items."""
     if request.method == 'POST':
@@ -520,19 +657,19 @@ def practice():
         question = request.form.get('question')
         answer = request.form.get('answer')
         if subject and topic and question and answer:
-            conn = get_db_connection()
-            conn.execute(
-                'INSERT INTO spaced_repetition (subject, topic, question, answer) VALUES (?, ?, ?, ?)',
-                (subject, topic, question, answer)
-            )
-            conn.commit()
-            conn.close()
+            policy = app.config['DUPLICATE_POLICY']
+            run_write(lambda conn: dedup.insert_practice(
+                conn, subject, topic, question, answer, policy=policy))
         return redirect('/practice')
 
     # Pagination settings
-    page = request.args.get('page', 1, type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
     items_per_page = 1
     offset = (page - 1) * items_per_page
+    # Keyset cursors carried in the page links
+    after = parse_cursor(request.args.get('after', '', type=str), int)
+    before = parse_cursor(request.args.get('before', '', type=str), int)
+    last = request.args.get('last', '', type=str) == '1'
 
     # Filter settings
     filter_subject = request.args.get('subject', '', type=str)
@@ -545,56 +682,42 @@ def practice():
 
     conn = get_db_connection()
 
+    # Apart from the "due" filter, which moves with the clock, the page only
+    # depends on the query string and the practice and subject/topic data
+    practices_version, facets_version = data_version(conn, 'practices', 'facets')
+    page_key = None
+    if filter_type != 'due':
+        page_key = ('practice_page', practices_version, facets_version, request.query_string)
+        html = get_fragment(page_key)
+        if html is not None:
+            return html
+
     # Build parameterized query based on filters (safer)
-    query = 'SELECT * FROM spaced_repetition'
     query_count = 'SELECT COUNT(*) as count FROM spaced_repetition'
-    conditions = []
-    params = []
-
-    if filter_subject:
-        conditions.append('subject = ?')
-        params.append(filter_subject)
-    if filter_topic:
-        conditions.append('topic = ?')
-        params.append(filter_topic)
-    if filter_stars:
-        # store as int if provided
-        try:
-            params.append(int(filter_stars))
-            conditions.append('stars = ?')
-        except ValueError:
-            pass
-
-    if filter_type == 'before' and filter_date:
-        conditions.append('date < ?')
-        params.append(filter_date)
-    elif filter_type == 'after' and filter_date:
-        conditions.append('date > ?')
-        params.append(filter_date)
-    elif filter_type == 'on' and filter_date:
-        conditions.append('date LIKE ?')
-        params.append(f'{filter_date}%')
-
-    # Full-text like search on question and answer
-    if filter_q:
-        conditions.append('(question LIKE ? OR answer LIKE ?)')
-        like_q = f'%{filter_q}%'
-        params.extend([like_q, like_q])
+    conditions, params = practice_conditions(conn, request.args)
 
     if conditions:
-        where_clause = ' WHERE ' + ' AND '.join(conditions)
-        query += where_clause
-        query_count += where_clause
+        query_count += ' WHERE ' + ' AND '.join(conditions)
 
     # Get total count of filtered practices
-    total_practices = conn.execute(query_count, params).fetchone()['count']
-
-    # Get all filtered practices
-    query += ' ORDER BY date ASC, stars ASC'
-    all_practices = conn.execute(query, params).fetchall()
+    total_practices = query_cache.fetchone(conn, query_count, params)['count']
 
-    # Add dummy data if table is empty and no filters/search are applied
-    if len(all_practices) == 0 and not filter_subject and not filter_topic and not filter_date and not filter_q:
+    # Calculate total pages
+    total_pages = (total_practices + items_per_page - 1) // items_per_page
+    if last:
+        page = max(total_pages, 1)
+
+    # Get only the requested page of filtered practices
+    page_size = items_per_page
+    if last and total_practices:
+        page_size = total_practices - (total_pages - 1) * items_per_page
+    practices = fetch_practice_page(conn, conditions, params, page_size,
+                                    after=after, before=before, offset=offset, last=last)
+
+    # Add dummy data if the table is empty: a filter matching nothing (due,
+    # stars, ...) in a deck that has cards must not seed it
+    if total_practices == 0 and not conn.execute(
+            'SELECT EXISTS (SELECT 1 FROM spaced_repetition)').fetchone()[0]:
         dummy_data = [
             ('Mathematics', 'Algebra', 'What is the solution to 2x + 5 = 13?',
              'x = 4', datetime.now().isoformat()),
@@ -607,404 +730,144 @@ def practice():
             ('Chemistry', 'Periodic Table', 'What is the chemical symbol for Gold?',
              'Au', datetime.now().isoformat()),
         ]
-        for subject, topic, question, answer, date in dummy_data:
-            conn.execute(
-                'INSERT INTO spaced_repetition (subject, topic, question, answer, date) VALUES (?, ?, ?, ?, ?)',
-                (subject, topic, question, answer, date)
-            )
-        conn.commit()
-        # re-run unfiltered query to get all practices (no params)
-        all_practices = conn.execute(
-            'SELECT * FROM spaced_repetition ORDER BY date ASC, stars ASC').fetchall()
-        total_practices = len(all_practices)
-
-    # Get paginated items
-    practices = all_practices[offset:offset + items_per_page]
-
-    # Calculate total pages
-    total_pages = (total_practices + items_per_page - 1) // items_per_page
+        policy = app.config['DUPLICATE_POLICY']
 
-    # Get unique subjects and topics for filter dropdowns
-    all_subjects = conn.execute(
-        'SELECT DISTINCT subject FROM spaced_repetition ORDER BY subject').fetchall()
-    all_topics = conn.execute(
-        'SELECT DISTINCT topic FROM spaced_repetition ORDER BY topic').fetchall()
+        def seed(write_conn):
+            # Concurrent first visits each seed; the duplicate policy keeps one copy
+            for row in dummy_data:
+                dedup.insert_practice(write_conn, *row, policy=policy)
 
-    conn.close()
+        run_write(seed)
+        # re-run unfiltered query to get the first page (no params)
+        total_practices = len(dummy_data)
+        total_pages = (total_practices + items_per_page - 1) // items_per_page
+        page = 1
+        practices = fetch_practice_page(conn, [], [], items_per_page)
 
     # Build a preserved query string for pagination links to keep filters/search
-    params_parts = []
+    params_parts = {}
     if filter_subject:
-        params_parts.append(f'subject={filter_subject}')
+        params_parts['subject'] = filter_subject
     if filter_topic:
-        params_parts.append(f'topic={filter_topic}')
+        params_parts['topic'] = filter_topic
     if filter_type and filter_type != 'all':
-        params_parts.append(f'filter={filter_type}')
+        params_parts['filter'] = filter_type
     if filter_date:
-        params_parts.append(f'date={filter_date}')
+        params_parts['date'] = filter_date
     if filter_stars:
-        params_parts.append(f'stars={filter_stars}')
+        params_parts['stars'] = filter_stars
     if filter_q:
-        params_parts.append(f'q={filter_q}')
-    params_query = '&'.join(params_parts)
-
-    navbar = '''
-        <nav style="background-color: #333; padding: 0; margin: 0; position: sticky; top: 0; z-index: 1000;">
-            <ul style="list-style: none; margin: 0; padding: 0; display: flex;">
-                <li style="margin: 0;"><a href="/" style="display: block; padding: 15px 20px; color: white; text-decoration: none; background-color: #333; transition: background-color 0.3s;">Home</a></li>
-                <li style="margin: 0;"><a href="/practice" style="display: block; padding: 15px 20px; color: white; text-decoration: none; background-color: #333; transition: background-color 0.3s;">Spaced Repetition</a></li>
-            </ul>
-        </nav>
-    '''
-
-    practices_html = ''
-    if practices:
-        for practice in practices:
-            formatted_date = format_date(practice["date"])
-            date_buttons = '<div style="display: flex; gap: 5px; flex-wrap: wrap;">'
-            for days in [1, 3, 7, 14, 30]:
-                date_buttons += f'<a href="/increment-practice-date/{practice["id"]}/{days}" style="padding: 3px 8px; background-color: #FF9800; color: white; text-decoration: none; border-radius: 3px; font-size: 12px;">+{days}d</a>'
-            date_buttons += '</div>'
-
-            # Convert answer to markdown
-            answer_html = markdown.markdown(practice["answer"])
-
-            # Star rating display
-            try:
-                stars = practice["stars"] if practice["stars"] else 0
-            except (IndexError, KeyError):
-                stars = 0
-            star_html = '⭐' * stars if stars > 0 else '✩ (0 stars)'
-
-            # Star rating buttons
-            star_buttons = '<div style="display: flex; gap: 3px; flex-wrap: wrap;">'
-            for star_count in range(1, 6):
-                star_buttons += f'<a href="/rate-practice/{practice["id"]}/{star_count}" style="padding: 3px 8px; background-color: #FFD700; color: black; text-decoration: none; border-radius: 3px; font-size: 12px; cursor: pointer;">{"⭐" * star_count}</a>'
-            star_buttons += '</div>'
-
-            practices_html += f'''
-            <div style="background-color: #f9f9f9; border: 1px solid #ddd; border-radius: 8px; padding: 20px; margin-bottom: 20px;">
-                <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 20px;">
-                    <button class="subject-topic-btn" id="subjectTopicBtn-{practice['id']}" onclick="toggleSubjectTopic('{practice['id']}')">Show Subject & Topic</button>
-                    <p><strong>Date:</strong> {formatted_date}</p>
-                </div>
-                
-                <div id="subjectTopic-{practice['id']}" class="subject-topic-hidden" style="margin-bottom: 20px;">
-                    <p><strong>Subject:</strong> {practice["subject"]}</p>
-                    <p><strong>Topic:</strong> {practice["topic"]}</p>
-                </div>
-                
-                <div style="margin-bottom: 20px;">
-                    <p><strong>Question:</strong></p>
-                    <p style="background-color: white; padding: 10px; border-radius: 4px; border-left: 4px solid #2196F3; white-space: pre-wrap; word-wrap: break-word;">{practice["question"]}</p>
-                </div>
-                
-                <div style="margin-bottom: 20px;">
-                    <p><strong>Answer:</strong></p>
-                    <button class="answer-btn" id="answerBtn-{practice['id']}" onclick="toggleAnswer('{practice['id']}')">Show Answer</button>
-                    <div id="answer-{practice['id']}" class="answer-hidden" style="background-color: white; padding: 10px; border-radius: 4px; border-left: 4px solid #4CAF50; white-space: pre-wrap; word-wrap: break-word;">{answer_html}</div>
-                </div>
-                
-                <div style="margin-bottom: 20px;">
-                    <button class="stars-btn" id="starsBtn-{practice['id']}" onclick="toggleStars('{practice['id']}')">Show Importance</button>
-                    <div id="stars-{practice['id']}" class="stars-hidden" style="margin-top: 10px;">
-                        <p><strong>Importance:</strong> {star_html}</p>
-                        <p><strong>Rate:</strong></p>
-                        {star_buttons}
-                    </div>
-                </div>
-                
-                <div style="margin-top: 20px;">
-                    <p><strong>Change Date:</strong></p>
-                    {date_buttons}
-                </div>
-                
-                <div style="margin-top: 20px; display: flex; gap: 10px;">
-                    <a href="/edit-practice/{practice['id']}" style="padding: 10px 20px; background-color: #2196F3; color: white; text-decoration: none; border-radius: 4px; cursor: pointer;">Edit</a>
-                    <a href="/delete-practice/{practice['id']}" style="padding: 10px 20px; background-color: #f44336; color: white; text-decoration: none; border-radius: 4px; cursor: pointer;" onclick="return confirm('Are you sure you want to delete this practice item?');">Delete</a>
-                </div>
-            </div>
-            '''
-    else:
-        practices_html = '<p>No practice items yet.</p>'
-
-    return f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Spaced Repetition Practice</title>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                max-width: 900px;
-                margin: 0 auto;
-                padding: 20px;
-            }}
-            nav ul li a:hover {{
-                background-color: #555 !important;
-            }}
-            h1 {{
-                color: #333;
-            }}
-            h2 {{
-                color: #333;
-                border-bottom: 2px solid #2196F3;
-                padding-bottom: 10px;
-            }}
-            form input, form textarea {{
-                padding: 10px;
-                margin: 5px 0;
-                font-size: 14px;
-                width: 100%;
-                box-sizing: border-box;
-            }}
-            form button {{
-                padding: 10px 20px;
-                font-size: 16px;
-                cursor: pointer;
-                background-color: #2196F3;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                margin-top: 10px;
-            }}
-            form button:hover {{
-                background-color: #0b7dda;
-            }}
-            form {{
-                background-color: #f9f9f9;
-                padding: 20px;
-                border-radius: 4px;
-                margin-bottom: 20px;
-            }}
-            .form-group {{
-                margin-bottom: 15px;
-            }}
-            .form-group label {{
-                display: block;
-                font-weight: bold;
-                margin-bottom: 5px;
-            }}
-            table {{
-                width: 100%;
-                border-collapse: collapse;
-                margin-top: 20px;
-            }}
-            table th, table td {{
-                border: 1px solid #ddd;
-                padding: 12px;
-                text-align: left;
-            }}
-            table th {{
-                background-color: #2196F3;
-                color: white;
-            }}
-            table tr:nth-child(even) {{
-                background-color: #f2f2f2;
-            }}
-            #addPracticeBtn {{
-                padding: 10px 20px;
-                font-size: 16px;
-                cursor: pointer;
-                background-color: #4CAF50;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                margin-top: 10px;
-                margin-bottom: 20px;
-            }}
-            #addPracticeBtn:hover {{
-                background-color: #45a049;
-            }}
-            #practiceForm {{
-                display: none;
-            }}
-            #practiceForm.show {{
-                display: block;
-            }}
-            .answer-hidden {{
-                display: none;
-            }}
-            .answer-btn {{
-                padding: 8px 16px;
-                font-size: 14px;
-                cursor: pointer;
-                background-color: #4CAF50;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                margin-bottom: 10px;
-            }}
-            .answer-btn:hover {{
-                background-color: #45a049;
-            }}
-            .subject-topic-hidden {{
-                display: none;
-            }}
-            .subject-topic-btn {{
-                padding: 8px 16px;
-                font-size: 14px;
-                cursor: pointer;
-                background-color: #2196F3;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                margin-bottom: 10px;
-            }}
-            .subject-topic-btn:hover {{
-                background-color: #0b7dda;
-            }}
-            .stars-hidden {{
-                display: none;
-            }}
-            .stars-btn {{
-                padding: 8px 16px;
-                font-size: 14px;
-                cursor: pointer;
-                background-color: #FF9800;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                margin-bottom: 10px;
-            }}
-            .stars-btn:hover {{
-                background-color: #e68900;
-            }}
-        </style>
-        <script>
-            function toggleStars(practiceId) {{
-                const starsDiv = document.getElementById('stars-' + practiceId);
-                const btn = document.getElementById('starsBtn-' + practiceId);
-                starsDiv.classList.toggle('stars-hidden');
-                btn.textContent = starsDiv.classList.contains('stars-hidden') ? 'Show Importance' : 'Hide Importance';
-            }}
-            
-            function toggleSubjectTopic(practiceId) {{
-                const subjectTopicDiv = document.getElementById('subjectTopic-' + practiceId);
-                const btn = document.getElementById('subjectTopicBtn-' + practiceId);
-                subjectTopicDiv.classList.toggle('subject-topic-hidden');
-                btn.textContent = subjectTopicDiv.classList.contains('subject-topic-hidden') ? 'Show Subject & Topic' : 'Hide Subject & Topic';
-            }}
-            
-            function toggleAnswer(practiceId) {{
-                const answerDiv = document.getElementById('answer-' + practiceId);
-                const btn = document.getElementById('answerBtn-' + practiceId);
-                answerDiv.classList.toggle('answer-hidden');
-                btn.textContent = answerDiv.classList.contains('answer-hidden') ? 'Show Answer' : 'Hide Answer';
-            }}
-            
-            function togglePracticeForm() {{
-                const form = document.getElementById('practiceForm');
-                const btn = document.getElementById('addPracticeBtn');
-                form.classList.toggle('show');
-                btn.textContent = form.classList.contains('show') ? 'Hide Form' : 'Add New Practice Item';
-            }}
-        </script>
-    </head>
-    <body>
-        {navbar}
-        <h1>Spaced Repetition Practice</h1>
-        <p>Practice and reinforce your learning with spaced repetition.</p>
-        
-        <h2>Filter Questions</h2>
-        <form method="get" style="margin-bottom: 20px; padding: 15px; background-color: #f9f9f9; border-radius: 4px;">
-            <label for="subject" style="margin-right: 10px; font-weight: bold;">Subject:</label>
-            <select name="subject" id="subject" style="padding: 8px; margin-right: 20px;">
-                <option value="">All Subjects</option>
-                {'\n'.join([f'<option value="{subject["subject"]}" {"selected" if filter_subject == subject["subject"] else ""}>{subject["subject"]}</option>' for subject in all_subjects])}
-            </select>
-            
-            <label for="topic" style="margin-right: 10px; font-weight: bold;">Topic:</label>
-            <select name="topic" id="topic" style="padding: 8px; margin-right: 20px;">
-                <option value="">All Topics</option>
-                {'\n'.join([f'<option value="{topic["topic"]}" {"selected" if filter_topic == topic["topic"] else ""}>{topic["topic"]}</option>' for topic in all_topics])}
-            </select>
-            
-            <label for="filter" style="margin-right: 10px; font-weight: bold;">Filter Type:</label>
-            <select name="filter" id="filter" style="padding: 8px; margin-right: 20px;">
-                <option value="all" {"selected" if filter_type == "all" else ""}>All Dates</option>
-                <option value="before" {"selected" if filter_type == "before" else ""}>Before Date</option>
-                <option value="after" {"selected" if filter_type == "after" else ""}>After Date</option>
-                <option value="on" {"selected" if filter_type == "on" else ""}>On Date</option>
-            </select>
-            
-            <label for="date" style="margin-right: 10px; font-weight: bold;">Date:</label>
-            <input type="date" name="date" id="date" value="{filter_date}" style="padding: 8px; margin-right: 20px;">
-            
-            <label for="stars" style="margin-right: 10px; font-weight: bold;">Stars:</label>
-            <select name="stars" id="stars" style="padding: 8px; margin-right: 20px;">
-                <option value="">All Star Ratings</option>
-                <option value="0" {"selected" if filter_stars == "0" else ""}>No Stars (0)</option>
-                <option value="1" {"selected" if filter_stars == "1" else ""}>⭐ (1)</option>
-                <option value="2" {"selected" if filter_stars == "2" else ""}>⭐⭐ (2)</option>
-                <option value="3" {"selected" if filter_stars == "3" else ""}>⭐⭐⭐ (3)</option>
-                <option value="4" {"selected" if filter_stars == "4" else ""}>⭐⭐⭐⭐ (4)</option>
-                <option value="5" {"selected" if filter_stars == "5" else ""}>⭐⭐⭐⭐⭐ (5)</option>
-            </select>
-            
-            <label for="q" style="margin-right: 10px; font-weight: bold;">Search:</label>
-            <input type="text" name="q" id="q" value="{filter_q}" placeholder="Search question or answer" style="padding: 8px; margin-right: 20px;">
-            <button type="submit" style="padding: 8px 16px; background-color: #2196F3; color: white; border: none; border-radius: 4px; cursor: pointer;">Filter</button>
-            <a href="/practice" style="padding: 8px 16px; background-color: #999; color: white; text-decoration: none; border-radius: 4px; display: inline-block; margin-left: 10px;">Clear Filter</a>
-        </form>
-        
-        <button id="addPracticeBtn" onclick="togglePracticeForm()">Add New Practice Item</button>
-        
-        <form id="practiceForm" method="post">
-            <div class="form-group">
-                <label for="subject">Subject:</label>
-                <input type="text" name="subject" id="subject" placeholder="e.g., Mathematics, Biology" required>
-            </div>
-            <div class="form-group">
-                <label for="topic">Topic:</label>
-                <input type="text" name="topic" id="topic" placeholder="e.g., Algebra, Cells" required>
-            </div>
-            <div class="form-group">
-                <label for="question">Question:</label>
-                <textarea name="question" id="question" placeholder="Enter your question here..." required></textarea>
-            </div>
-            <div class="form-group">
-                <label for="answer">Answer:</label>
-                <textarea name="answer" id="answer" placeholder="Enter the answer here..." required></textarea>
-            </div>
-            <button type="submit">Add Practice Item</button>
-        </form>
-        
-        <h2>Practice Items:</h2>
-        {practices_html}
-        
-        <!-- Pagination Controls -->
-        <div style="margin-top: 20px; text-align: center;">
-            <p>Page {page} of {total_pages} (Total: {total_practices} items)</p>
-            <div>
-                {f'<a href="/practice?page=1{("&" + params_query) if params_query else ""}" style="margin: 0 5px;">First</a>' if page > 1 else ''}
-                {f'<a href="/practice?page={page-1}{("&" + params_query) if params_query else ""}" style="margin: 0 5px;">Previous</a>' if page > 1 else ''}
-                <span style="margin: 0 10px;">Page {page}</span>
-                {f'<a href="/practice?page={page+1}{("&" + params_query) if params_query else ""}" style="margin: 0 5px;">Next</a>' if page < total_pages else ''}
-                {f'<a href="/practice?page={total_pages}{("&" + params_query) if params_query else ""}" style="margin: 0 5px;">Last</a>' if page < total_pages else ''}
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
+        params_parts['q'] = filter_q
 
+    def page_link(**link_params):
+        return '/practice?' + urlencode({**link_params, **params_parts})
 
-if __name__ == '__main__':
-    app.run(debug=True)
+    # Next/Previous seek from the cards on this page instead of counting rows
+    first_link = page_link(page=1)
+    last_link = page_link(page=total_pages, last=1)
+    if practices:
+        next_link = page_link(page=page + 1, after=encode_cursor(practices[-1]))
+        prev_link = page_link(page=page - 1, before=encode_cursor(practices[0]))
+    else:
+        next_link = page_link(page=page + 1)
+        prev_link = page_link(page=page - 1)
+
+    # The filter form (with its subject/topic dropdowns) is cached until a
+    # subject or topic is added, removed or its card count changes
+    filters = dict(filter_subject=filter_subject, filter_topic=filter_topic,
+                   filter_type=filter_type, filter_date=filter_date,
+                   filter_stars=filter_stars, filter_q=filter_q)
+    filter_form = cached_fragment(
+        ('practice_filters', facets_version, *filters.values()),
+        lambda: render_template(
+            '_practice_filters.html', **filters,
+            subjects=query_cache.fetchall(
+                conn, 'SELECT name, card_count FROM subjects ORDER BY name'),
+            topics=query_cache.fetchall(
+                conn, 'SELECT name, card_count FROM topics ORDER BY name')))
+
+    # A card is keyed on its row values, so any edit, review or date change
+    # renders it afresh; answers are converted to markdown only on a miss
+    cards = [render_practice_card(conn, practice) for practice in practices]
+
+    # The card view fetches the cards after this page from /api/cards
+    html = render_template('practice.html', cards=cards, filter_form=filter_form,
+                           page=page, total_pages=total_pages, total_practices=total_practices,
+                           first_link=first_link, prev_link=prev_link,
+                           next_link=next_link, last_link=last_link,
+                           cards_api='/api/cards?' + urlencode(params_parts),
+                           next_cursor=encode_cursor(practices[-1]) if practices else '',
+                           prefetch=app.config['CARD_PREFETCH'])
+    if page_key is not None:
+        put_fragment(page_key, html)
+    return html
+
+
+@app.route('/api/cards', methods=['GET'])
+@conditional('practices', unless=lambda: request.args.get('filter') == 'due')
+def cards_api():
+    """Return the next `limit` cards of a /practice filter as JSON.
+
+    Takes the /practice filter arguments, plus `after` (a card cursor) and
+    `limit` (default CARD_PREFETCH). Each card has its question, answer
+    HTML, scheduling metadata, its rendered card view and its cursor;
+    `next` is the cursor to continue from, or null after the last card.
+    Without `after`, `total` is the number of matching cards.
+    """
+    limit = min(max(request.args.get('limit', app.config['CARD_PREFETCH'], type=int), 1),
+                MAX_CARD_BATCH)
+    after = parse_cursor(request.args.get('after', '', type=str), int)
+    conn = get_db_connection()
+    conditions, params = practice_conditions(conn, request.args)
+
+    # One extra row tells whether there is a next batch
+    rows = fetch_practice_page(conn, conditions, params, limit + 1, after=after)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    result = {
+        'cards': [{
+            'id': row['id'],
+            'subject': row['subject'],
+            'topic': row['topic'],
+            'question': row['question'],
+            'answer_html': render_markdown(conn, row['answer']),
+            'stars': row['stars'],
+            'reps': row['reps'],
+            'interval_days': row['interval_days'],
+            'due': row['due'],
+            'due_text': format_timestamp(row['due']),
+            'cursor': encode_cursor(row),
+            'html': render_practice_card(conn, row),
+        } for row in rows],
+        'next': encode_cursor(rows[-1]) if more else None,
+    }
+    if after is None:
+        query = 'SELECT COUNT(*) AS count FROM spaced_repetition'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        result['total'] = query_cache.fetchone(conn, query, params)['count']
+    return jsonify(result)
 
 
 @app.route('/search-practice', methods=['GET'])
 def search_practice():
-    """Return JSON list of practices matching question or answer text."""
+    """Return JSON list of practices matching the search text, best match first."""
+    q = request.args.get('q', '', type=str)
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    conn = get_db_connection()
+    results = [dict(r) for r in search_practices(conn, q, limit)]
+    return jsonify(results)
+
+
+@app.route('/search-notes', methods=['GET'])
+def search_notes_route():
+    """Return JSON list of notes matching the search text, best match first."""
     q = request.args.get('q', '', type=str)
+    limit = min(request.args.get('limit', 50, type=int), 500)
     conn = get_db_connection()
-    results = []
-    if q:
-        like_q = f'%{q}%'
-        rows = conn.execute(
-            'SELECT * FROM spaced_repetition WHERE question LIKE ? OR answer LIKE ? ORDER BY date ASC, stars ASC',
-            (like_q, like_q)
-        ).fetchall()
-        results = [dict(r) for r in rows]
-    conn.close()
+    results = [dict(r) for r in search_notes(conn, q, limit)]
     return jsonify(results)
+
+
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -1,9 +1,33 @@
 import sqlite3
 import json
 import os
+import argparse
+import gzip
+import hashlib
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from migrations import DERIVED_REBUILDS, migrate
 
 DATABASE_PATH = 'app.db'
 
+# Backup name -> table, in the order the streaming exporter writes them
+BACKUP_TABLES = {
+    'items': 'items',
+    'notes': 'notes',
+    'practices': 'spaced_repetition',
+}
+# Rows fetched from SQLite per round trip while streaming
+CHUNK_SIZE = 1000
+MANIFEST_NAME = 'manifest.json'
+BACKUP_FORMAT = 'jsonl-v1'
+# Rows per executemany() batch when restoring
+RESTORE_CHUNK_SIZE = 5000
+# Print restore progress every this many rows
+PROGRESS_EVERY = 100000
+
 
 def backup_all_data():
     """Backup all data from the database."""
@@ -107,7 +131,362 @@ def restore_all_data():
     print("Database restore complete")
 
 
-if __name__ == '__main__':
+def snapshot_database(dest_path, source_path=None, pages_per_step=1024):
+    """Copy a consistent snapshot of the live database with the sqlite3 backup API.
+
+    The copy is made in steps of `pages_per_step` pages, so the app can keep
+    serving requests while it runs; no need to stop it first.
+    """
+    source = sqlite3.connect(source_path or DATABASE_PATH)
+    dest = sqlite3.connect(dest_path)
+    try:
+        source.backup(dest, pages=pages_per_step)
+    finally:
+        dest.close()
+        source.close()
+    print(f"Snapshot saved to {dest_path}")
+
+
+def _open_backup_file(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='\n')
+    return open(path, 'w', encoding='utf-8', newline='\n')
+
+
+def _write_jsonl(cursor, path, compress):
+    """Stream a cursor's rows to newline-delimited JSON; returns (rows, sha256, columns)."""
+    columns = [column[0] for column in cursor.description]
+    checksum = hashlib.sha256()
+    count = 0
+    with _open_backup_file(path, compress) as f:
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                line = json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+                checksum.update(line.encode('utf-8'))
+                f.write(line)
+            count += len(rows)
+    return count, checksum.hexdigest(), columns
+
+
+def _export_table(conn, name, table, backup_dir, compress, since_seq=None, until_seq=None):
+    """Export one table (or, with since_seq, its changes) and return its manifest entry."""
+    suffix = '.jsonl' + ('.gz' if compress else '')
+    if since_seq is None:
+        cursor = conn.execute(f'SELECT * FROM {table} ORDER BY id')
+    else:
+        cursor = conn.execute(
+            f'''SELECT {table}.* FROM changelog
+                JOIN {table} ON {table}.id = changelog.row_id
+                WHERE changelog.table_name = ? AND changelog.op = 'upsert'
+                AND changelog.seq > ? AND changelog.seq <= ?
+                ORDER BY {table}.id''',
+            (table, since_seq, until_seq)
+        )
+    rows, checksum, columns = _write_jsonl(
+        cursor, os.path.join(backup_dir, name + suffix), compress)
+    entry = {
+        'table': table,
+        'file': name + suffix,
+        'rows': rows,
+        'sha256': checksum,
+        'columns': columns,
+    }
+
+    if since_seq is not None:
+        cursor = conn.execute(
+            '''SELECT row_id AS id FROM changelog
+               WHERE table_name = ? AND op = 'delete' AND seq > ? AND seq <= ?
+               ORDER BY row_id''',
+            (table, since_seq, until_seq)
+        )
+        deleted, checksum, _ = _write_jsonl(
+            cursor, os.path.join(backup_dir, f'{name}.deleted' + suffix), compress)
+        entry['deleted'] = {
+            'file': f'{name}.deleted' + suffix,
+            'rows': deleted,
+            'sha256': checksum,
+        }
+    return entry
+
+
+def export_backup(backup_dir, compress=False, snapshot=False, since=None):
+    """Stream all tables to `backup_dir` as one .jsonl(.gz) file per table.
+
+    Memory use is bounded by CHUNK_SIZE rows regardless of table size. All
+    tables are read in one read transaction, so they are consistent with each
+    other even while the app is writing. With `snapshot`, the export reads
+    from a temporary copy made with the backup API instead, so a long export
+    does not hold a read transaction open on the live database.
+
+    With `since` (the directory of the previous full or incremental backup)
+    only the rows changed or deleted after that backup's changelog high-water
+    mark are exported, so the backup is proportional to the activity since.
+
+    manifest.json, written last, records the row count and the sha256 of the
+    uncompressed content of every file; a backup directory without it is incomplete.
+    """
+    if not os.path.exists(DATABASE_PATH):
+        print("Database file not found.")
+        return
+
+    parent = read_manifest(since) if since else None
+    if parent and 'until_seq' not in parent:
+        raise BackupError(f"{since} predates change tracking; take a full backup first")
+
+    os.makedirs(backup_dir, exist_ok=True)
+    snapshot_path = None
+    source_path = DATABASE_PATH
+    if snapshot:
+        fd, snapshot_path = tempfile.mkstemp(suffix='.db', dir=backup_dir)
+        os.close(fd)
+        snapshot_database(snapshot_path)
+        source_path = snapshot_path
+
+    conn = sqlite3.connect(source_path)
+    manifest = {
+        'format': BACKUP_FORMAT,
+        'backup_id': uuid.uuid4().hex,
+        'kind': 'delta' if parent else 'full',
+        'created_at': datetime.now().isoformat(),
+        'schema_version': conn.execute('PRAGMA user_version').fetchone()[0],
+        'compressed': compress,
+        'tables': {},
+    }
+    try:
+        conn.execute('BEGIN')
+        until_seq = conn.execute(
+            'SELECT COALESCE(MAX(seq), 0) FROM changelog').fetchone()[0]
+        since_seq = parent['until_seq'] if parent else None
+        manifest['until_seq'] = until_seq
+        if parent:
+            manifest['parent_id'] = parent['backup_id']
+            manifest['since_seq'] = since_seq
+
+        for name, table in BACKUP_TABLES.items():
+            try:
+                entry = _export_table(conn, name, table, backup_dir, compress,
+                                      since_seq=since_seq, until_seq=until_seq)
+            except sqlite3.OperationalError as e:
+                print(f"Error backing up {name}: {e}")
+                continue
+            manifest['tables'][name] = entry
+            if parent:
+                print(f"Backed up {entry['rows']} changed and "
+                      f"{entry['deleted']['rows']} deleted {name}")
+            else:
+                print(f"Backed up {entry['rows']} {name}")
+        conn.rollback()
+    finally:
+        conn.close()
+        if snapshot_path:
+            os.remove(snapshot_path)
+
+    with open(os.path.join(backup_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"Backup saved to {backup_dir}")
+    return manifest
+
+
+class BackupError(Exception):
+    """Raised when a backup directory is incomplete or fails verification."""
+
+
+def read_manifest(backup_dir):
+    """Load and sanity-check a backup directory's manifest."""
+    path = os.path.join(backup_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        raise BackupError(f"{path} not found; the backup is incomplete")
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != BACKUP_FORMAT:
+        raise BackupError(f"Unsupported backup format {manifest.get('format')!r}")
+    return manifest
+
+
+def read_backup_chain(backup_dir, deltas=()):
+    """Load the manifests of a full backup and its deltas, checking they chain up."""
+    chain = [read_manifest(backup_dir)]
+    if chain[0].get('kind', 'full') != 'full':
+        raise BackupError(f"{backup_dir} is an incremental backup, not a full one")
+    for delta_dir in deltas:
+        manifest = read_manifest(delta_dir)
+        previous = chain[-1]
+        if (manifest.get('kind') != 'delta'
+                or manifest.get('parent_id') != previous.get('backup_id')
+                or manifest.get('since_seq') != previous.get('until_seq')):
+            raise BackupError(f"{delta_dir} does not follow the previous backup in the chain")
+        chain.append(manifest)
+    return chain
+
+
+def _open_backup_for_read(path, compressed):
+    if compressed:
+        return gzip.open(path, 'rt', encoding='utf-8', newline='\n')
+    return open(path, 'r', encoding='utf-8', newline='\n')
+
+
+def _drop_indexes_and_triggers(conn, tables):
+    """Drop secondary indexes and triggers on `tables`.
+
+    Returns (index_sql, trigger_sql) for recreating them after the load.
+    """
+    placeholders = ', '.join('?' * len(tables))
+    objects = conn.execute(
+        f"""SELECT type, name, sql FROM sqlite_master
+            WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+            AND tbl_name IN ({placeholders})
+            ORDER BY type = 'trigger', name""",
+        list(tables)
+    ).fetchall()
+    for object_type, name, _ in objects:
+        conn.execute(f'DROP {object_type.upper()} {name}')
+    return ([sql for object_type, _, sql in objects if object_type == 'index'],
+            [sql for object_type, _, sql in objects if object_type == 'trigger'])
+
+
+def _load_file(conn, backup_dir, file_entry, compressed, sql, columns, chunk_size, label):
+    """Stream one backup file through `sql` with chunked executemany()."""
+    checksum = hashlib.sha256()
+    count = 0
+    batch = []
+    with _open_backup_for_read(os.path.join(backup_dir, file_entry['file']), compressed) as f:
+        for line in f:
+            checksum.update(line.encode('utf-8'))
+            row = json.loads(line)
+            batch.append(tuple(row.get(c) for c in columns))
+            if len(batch) >= chunk_size:
+                conn.executemany(sql, batch)
+                count += len(batch)
+                batch = []
+                if count % PROGRESS_EVERY < chunk_size:
+                    print(f"  {label}: {count}/{file_entry['rows']} rows")
+        if batch:
+            conn.executemany(sql, batch)
+            count += len(batch)
+
+    if count != file_entry['rows'] or checksum.hexdigest() != file_entry['sha256']:
+        raise BackupError(f"{file_entry['file']} does not match the manifest "
+                          f"({count} rows read, {file_entry['rows']} expected)")
+    return count
+
+
+def _load_table(conn, backup_dir, entry, compressed, chunk_size):
+    """Load one table entry of a full or incremental backup; returns rows applied."""
+    table = entry['table']
+    table_columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    # Columns dropped or added since the backup was taken are skipped/defaulted
+    columns = [c for c in entry['columns'] if c in table_columns]
+    verb = 'INSERT OR REPLACE' if 'deleted' in entry else 'INSERT'
+    insert = (f'{verb} INTO {table} ({", ".join(columns)}) '
+              f'VALUES ({", ".join("?" * len(columns))})')
+
+    count = 0
+    if 'deleted' in entry:
+        count += _load_file(conn, backup_dir, entry['deleted'], compressed,
+                            f'DELETE FROM {table} WHERE id = ?', ['id'],
+                            chunk_size, f'{table} deletes')
+    count += _load_file(conn, backup_dir, entry, compressed, insert, columns,
+                        chunk_size, table)
+    return count
+
+
+def restore_backup(backup_dir, db_path=None, chunk_size=RESTORE_CHUNK_SIZE, deltas=()):
+    """Restore a streaming backup into `db_path` (default: app.db), fast and safely.
+
+    The backup is loaded into a temporary database next to the target:
+    the schema is created by the migrations, secondary indexes and triggers
+    are dropped, every table is streamed in with chunked executemany() in a
+    single transaction with journaling and syncing off, and then the indexes,
+    triggers and derived data (FTS, subject/topic counts) are rebuilt in
+    one pass each. `deltas` are incremental backup directories replayed in
+    order on top of the full backup, inside the same transaction.
+
+    The finished database then replaces the target in one step: with
+    os.replace() if the target does not exist, otherwise through the sqlite3
+    backup API, which swaps the content under a write lock so a running app
+    (and its WAL) sees either the old or the new data, never a missing file.
+    """
+    db_path = os.path.abspath(db_path or DATABASE_PATH)
+    chain = read_backup_chain(backup_dir, deltas)
+    directories = [backup_dir] + list(deltas)
+
+    fd, temp_path = tempfile.mkstemp(suffix='.restore.db',
+                                     dir=os.path.dirname(db_path))
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(temp_path, isolation_level=None)
+        migrate(conn)
+        # The temp file is thrown away on failure, so durability is not needed
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -200000')
+
+        tables = {entry['table'] for manifest in chain
+                  for entry in manifest['tables'].values()}
+        index_sql, trigger_sql = _drop_indexes_and_triggers(conn, sorted(tables))
+
+        conn.execute('BEGIN')
+        for directory, manifest in zip(directories, chain):
+            if manifest.get('kind') == 'delta':
+                print(f"Applying incremental backup {directory}")
+            for name, entry in manifest['tables'].items():
+                started = time.perf_counter()
+                rows = _load_table(conn, directory, entry,
+                                   manifest.get('compressed', False), chunk_size)
+                elapsed = time.perf_counter() - started
+                rate = rows / elapsed if elapsed > 0 else 0
+                print(f"Restored {rows} {name} in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
+        # Continue the changelog sequence after the restored high-water mark,
+        # so incremental backups can keep chaining on the restored chain
+        until_seq = chain[-1].get('until_seq', 0)
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = 'changelog'")
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('changelog', ?)",
+                     (until_seq,))
+        conn.execute('COMMIT')
+
+        started = time.perf_counter()
+        conn.execute('BEGIN')
+        # Derived data first, so the indexes are built once and no trigger
+        # fires for the rebuild's own updates
+        for sql in DERIVED_REBUILDS + index_sql + trigger_sql:
+            conn.execute(sql)
+        conn.execute('COMMIT')
+        print(f"Rebuilt indexes, triggers and search data in "
+              f"{time.perf_counter() - started:.2f}s")
+
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.close()
+
+        if os.path.exists(db_path):
+            source = sqlite3.connect(temp_path)
+            dest = sqlite3.connect(db_path, timeout=30)
+            try:
+                source.backup(dest)
+            finally:
+                dest.close()
+                source.close()
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, db_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    print(f"Database restore complete: {db_path}")
+
+
+def default_backup_dir():
+    """Return a fresh timestamped directory under backups/."""
+    return os.path.join('backups', datetime.now().strftime('%Y%m%d-%H%M%S'))
+
+
+def legacy_backup_and_delete():
     print("Starting backup...")
     backup_all_data()
 
@@ -118,3 +497,51 @@ if __name__ == '__main__':
 
     print("\nRun your Flask app to recreate the database with new tables...")
     print("Then run: python restore_practices.py")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Back up the spaced repetition database. With no command, '
+                    'runs the legacy full JSON backup and deletes app.db.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    export_parser = subparsers.add_parser(
+        'export', help='stream every table to newline-delimited JSON')
+    export_parser.add_argument('--out', default=None,
+                               help='backup directory (default: backups/<timestamp>)')
+    export_parser.add_argument('--gzip', action='store_true',
+                               help='gzip-compress the table files')
+    export_parser.add_argument('--snapshot', action='store_true',
+                               help='export from a backup-API snapshot of the live database')
+    export_parser.add_argument('--since', default=None, metavar='BACKUP_DIR',
+                               help='incremental: only rows changed since this backup')
+
+    snapshot_parser = subparsers.add_parser(
+        'snapshot', help='copy the live database with the sqlite3 backup API')
+    snapshot_parser.add_argument('dest', help='path of the snapshot database file')
+
+    restore_parser = subparsers.add_parser(
+        'restore', help='bulk-restore a backup made with export')
+    restore_parser.add_argument('backup_dir', help='full backup directory')
+    restore_parser.add_argument('deltas', nargs='*',
+                                help='incremental backup directories to replay, oldest first')
+    restore_parser.add_argument('--db', default=None,
+                                help=f'database to restore into (default: {DATABASE_PATH})')
+    restore_parser.add_argument('--chunk-size', type=int, default=RESTORE_CHUNK_SIZE,
+                                help='rows per executemany() batch')
+
+    args = parser.parse_args(argv)
+    if args.command == 'export':
+        export_backup(args.out or default_backup_dir(),
+                      compress=args.gzip, snapshot=args.snapshot, since=args.since)
+    elif args.command == 'snapshot':
+        snapshot_database(args.dest)
+    elif args.command == 'restore':
+        restore_backup(args.backup_dir, db_path=args.db, chunk_size=args.chunk_size,
+                       deltas=args.deltas)
+    else:
+        legacy_backup_and_delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,594 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from migrations import DERIVED_REBUILDS, migrate
+
+# Cards (and as many notes) in each synthetic deck
+SCALES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+DEFAULT_SCALE = '10k'
+DEFAULT_SEED = 1
+# Timed requests per route and mode
+DEFAULT_REPEAT = 20
+# A metric regresses when it is this much worse than the baseline...
+DEFAULT_THRESHOLD = 0.1
+# ...and worse by more than this, so sub-noise timings never fail a run
+NOISE_FLOOR = {'ms': 0.25, 's': 0.05, 'KB': 1, 'MB': 0.5, 'rows/s': 0}
+RESULTS_FORMAT = 'bench-v1'
+# Rows per executemany() batch while generating
+GENERATE_CHUNK_SIZE = 5000
+SECONDS_PER_DAY = 86400
+
+# Curated subjects and their topics; most cards live in the first few
+SUBJECTS = {
+    'Coding': ['Python', 'SQL', 'Algorithms', 'Data Structures', 'Git', 'Testing',
+               'Concurrency', 'Networking'],
+    'Mathematics': ['Algebra', 'Calculus', 'Probability', 'Linear Algebra', 'Statistics'],
+    'System Design': ['Caching', 'Databases', 'Queues', 'Load Balancing', 'Consistency'],
+    'Science': ['Physics', 'Chemistry', 'Astronomy', 'Geology'],
+    'Biology': ['Cells', 'Genetics', 'Evolution', 'Anatomy'],
+    'Languages': ['Spanish Vocabulary', 'Spanish Grammar', 'French Vocabulary', 'Japanese Kana'],
+    'History': ['World War II', 'Ancient Rome', 'Cold War', 'Renaissance'],
+    'Chemistry': ['Organic', 'Periodic Table', 'Reactions'],
+    'Geography': ['Capitals', 'Rivers', 'Mountains'],
+    'Music': ['Theory', 'Composers'],
+}
+# Share of cards in user-created "Course NNN" subjects with numbered modules
+LONG_TAIL_SHARE = 0.1
+LONG_TAIL_SUBJECTS = 200
+LONG_TAIL_TOPICS = 12
+
+WORDS = '''
+    index query cache latency throughput memory page block tree hash heap stack
+    queue thread lock process kernel socket packet router schema table column
+    row join transaction commit rollback journal replica shard partition leader
+    follower quorum vector matrix derivative integral limit series prime graph
+    node edge cycle path weight sort search binary linear constant logarithmic
+    energy force mass velocity orbit atom electron proton molecule bond enzyme
+    protein membrane gene allele species fossil empire treaty revolution dynasty
+    river delta glacier plateau verb noun tense article chord scale rhythm tempo
+'''.split()
+QUESTION_TEMPLATES = [
+    'What is the {0} of a {1}?',
+    'Explain how {0} affects {1}.',
+    'Why does a {0} need a {1}?',
+    'Define {0}.',
+    'What is the difference between {0} and {1}?',
+    'How would you reduce {0} {1}?',
+    'When should you prefer a {0} over a {1}?',
+]
+# Kinds of markdown answer and how often each occurs
+ANSWER_KINDS = {
+    'phrase': 0.40,
+    'sentence': 0.15,
+    'emphasis': 0.12,
+    'bullets': 0.14,
+    'numbered': 0.07,
+    'code': 0.07,
+    'sections': 0.05,
+}
+STAR_WEIGHTS = [0.5, 0.1, 0.1, 0.12, 0.1, 0.08]
+# Share of cards that have been reviewed and carry scheduler state
+REVIEWED_SHARE = 0.65
+
+PRACTICE_COLUMNS = ['id', 'subject', 'topic', 'question', 'answer', 'date', 'stars',
+                    'ease', 'stability', 'difficulty', 'interval_days', 'reps',
+                    'lapses', 'last_review', 'due']
+NOTE_COLUMNS = ['id', 'text', 'date', 'stars']
+
+# (name, url) of each timed route; {placeholders} come from deck_params()
+ROUTES = [
+    ('home', '/'),
+    ('home_last_page', '/?page={notes_last_page}'),
+    ('home_search', '/?q={word}'),
+    ('home_before', '/?filter=before&date={mid_date}&sort=desc'),
+    ('practice', '/practice'),
+    ('practice_subject', '/practice?subject={subject}'),
+    ('practice_topic', '/practice?subject={subject}&topic={topic}'),
+    ('practice_due', '/practice?filter=due'),
+    ('practice_search', '/practice?q={word}'),
+    ('practice_page_50', '/practice?page=50'),
+    ('edit_note', '/edit/{note_id}'),
+    ('edit_practice', '/edit-practice/{card_id}'),
+    ('next_due', '/next-due'),
+    ('search_practice', '/search-practice?q={word}'),
+    ('search_notes', '/search-notes?q={word}'),
+    ('forecast', '/api/forecast?days=30'),
+    ('rebalance_preview', '/api/rebalance'),
+]
+
+
+class BenchmarkError(Exception):
+    """Raised when a benchmarked route fails or results cannot be compared."""
+
+
+def _zipf_weights(count, exponent=1.0):
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+def _words(rng, low, high):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+def _sentence(rng, low=4, high=12):
+    text = _words(rng, low, high)
+    return text[0].upper() + text[1:] + '.'
+
+
+def _question(rng):
+    return rng.choice(QUESTION_TEMPLATES).format(*rng.sample(WORDS, 2))
+
+
+def _answer(rng, kind):
+    if kind == 'phrase':
+        return _words(rng, 1, 4)
+    if kind == 'sentence':
+        return _sentence(rng)
+    if kind == 'emphasis':
+        first, second = rng.sample(WORDS, 2)
+        return f'{_sentence(rng, 3, 6)} The **{first}** sets the `{second}` bound.'
+    if kind == 'bullets':
+        return '\n'.join(f'- {_words(rng, 2, 6)}' for _ in range(rng.randint(2, 6)))
+    if kind == 'numbered':
+        return '\n'.join(f'{n}. {_sentence(rng, 3, 8)}' for n in range(1, rng.randint(3, 7)))
+    if kind == 'code':
+        lines = [f'    {a} = {b}({c})' for a, b, c in
+                 (rng.sample(WORDS, 3) for _ in range(rng.randint(2, 6)))]
+        return f'{_sentence(rng, 3, 8)}\n\n' + '\n'.join(lines)
+    # sections
+    parts = []
+    for _ in range(rng.randint(2, 3)):
+        parts.append(f'## {_words(rng, 1, 3).title()}\n\n'
+                     f'{" ".join(_sentence(rng) for _ in range(rng.randint(1, 3)))}')
+    return '\n\n'.join(parts)
+
+
+def _note_text(rng):
+    roll = rng.random()
+    if roll < 0.4:
+        first, second = rng.sample(WORDS, 2)
+        return f'https://example.com/course-play/{first}/{second}-{rng.randint(1, 999)}'
+    if roll < 0.8:
+        return ' '.join(_sentence(rng) for _ in range(rng.randint(1, 3)))
+    return _sentence(rng, 2, 5) + '\n' + '\n'.join(
+        f'- {_words(rng, 2, 6)}' for _ in range(rng.randint(2, 5)))
+
+
+def _local_iso(epoch):
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class DeckGenerator:
+    """Deterministic synthetic cards and notes: the same seed gives the same rows.
+
+    Dates are laid out relative to `now` (midnight today by default), so a
+    deck generated on another day has the same due/overdue shape.
+    """
+
+    def __init__(self, seed=DEFAULT_SEED, now=None):
+        self.seed = seed
+        if now is None:
+            now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        self.now = int(now)
+        self.subjects = list(SUBJECTS)
+        self.subject_weights = _zipf_weights(len(self.subjects))
+        self.topic_weights = {subject: _zipf_weights(len(topics), 0.8)
+                              for subject, topics in SUBJECTS.items()}
+        self.tail_weights = _zipf_weights(LONG_TAIL_SUBJECTS, 1.1)
+        self.answer_kinds = list(ANSWER_KINDS)
+        self.answer_weights = list(ANSWER_KINDS.values())
+
+    def _facet(self, rng):
+        if rng.random() < LONG_TAIL_SHARE:
+            course = rng.choices(range(1, LONG_TAIL_SUBJECTS + 1), self.tail_weights)[0]
+            return f'Course {course:03d}', f'Module {rng.randint(1, LONG_TAIL_TOPICS)}'
+        subject = rng.choices(self.subjects, self.subject_weights)[0]
+        return subject, rng.choices(SUBJECTS[subject], self.topic_weights[subject])[0]
+
+    def cards(self, count):
+        """Yield `count` spaced_repetition rows in PRACTICE_COLUMNS order."""
+        rng = random.Random(f'{self.seed}:cards')
+        for card_id in range(1, count + 1):
+            subject, topic = self._facet(rng)
+            kind = rng.choices(self.answer_kinds, self.answer_weights)[0]
+            stars = rng.choices(range(6), STAR_WEIGHTS)[0]
+            if rng.random() < REVIEWED_SHARE:
+                reps = 1 + min(int(rng.expovariate(0.4)), 30)
+                lapses = min(int(rng.expovariate(2.0)), reps - 1)
+                stability = min(max(math.exp(rng.gauss(1.5, 1.2)), 0.1), 3650)
+                interval = max(round(stability * rng.uniform(0.8, 1.2)), 1)
+                last_review = self.now - int(rng.uniform(0, interval * 1.3) * SECONDS_PER_DAY)
+                due = last_review + interval * SECONDS_PER_DAY
+                yield (card_id, subject, topic, _question(rng), _answer(rng, kind),
+                       _local_iso(due), stars, round(rng.uniform(1.3, 3.0), 2),
+                       round(stability, 3), round(rng.uniform(1, 10), 3), interval,
+                       reps, lapses, last_review, due)
+            else:
+                # New card: due on its date, which the due backfill copies
+                created = self.now + int(rng.uniform(-180, 30) * SECONDS_PER_DAY)
+                yield (card_id, subject, topic, _question(rng), _answer(rng, kind),
+                       _local_iso(created), stars, 2.5, None, None, 0, 0, 0, None, None)
+
+    def notes(self, count):
+        """Yield `count` notes rows in NOTE_COLUMNS order, oldest first."""
+        rng = random.Random(f'{self.seed}:notes')
+        start = self.now - 365 * SECONDS_PER_DAY
+        step = 365 * SECONDS_PER_DAY / max(count, 1)
+        for note_id in range(1, count + 1):
+            written = int(start + (note_id - 1) * step + rng.uniform(0, step))
+            yield (note_id, _note_text(rng), _local_iso(written),
+                   rng.choices(range(6), STAR_WEIGHTS)[0])
+
+
+def _insert_chunked(conn, table, columns, rows):
+    sql = (f'INSERT INTO {table} ({", ".join(columns)}) '
+           f'VALUES ({", ".join("?" * len(columns))})')
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= GENERATE_CHUNK_SIZE:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+
+
+def generate_deck(db_path, cards, notes=None, seed=DEFAULT_SEED, now=None):
+    """Create a fresh database at `db_path` holding a synthetic deck.
+
+    Loads the same way restore_backup() does: the schema comes from the
+    migrations, indexes and triggers are dropped for the bulk insert and
+    the derived data is rebuilt once at the end.
+    """
+    from backup_practices import _drop_indexes_and_triggers
+
+    if notes is None:
+        notes = cards
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    generator = DeckGenerator(seed, now)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(conn)
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        index_sql, trigger_sql = _drop_indexes_and_triggers(
+            conn, ['notes', 'spaced_repetition'])
+        conn.execute('BEGIN')
+        _insert_chunked(conn, 'spaced_repetition', PRACTICE_COLUMNS, generator.cards(cards))
+        _insert_chunked(conn, 'notes', NOTE_COLUMNS, generator.notes(notes))
+        conn.execute('COMMIT')
+        conn.execute('BEGIN')
+        for sql in DERIVED_REBUILDS + index_sql + trigger_sql:
+            conn.execute(sql)
+        conn.execute('COMMIT')
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    return generator
+
+
+def deck_params(db_path):
+    """Pick the ids, names and search words the timed routes are pointed at."""
+    conn = sqlite3.connect(db_path)
+    try:
+        card_count, card_id = conn.execute(
+            'SELECT COUNT(*), MAX(id) / 2 FROM spaced_repetition').fetchone()
+        note_count, note_id = conn.execute('SELECT COUNT(*), MAX(id) / 2 FROM notes').fetchone()
+        mid_date = conn.execute(
+            'SELECT date FROM notes ORDER BY date LIMIT 1 OFFSET ?',
+            (note_count // 2,)).fetchone()[0]
+        subject, topic = conn.execute(
+            '''SELECT subject, topic FROM spaced_repetition
+               GROUP BY subject, topic ORDER BY COUNT(*) DESC LIMIT 1''').fetchone()
+    finally:
+        conn.close()
+    return {
+        'cards': card_count,
+        'notes': note_count,
+        'card_id': card_id,
+        'note_id': note_id,
+        'notes_last_page': max((note_count + 19) // 20, 1),
+        'mid_date': mid_date[:10],
+        'subject': subject,
+        'topic': topic,
+        'word': 'latency',
+    }
+
+
+def _metric(metrics, name, value, unit, better='lower'):
+    metrics[name] = {'value': round(value, 4), 'unit': unit, 'better': better}
+
+
+def _peak_memory(fn, *args, **kwargs):
+    """Run fn and return the peak Python heap it allocated, in bytes."""
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def bench_routes(db_path, params, metrics, repeat=DEFAULT_REPEAT, memory=True):
+    """Time every route in ROUTES through the Flask test client.
+
+    Each route is timed `repeat` times with the fragment and query caches
+    cleared before every request (render_ms: the full query and render
+    path) and `repeat` times with them warm (cached_ms: what a repeat visit
+    costs).
+    """
+    import database
+    database.DATABASE_PATH = db_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import app
+    import fragment_cache
+    import query_cache
+
+    client = app.test_client()
+    for name, pattern in ROUTES:
+        url = pattern.format(**params)
+        # Warm-up: opens pooled connections and loads per-process caches
+        response = client.get(url)
+        if response.status_code != 200:
+            raise BenchmarkError(f'{url} returned {response.status_code}')
+
+        render = []
+        for _ in range(repeat):
+            fragment_cache.clear()
+            query_cache.clear()
+            render.append(_timed(client.get, url)[0] * 1000)
+        cached = [_timed(client.get, url)[0] * 1000 for _ in range(repeat)]
+
+        _metric(metrics, f'route.{name}.render_ms', statistics.median(render), 'ms')
+        _metric(metrics, f'route.{name}.render_p95_ms', _percentile(render, 0.95), 'ms')
+        _metric(metrics, f'route.{name}.cached_ms', statistics.median(cached), 'ms')
+        _metric(metrics, f'route.{name}.bytes', len(response.data) / 1024, 'KB')
+        if memory:
+            fragment_cache.clear()
+            query_cache.clear()
+            _metric(metrics, f'route.{name}.peak_kb',
+                    _peak_memory(client.get, url) / 1024, 'KB')
+        print(f"  {name:20} {statistics.median(render):9.2f} ms render "
+              f"{statistics.median(cached):9.2f} ms cached")
+
+
+def bench_backups(db_path, workdir, rows, metrics, memory=True, legacy=True):
+    """Time the streaming export/restore and the legacy JSON backup/restore."""
+    import backup_practices
+
+    backup_practices.DATABASE_PATH = db_path
+    backup_dir = os.path.join(workdir, 'backup')
+    restored = os.path.join(workdir, 'restored.db')
+
+    def export():
+        shutil.rmtree(backup_dir, ignore_errors=True)
+        backup_practices.export_backup(backup_dir)
+
+    def restore():
+        if os.path.exists(restored):
+            os.remove(restored)
+        backup_practices.restore_backup(backup_dir, db_path=restored)
+
+    def legacy_backup():
+        backup_practices.DATABASE_PATH = db_path
+        backup_practices.backup_all_data()
+
+    def legacy_restore():
+        # The legacy restore expects the app to have created empty tables
+        if os.path.exists(restored):
+            os.remove(restored)
+        conn = sqlite3.connect(restored)
+        migrate(conn)
+        conn.close()
+        backup_practices.DATABASE_PATH = restored
+        try:
+            backup_practices.restore_all_data()
+        finally:
+            backup_practices.DATABASE_PATH = db_path
+
+    phases = [('export', export), ('restore', restore)]
+    if legacy:
+        phases += [('legacy_backup', legacy_backup), ('legacy_restore', legacy_restore)]
+    for name, fn in phases:
+        seconds, _ = _timed(fn)
+        _metric(metrics, f'backup.{name}.seconds', seconds, 's')
+        _metric(metrics, f'backup.{name}.rows_per_s', rows / seconds, 'rows/s', 'higher')
+        if memory:
+            _metric(metrics, f'backup.{name}.peak_mb', _peak_memory(fn) / 2 ** 20, 'MB')
+        print(f"  {name:20} {seconds:9.2f} s  {rows / seconds:12,.0f} rows/s")
+
+    size = sum(os.path.getsize(os.path.join(backup_dir, f)) for f in os.listdir(backup_dir))
+    _metric(metrics, 'backup.export.size_mb', size / 2 ** 20, 'MB')
+
+
+def run(scale=DEFAULT_SCALE, seed=DEFAULT_SEED, repeat=DEFAULT_REPEAT, memory=True,
+        legacy=True, keep=False):
+    """Generate a deck, run every benchmark on it and return the results dict."""
+    cards = SCALES[scale]
+    workdir = tempfile.mkdtemp(prefix=f'bench-{scale}-')
+    db_path = os.path.join(workdir, 'app.db')
+    metrics = {}
+    # The legacy backup writes its JSON to the working directory
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        print(f"Generating {cards:,} cards and notes (seed {seed})")
+        seconds, _ = _timed(generate_deck, db_path, cards, seed=seed)
+        _metric(metrics, 'generate.seconds', seconds, 's')
+        _metric(metrics, 'db.size_mb', os.path.getsize(db_path) / 2 ** 20, 'MB')
+        params = deck_params(db_path)
+
+        print('Routes')
+        bench_routes(db_path, params, metrics, repeat=repeat, memory=memory)
+        print('Backups')
+        bench_backups(db_path, workdir, params['cards'] + params['notes'], metrics,
+                      memory=memory, legacy=legacy)
+    finally:
+        os.chdir(cwd)
+        if keep:
+            print(f"Kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'format': RESULTS_FORMAT,
+        'scale': scale,
+        'cards': cards,
+        'seed': seed,
+        'repeat': repeat,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'metrics': metrics,
+    }
+
+
+def load_results(path):
+    with open(path) as f:
+        results = json.load(f)
+    if results.get('format') != RESULTS_FORMAT:
+        raise BenchmarkError(f"{path} is not a {RESULTS_FORMAT} results file")
+    return results
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Compare two results dicts; returns (rows, regressions).
+
+    Each row is (metric, baseline, current, relative change, status) where
+    a positive change is always worse, whichever direction is better.
+    """
+    if (baseline['scale'], baseline['seed']) != (current['scale'], current['seed']):
+        raise BenchmarkError(
+            f"Cannot compare scale {baseline['scale']} seed {baseline['seed']} "
+            f"with scale {current['scale']} seed {current['seed']}")
+
+    rows = []
+    regressions = []
+    for name, old in baseline['metrics'].items():
+        new = current['metrics'].get(name)
+        if new is None:
+            continue
+        delta = new['value'] - old['value']
+        if old['better'] == 'higher':
+            delta = -delta
+        change = delta / old['value'] if old['value'] else 0.0
+        status = ''
+        if change > threshold and delta > NOISE_FLOOR.get(old['unit'], 0):
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold and -delta > NOISE_FLOOR.get(old['unit'], 0):
+            status = 'improved'
+        rows.append((name, old['value'], new['value'], change, status))
+    return rows, regressions
+
+
+def print_comparison(rows, threshold):
+    print(f"{'metric':42} {'baseline':>12} {'current':>12} {'worse by':>9}")
+    for name, old, new, change, status in rows:
+        print(f"{name:42} {old:12.4g} {new:12.4g} {change:+9.1%}  {status}")
+    regressions = sum(1 for row in rows if row[4] == 'REGRESSION')
+    print(f"{regressions} of {len(rows)} metrics regressed by more than {threshold:.0%}")
+
+
+def default_results_path(scale):
+    return os.path.join('bench', f"{scale}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the routes and backup scripts on a synthetic deck.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser(
+        'run', help='generate a deck in a temp directory and benchmark it')
+    run_parser.add_argument('--scale', choices=SCALES, default=DEFAULT_SCALE,
+                            help='cards and notes to generate (default 10k)')
+    run_parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    run_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                            help='timed requests per route and mode')
+    run_parser.add_argument('--out', default=None,
+                            help='results file (default: bench/<scale>-<timestamp>.json)')
+    run_parser.add_argument('--baseline', default=None,
+                            help='results file to compare against; exits 1 on a regression')
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='relative slowdown counted as a regression (default 0.1)')
+    run_parser.add_argument('--no-memory', action='store_true',
+                            help='skip the tracemalloc peak-memory passes')
+    run_parser.add_argument('--no-legacy', action='store_true',
+                            help='skip the legacy JSON backup/restore')
+    run_parser.add_argument('--keep', action='store_true',
+                            help='keep the generated database and backups')
+
+    compare_parser = subparsers.add_parser('compare', help='compare two results files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    generate_parser = subparsers.add_parser(
+        'generate', help='write a synthetic deck database for manual testing')
+    generate_parser.add_argument('db', help='database file to create (replaced if it exists)')
+    generate_parser.add_argument('--scale', choices=SCALES, default=DEFAULT_SCALE)
+    generate_parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+
+    args = parser.parse_args(argv)
+    if args.command == 'generate':
+        generate_deck(args.db, SCALES[args.scale], seed=args.seed)
+        print(f"Wrote {SCALES[args.scale]:,} cards and notes to {args.db}")
+        return 0
+
+    if args.command == 'compare':
+        baseline, current = load_results(args.baseline), load_results(args.current)
+    else:
+        baseline = load_results(args.baseline) if args.baseline else None
+        current = run(args.scale, args.seed, args.repeat, memory=not args.no_memory,
+                      legacy=not args.no_legacy, keep=args.keep)
+        out = args.out or default_results_path(args.scale)
+        os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+        with open(out, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Results saved to {out}")
+        if baseline is None:
+            return 0
+
+    rows, regressions = compare(baseline, current, args.threshold)
+    print_comparison(rows, args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
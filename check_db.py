@@ -8,6 +8,10 @@ cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
 tables = cursor.fetchall()
 print("Tables in database:", [t[0] for t in tables])
 
+# Schema version tracked by migrations.py
+cursor.execute("PRAGMA user_version")
+print("Schema version:", cursor.fetchone()[0])
+
 # Check spaced_repetition table structure
 try:
     cursor.execute("PRAGMA table_info(spaced_repetition)")
@@ -1,48 +1,67 @@
 import sqlite3
 import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app, g, has_app_context
+
+import metrics
+import scheduler
+import writer
+from dedup import backfill_content_hashes
+from migrations import migrate
 
 DATABASE_PATH = 'app.db'
 
+# SQLite tuning profiles, selected with app.config['SQLITE_PROFILE'].
+# Individual values can be overridden with SQLITE_CACHE_SIZE,
+# SQLITE_MMAP_SIZE and SQLITE_BUSY_TIMEOUT.
+PRAGMA_PROFILES = {
+    # SQLite defaults: rollback journal, fully synchronous commits
+    'safe': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+    },
+    # WAL lets readers run while a card is being rated; NORMAL sync is
+    # still crash-safe in WAL mode, it only skips fsyncs between checkpoints
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,  # negative = KiB, so 64 MB
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
+DEFAULT_PROFILE = 'fast'
+
+# Idle connections kept open between requests
+POOL_SIZE = 8
+
+_pool = []
+_pool_lock = threading.Lock()
+
+# Connections whose copy of the data_versions table is kept (see data_version)
+VERSION_SNAPSHOTS = 32
+
+_snapshots = OrderedDict()
+_snapshots_lock = threading.Lock()
+
 
 def init_db():
-    """Initialize the database with tables."""
+    """Initialize the database, applying any pending schema migrations."""
     conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-
-    # Create a sample table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # Create notes table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS notes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            text TEXT NOT NULL,
-            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            stars INTEGER DEFAULT 0
-        )
-    ''')
-
-    # Create spaced repetition practice table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS spaced_repetition (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            subject TEXT NOT NULL,
-            topic TEXT NOT NULL,
-            question TEXT NOT NULL,
-            answer TEXT NOT NULL,
-            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            stars INTEGER DEFAULT 0
-        )
-    ''')
-
-    conn.commit()
+
+    # Create or upgrade the tables and indexes to the latest schema version
+    migrate(conn)
+    # Hash the cards and notes other tools wrote since the last start
+    with conn:
+        backfill_content_hashes(conn)
+
     conn.close()
     if not os.path.exists(DATABASE_PATH):
         print(f"Database initialized at {DATABASE_PATH}")
@@ -50,12 +69,162 @@ def init_db():
         print(f"Database tables created/verified")
 
 
-def get_db_connection():
-    """Get a database connection."""
-    conn = sqlite3.connect(DATABASE_PATH)
+def get_pragmas(config=None):
+    """Return the PRAGMA settings for the configured profile."""
+    config = config or {}
+    profile = config.get('SQLITE_PROFILE', DEFAULT_PROFILE)
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown SQLITE_PROFILE {profile!r}, "
+                         f"expected one of {sorted(PRAGMA_PROFILES)}")
+    pragmas = dict(PRAGMA_PROFILES[profile])
+    for key in ('cache_size', 'mmap_size', 'busy_timeout'):
+        override = config.get(f'SQLITE_{key.upper()}')
+        if override is not None:
+            pragmas[key] = int(override)
+    return pragmas
+
+
+def connect(path=None, pragmas=None):
+    """Open a new connection with Row results, scheduler functions and PRAGMAs.
+
+    With metrics enabled the connection is instrumented (see metrics.py).
+    """
+    conn = sqlite3.connect(path or DATABASE_PATH, check_same_thread=False,
+                           factory=metrics.connection_factory())
     conn.row_factory = sqlite3.Row
+    scheduler.register(conn)
+    for name, value in (pragmas or get_pragmas()).items():
+        # PRAGMA does not accept bound parameters; values come from config
+        conn.execute(f'PRAGMA {name} = {value}')
     return conn
 
 
+def get_db_connection():
+    """Get a database connection.
+
+    Inside a Flask app context the connection is borrowed from a small pool
+    on first use and reused for the rest of the request; it goes back to the
+    pool on teardown, so routes must not close it. Outside an app context
+    (scripts, shells) a new connection is returned and the caller closes it.
+    """
+    if not has_app_context():
+        return connect()
+
+    if 'db' not in g:
+        with _pool_lock:
+            conn = _pool.pop() if _pool else None
+        if conn is None:
+            conn = connect(pragmas=get_pragmas(current_app.config))
+        g.db = conn
+    return g.db
+
+
+def close_db_connection(exception=None):
+    """Return the request's connection to the pool (app teardown handler)."""
+    conn = g.pop('db', None)
+    if conn is None:
+        return
+
+    # Never hand a half-finished transaction to the next request
+    if conn.in_transaction:
+        conn.rollback()
+    with _pool_lock:
+        if len(_pool) < POOL_SIZE:
+            _pool.append(conn)
+            return
+    conn.close()
+
+
+def _write_queue():
+    """Return the app's writer (see writer.py), or None when WRITE_QUEUE is off."""
+    if not (has_app_context() and current_app.config.get('WRITE_QUEUE')):
+        return None
+    config = current_app.config
+    path = os.path.abspath(DATABASE_PATH)
+    return writer.get_writer(
+        path, lambda: connect(path, get_pragmas(config)),
+        window=config.get('WRITE_QUEUE_WINDOW_MS', writer.WINDOW_MS) / 1000,
+        max_batch=config.get('WRITE_QUEUE_MAX_BATCH', writer.MAX_BATCH))
+
+
+def run_write(fn, timeout=writer.WAIT_TIMEOUT):
+    """Run fn(conn) as one committed write and return its result.
+
+    With app.config['WRITE_QUEUE'] on, fn runs on the single writer thread
+    (see writer.py) and is committed together with concurrent writes, so
+    requests never contend for the database lock; otherwise it runs on the
+    request's connection and is committed on its own. fn must not commit.
+    `timeout` is how long to wait for the writer (None: no limit).
+    """
+    queue = _write_queue()
+    if queue is not None:
+        return queue.call(fn, timeout)
+
+    conn = get_db_connection()
+    try:
+        with conn:
+            return fn(conn)
+    finally:
+        if not has_app_context():
+            conn.close()
+
+
+def execute_write(sql, parameters=()):
+    """Run one write statement through run_write(); returns its rowcount."""
+    return run_write(lambda conn: conn.execute(sql, parameters).rowcount)
+
+
+def submit_write(fn):
+    """Queue fn(conn) as a write without waiting for it, for writes that may be lost.
+
+    With the write queue on, fn is committed with the writer's next batch
+    and its result or error is dropped; this is safe to call from inside a
+    run_write() function. Without the queue nothing is written, since a
+    write on the request's connection could wait for the database lock.
+    """
+    queue = _write_queue()
+    if queue is not None:
+        queue.submit(fn)
+
+
+def _data_versions(conn):
+    """Return {name: version} from the data_versions table.
+
+    The table is re-read only when something was committed since this
+    connection last read it: PRAGMA data_version moves on commits by other
+    connections (the writer thread, other processes) and total_changes on
+    the connection's own writes. Until then the copy is reused, so
+    read-only requests do not query the table at all.
+    """
+    token = (conn.execute('PRAGMA data_version').fetchone()[0], conn.total_changes)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(id(conn))
+    if snapshot is not None and snapshot[0] is conn and snapshot[1] == token:
+        return snapshot[2]
+    rows = dict(conn.execute('SELECT name, version FROM data_versions'))
+    with _snapshots_lock:
+        # The connection is kept with its copy, so its id is not reused
+        _snapshots[id(conn)] = (conn, token, rows)
+        _snapshots.move_to_end(id(conn))
+        while len(_snapshots) > VERSION_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return rows
+
+
+def data_version(conn, *names):
+    """Return the change counters of the named data sets as a tuple.
+
+    Names are 'items', 'notes', 'practices' and 'facets' (subjects and
+    topics). Each version moves on every write to its tables.
+    """
+    versions = _data_versions(conn)
+    return tuple(versions.get(name) for name in names)
+
+
+def init_app(app):
+    """Register the connection teardown handler on `app`."""
+    app.teardown_appcontext(close_db_connection)
+
+
 if __name__ == '__main__':
     init_db()
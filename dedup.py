@@ -0,0 +1,214 @@
+import argparse
+import hashlib
+import sqlite3
+import time
+from datetime import datetime
+
+# What to do when a new card or note has the content of an existing one
+# (app.config['DUPLICATE_POLICY'], the importer's --duplicates):
+# skip it, merge it into the existing row, or insert it anyway.
+POLICIES = ('skip', 'merge', 'allow')
+DEFAULT_POLICY = 'skip'
+# Outcomes returned by insert_practice() / insert_note()
+INSERTED, SKIPPED, MERGED = 'inserted', 'skipped', 'merged'
+# Duplicate groups listed by the report
+REPORT_LIMIT = 20
+
+# Tables with a content_hash column: (hashed columns, how to pick the copy
+# that is kept when duplicates are cleaned up)
+HASHED_TABLES = {
+    'spaced_repetition': (('subject', 'topic', 'question'), 'reps DESC, id'),
+    'notes': (('text',), 'stars DESC, id'),
+}
+
+# Hashes the rows written without one: by older versions, by tools that do
+# not hash, and by bulk loads. Needs register() on the connection.
+CONTENT_HASH_BACKFILL = [
+    f"UPDATE {table} SET content_hash = content_hash({', '.join(columns)}) "
+    'WHERE content_hash IS NULL'
+    for table, (columns, _) in HASHED_TABLES.items()
+]
+
+
+def normalize(text):
+    """Fold case and runs of whitespace, so trivially different copies match."""
+    return ' '.join((text or '').split()).casefold()
+
+
+def content_hash(*parts):
+    """Return the 128-bit hex hash of the normalized parts."""
+    joined = '\x1f'.join(normalize(part) for part in parts)
+    return hashlib.blake2b(joined.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def register(conn):
+    """Register content_hash(...) as an SQL function on `conn`."""
+    conn.create_function('content_hash', -1, content_hash, deterministic=True)
+
+
+def local_now():
+    """Return the current time as (local ISO date text, epoch seconds)."""
+    epoch = int(time.time())
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%dT%H:%M:%S'), epoch
+
+
+def check_policy(policy):
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown duplicate policy {policy!r}, expected one of {', '.join(POLICIES)}")
+    return policy
+
+
+def backfill_content_hashes(conn):
+    """Hash the rows written without one; returns the count. The caller commits."""
+    register(conn)
+    return sum(conn.execute(sql).rowcount for sql in CONTENT_HASH_BACKFILL)
+
+
+def insert_practice(conn, subject, topic, question, answer, date=None, policy=DEFAULT_POLICY):
+    """Insert a card unless `policy` says otherwise; returns (outcome, card id).
+
+    A duplicate has the same subject, topic and question. 'merge' replaces
+    the existing card's answer and keeps its review history.
+    """
+    digest = content_hash(subject, topic, question)
+    if check_policy(policy) != 'allow':
+        existing = conn.execute(
+            'SELECT id, answer FROM spaced_repetition WHERE content_hash = ? ORDER BY id LIMIT 1',
+            (digest,)).fetchone()
+        if existing is not None:
+            if policy == 'merge' and existing[1] != answer:
+                conn.execute('UPDATE spaced_repetition SET answer = ? WHERE id = ?',
+                             (answer, existing[0]))
+                return MERGED, existing[0]
+            return SKIPPED, existing[0]
+    if date is None:
+        date, due = local_now()
+        cursor = conn.execute(
+            'INSERT INTO spaced_repetition (subject, topic, question, answer, date, due, '
+            'content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (subject, topic, question, answer, date, due, digest))
+    else:
+        cursor = conn.execute(
+            'INSERT INTO spaced_repetition (subject, topic, question, answer, date, content_hash) '
+            'VALUES (?, ?, ?, ?, ?, ?)', (subject, topic, question, answer, date, digest))
+    return INSERTED, cursor.lastrowid
+
+
+def update_practice(conn, practice_id, subject, topic, question, answer):
+    """Change a card's content and its hash."""
+    digest = content_hash(subject, topic, question)
+    conn.execute(
+        'UPDATE spaced_repetition SET subject = ?, topic = ?, question = ?, answer = ?, '
+        'content_hash = ? WHERE id = ?',
+        (subject, topic, question, answer, digest, practice_id))
+    # The hash trigger clears an unchanged hash after a content edit
+    conn.execute('UPDATE spaced_repetition SET content_hash = ? '
+                 'WHERE id = ? AND content_hash IS NULL', (digest, practice_id))
+
+
+def insert_note(conn, text, policy=DEFAULT_POLICY):
+    """Insert a note unless `policy` says otherwise; returns (outcome, note id).
+
+    Notes are only their text, so 'merge' keeps the existing note as is.
+    """
+    digest = content_hash(text)
+    if check_policy(policy) != 'allow':
+        existing = conn.execute(
+            'SELECT id FROM notes WHERE content_hash = ? ORDER BY id LIMIT 1',
+            (digest,)).fetchone()
+        if existing is not None:
+            return (MERGED if policy == 'merge' else SKIPPED), existing[0]
+    date, date_ts = local_now()
+    cursor = conn.execute('INSERT INTO notes (text, date, date_ts, content_hash) VALUES (?, ?, ?, ?)',
+                          (text, date, date_ts, digest))
+    return INSERTED, cursor.lastrowid
+
+
+def update_note(conn, note_id, text):
+    """Change a note's text and its hash."""
+    digest = content_hash(text)
+    conn.execute('UPDATE notes SET text = ?, content_hash = ? WHERE id = ?',
+                 (text, digest, note_id))
+    conn.execute('UPDATE notes SET content_hash = ? WHERE id = ? AND content_hash IS NULL',
+                 (digest, note_id))
+
+
+def _duplicate_ids_sql(table):
+    # Every row but the one kept in each group of equal hashes
+    _, keep_order = HASHED_TABLES[table]
+    return f'''
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY content_hash ORDER BY {keep_order}) AS copy
+            FROM {table}
+            WHERE content_hash IN (
+                SELECT content_hash FROM {table}
+                GROUP BY content_hash HAVING COUNT(*) > 1)
+        ) WHERE copy > 1
+    '''
+
+
+def find_duplicates(conn, table, limit=REPORT_LIMIT):
+    """Summarize the duplicate groups in `table`: counts and the largest groups."""
+    columns, _ = HASHED_TABLES[table]
+    groups, extra = conn.execute(
+        f'''SELECT COUNT(*), COALESCE(SUM(copies - 1), 0) FROM (
+                SELECT COUNT(*) AS copies FROM {table}
+                WHERE content_hash IS NOT NULL
+                GROUP BY content_hash HAVING COUNT(*) > 1)''').fetchone()
+    largest = conn.execute(
+        f'''SELECT COUNT(*) AS copies, MIN(id), {', '.join(f'MIN({c})' for c in columns)}
+            FROM {table} WHERE content_hash IS NOT NULL
+            GROUP BY content_hash HAVING COUNT(*) > 1
+            ORDER BY copies DESC, MIN(id) LIMIT ?''', (limit,)).fetchall()
+    return {'groups': groups, 'duplicates': extra,
+            'largest': [{'copies': row[0], 'id': row[1], 'content': row[2:]} for row in largest]}
+
+
+def remove_duplicates(conn, table):
+    """Delete every duplicate in `table` but one per group; returns the count.
+
+    The kept card is the one with the most reviews and the kept note the
+    highest rated, the oldest on a tie. The caller commits.
+    """
+    return conn.execute(
+        f'DELETE FROM {table} WHERE id IN ({_duplicate_ids_sql(table)})').rowcount
+
+
+def main(argv=None):
+    from database import DATABASE_PATH
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(
+        description='Report duplicate cards and notes, and optionally remove them.')
+    parser.add_argument('--limit', type=int, default=REPORT_LIMIT,
+                        help='largest duplicate groups to list per table')
+    parser.add_argument('--apply', action='store_true',
+                        help='delete the duplicates (default is a dry run)')
+    parser.add_argument('--db', default=DATABASE_PATH, help='database file')
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    migrate(conn)
+    with conn:
+        hashed = backfill_content_hashes(conn)
+    if hashed:
+        print(f"Hashed {hashed} rows written without a content hash")
+
+    for table in HASHED_TABLES:
+        summary = find_duplicates(conn, table, args.limit)
+        print(f"{table}: {summary['duplicates']} duplicates in {summary['groups']} groups")
+        for group in summary['largest']:
+            content = ' / '.join(' '.join(str(part).split())[:60] for part in group['content'])
+            print(f"  {group['copies']:5d} x  #{group['id']}  {content}")
+        if args.apply and summary['duplicates']:
+            with conn:
+                removed = remove_duplicates(conn, table)
+            print(f"  Removed {removed} duplicate rows")
+    if not args.apply:
+        print('Dry run; pass --apply to delete the duplicates.')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from migrations import RESEED_GENERATION
+from scheduler import (FSRS_DECAY, FSRS_DESIRED_RETENTION, FSRS_FACTOR,
+                       FSRS_MAX_INTERVAL, FSRS_WEIGHTS, SECONDS_PER_DAY)
+
+MIN_DAYS = 1
+MAX_DAYS = 365
+# Reviewed cards sampled to estimate the expected retention curve
+RETENTION_SAMPLE = 5000
+# Above this many changed cards, reload the deck instead of patching the cache
+MAX_PATCH_ROWS = 50000
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _fetch_schedule(conn, where='', params=()):
+    rows = conn.execute(
+        f'''SELECT id, due, last_review, stability, difficulty, interval_days
+            FROM spaced_repetition WHERE due IS NOT NULL {where} ORDER BY id''',
+        params).fetchall()
+    return np.array([tuple(row) for row in rows], dtype=np.float64).reshape(-1, 6)
+
+
+def _changelog_position(conn):
+    """Return (reseed generation, changelog high-water mark)."""
+    return tuple(conn.execute(
+        '''SELECT (SELECT version FROM data_versions WHERE name = ?),
+                  (SELECT COALESCE(MAX(seq), 0) FROM changelog)''',
+        (RESEED_GENERATION,)).fetchone())
+
+
+def load_schedule(conn):
+    """Load every card's scheduling state into NumPy arrays.
+
+    Missing values come back as NaN: stability/difficulty for cards never
+    graded with FSRS, last_review for cards never reviewed.
+
+    Fetching a million rows through the sqlite3 module dominates the cost of
+    a forecast, so the arrays are cached per database file and brought up to
+    date from the changelog: only cards changed since the last call are
+    re-read. A restore or bulk load reseeds the data versions, and the
+    changelog no longer describes what changed, so the deck is reloaded.
+    """
+    path = conn.execute('PRAGMA database_list').fetchone()[2]
+    generation, seq = _changelog_position(conn)
+    with _cache_lock:
+        cached_generation, cached_seq, data = _cache.get(path, (None, None, None))
+    if cached_generation != generation:
+        cached_seq = None
+
+    changed_ids = None
+    if cached_seq is not None and cached_seq < seq:
+        changed_ids = [row[0] for row in conn.execute(
+            '''SELECT row_id FROM changelog
+               WHERE table_name = 'spaced_repetition' AND seq > ?''', (cached_seq,))]
+
+    if cached_seq == seq:
+        pass
+    elif changed_ids is not None and len(changed_ids) <= MAX_PATCH_ROWS:
+        fresh = _fetch_schedule(conn, '''AND id IN (
+            SELECT row_id FROM changelog
+            WHERE table_name = 'spaced_repetition' AND seq > ?)''', (cached_seq,))
+        stale = np.isin(data[:, 0], np.array(changed_ids, dtype=np.float64))
+        data = np.concatenate([data[~stale], fresh])
+        # Keep id order so the retention sample matches a fresh load
+        data = data[np.argsort(data[:, 0], kind='stable')]
+    else:
+        # First load, a large batch of changes, or a restored database
+        data = _fetch_schedule(conn)
+
+    if path:  # not an in-memory database
+        with _cache_lock:
+            _cache[path] = (generation, seq, data)
+    return {
+        'due': data[:, 1],
+        'last_review': data[:, 2],
+        'stability': data[:, 3],
+        'difficulty': data[:, 4],
+        'interval_days': data[:, 5],
+    }
+
+
+def _retrievability(elapsed_days, stability):
+    return (1 + FSRS_FACTOR * elapsed_days / stability) ** FSRS_DECAY
+
+
+def _good_review(stability, difficulty, retrievability):
+    """Vectorized FSRS update for a review graded Good; returns (S, D, interval)."""
+    w = FSRS_WEIGHTS
+    stability = stability * (
+        np.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+        * (np.exp(w[10] * (1 - retrievability)) - 1) + 1)
+    # grade 3 leaves difficulty alone apart from mean reversion
+    difficulty = np.clip(w[7] * w[4] + (1 - w[7]) * difficulty, 1.0, 10.0)
+    interval = stability / FSRS_FACTOR * (FSRS_DESIRED_RETENTION ** (1 / FSRS_DECAY) - 1)
+    interval = np.clip(np.rint(interval), 1, FSRS_MAX_INTERVAL).astype(np.int64)
+    return stability, difficulty, interval
+
+
+def _initial_state(schedule, now):
+    """Return (first review day, stability, difficulty, days since last review)."""
+    first_day = np.floor((schedule['due'] - now) / SECONDS_PER_DAY)
+    first_day = np.maximum(first_day, 0).astype(np.int64)  # overdue cards: today
+
+    # Cards without FSRS state: treat the current interval as the stability
+    # (at 90% desired retention the FSRS interval equals the stability)
+    stability = np.where(np.isnan(schedule['stability']),
+                         np.maximum(schedule['interval_days'], FSRS_WEIGHTS[2]),
+                         schedule['stability'])
+    difficulty = np.where(np.isnan(schedule['difficulty']),
+                          FSRS_WEIGHTS[4], schedule['difficulty'])
+    elapsed = (now - schedule['last_review']) / SECONDS_PER_DAY
+    return first_day, stability, difficulty, elapsed
+
+
+def review_load(schedule, days, now):
+    """Projected number of reviews on each of the next `days` days.
+
+    Every review is assumed to be graded Good and done on its due day. The
+    loop runs once per review generation (a handful, since intervals grow
+    geometrically), not once per card or per day.
+    """
+    day, stability, difficulty, elapsed = _initial_state(schedule, now)
+    counts = np.zeros(days, dtype=np.int64)
+
+    # The first review happens `day` days from now, however late that is
+    retrievability = _retrievability(np.nan_to_num(elapsed, nan=0.0) + day, stability)
+    keep = day < days
+    day, stability, difficulty, retrievability = (
+        day[keep], stability[keep], difficulty[keep], retrievability[keep])
+
+    while day.size:
+        counts += np.bincount(day, minlength=days)[:days]
+        stability, difficulty, interval = _good_review(stability, difficulty, retrievability)
+        day = day + interval
+        # Later reviews happen on schedule, at the desired retention
+        retrievability = np.full(day.shape, FSRS_DESIRED_RETENTION)
+        keep = day < days
+        day, stability, difficulty, retrievability = (
+            day[keep], stability[keep], difficulty[keep], retrievability[keep])
+    return counts
+
+
+def expected_retention(schedule, days, now, sample_size=RETENTION_SAMPLE, seed=0):
+    """Mean recall probability of reviewed cards on each of the next `days` days.
+
+    Estimated from a fixed-seed random sample of reviewed cards, tracking
+    each sampled card's days since last review and stability over a
+    (cards x days) grid.
+    """
+    reviewed = ~np.isnan(schedule['last_review'])
+    if not reviewed.any():
+        return None
+    sample = {key: values[reviewed] for key, values in schedule.items()}
+    count = sample['due'].size
+    if count > sample_size:
+        picked = np.random.default_rng(seed).choice(count, sample_size, replace=False)
+        sample = {key: values[picked] for key, values in sample.items()}
+
+    review_day, stability, difficulty, elapsed = _initial_state(sample, now)
+    grid_days = np.arange(days)
+    # Per card and day: day of the last review (relative to today) and stability
+    last_review_day = np.broadcast_to(-elapsed[:, None], (elapsed.size, days)).copy()
+    current_stability = np.broadcast_to(stability[:, None], last_review_day.shape).copy()
+
+    retrievability = _retrievability(elapsed + review_day, stability)
+    rows = np.arange(elapsed.size)
+    while rows.size:
+        keep = review_day < days
+        rows, review_day = rows[keep], review_day[keep]
+        stability, difficulty, retrievability = (
+            stability[keep], difficulty[keep], retrievability[keep])
+        if not rows.size:
+            break
+        stability, difficulty, interval = _good_review(stability, difficulty, retrievability)
+        after = grid_days[None, :] >= review_day[:, None]
+        last_review_day[rows] = np.where(after, review_day[:, None], last_review_day[rows])
+        current_stability[rows] = np.where(after, stability[:, None], current_stability[rows])
+        review_day = review_day + interval
+        retrievability = np.full(review_day.shape, FSRS_DESIRED_RETENTION)
+
+    recall = _retrievability(grid_days[None, :] - last_review_day, current_stability)
+    return recall.mean(axis=0)
+
+
+def forecast(conn, days=30, now=None):
+    """Build the JSON-ready review load and retention forecast for the deck."""
+    days = min(max(int(days), MIN_DAYS), MAX_DAYS)
+    now = now or time.time()
+    schedule = load_schedule(conn)
+    loads = review_load(schedule, days, now)
+    retention = expected_retention(schedule, days, now)
+    start = date.fromtimestamp(now)
+    return {
+        'start': start.isoformat(),
+        'days': days,
+        'cards': int(schedule['due'].size),
+        'overdue': int((schedule['due'] < now).sum()),
+        'dates': [(start + timedelta(days=i)).isoformat() for i in range(days)],
+        'reviews': loads.tolist(),
+        'retention': None if retention is None else np.round(retention, 4).tolist(),
+    }
+
+
+def main(argv=None):
+    from database import DATABASE_PATH
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(
+        description='Forecast daily review load and expected retention.')
+    parser.add_argument('--days', type=int, default=30,
+                        help=f'days to forecast ({MIN_DAYS}-{MAX_DAYS})')
+    parser.add_argument('--db', default=DATABASE_PATH, help='database file')
+    parser.add_argument('--json', action='store_true', help='print JSON')
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    migrate(conn)
+    started = time.perf_counter()
+    result = forecast(conn, args.days)
+    elapsed = time.perf_counter() - started
+    conn.close()
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['cards']} cards, {result['overdue']} overdue "
+          f"(computed in {elapsed * 1000:.0f} ms)")
+    retention = result['retention'] or [None] * result['days']
+    for day, reviews, recall in zip(result['dates'], result['reviews'], retention):
+        recall_text = f'{recall:.1%}' if recall is not None else '-'
+        print(f"{day}  {reviews:6d} reviews  retention {recall_text}")
+
+
+if __name__ == '__main__':
+    main()
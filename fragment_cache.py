@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+# Number of rendered page fragments kept in memory per process
+LRU_SIZE = 2048
+
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+
+
+def get_fragment(key):
+    """Return the HTML cached under `key`, or None."""
+    with _lru_lock:
+        html = _lru.get(key)
+        if html is not None:
+            _lru.move_to_end(key)
+        return html
+
+
+def put_fragment(key, html):
+    """Cache `html` under `key` and return it as Markup."""
+    html = Markup(html)
+    with _lru_lock:
+        _lru[key] = html
+        _lru.move_to_end(key)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+    return html
+
+
+def cached_fragment(key, render):
+    """Return the HTML fragment cached under `key`, calling render() on a miss.
+
+    Keys must change whenever the fragment's inputs do: either the row
+    values it is built from, or a data_version() counter.
+    """
+    html = get_fragment(key)
+    if html is None:
+        html = put_fragment(key, render())
+    return html
+
+
+def clear():
+    """Drop every cached fragment."""
+    with _lru_lock:
+        _lru.clear()
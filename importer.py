@@ -0,0 +1,431 @@
+import argparse
+import csv
+import html
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime
+
+from dedup import DEFAULT_POLICY, INSERTED, POLICIES, check_policy, content_hash, insert_practice
+from migrations import BULK_INSERT_PRACTICES, BULK_INSERT_STAGING, BULK_INSERT_TRIGGERS
+
+# Rows staged and inserted per set-based statement; bounds the memory used
+CHUNK_SIZE = 5000
+# Rejected rows listed individually in the report (all are counted)
+MAX_REPORTED_REJECTS = 100
+# Longest subject/topic and question/answer accepted
+MAX_NAME_LENGTH = 200
+MAX_TEXT_LENGTH = 100_000
+DEFAULT_SUBJECT = 'Imported'
+DEFAULT_TOPIC = 'General'
+FORMATS = ('csv', 'tsv', 'apkg')
+FIELDS = ('subject', 'topic', 'question', 'answer')
+# Header names accepted for each field, lower-cased
+FIELD_ALIASES = {
+    'subject': {'subject', 'deck'},
+    'topic': {'topic', 'subdeck', 'section'},
+    'question': {'question', 'front', 'prompt'},
+    'answer': {'answer', 'back', 'response'},
+}
+# Collection files inside an .apkg, newest format first
+ANKI_COLLECTIONS = ('collection.anki21b', 'collection.anki21', 'collection.anki2')
+ANKI_FIELD_SEPARATOR = '\x1f'
+
+_csv_limit_raised = False
+
+
+class ImportFileError(ValueError):
+    """Raised for a file that cannot be imported at all (bad format, no mapping)."""
+
+
+class RowError(ValueError):
+    """Raised for one row that is rejected; the import carries on."""
+
+
+def guess_format(filename):
+    """Return 'csv', 'tsv' or 'apkg' from a file name, or None."""
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension in ('txt', 'tab'):
+        return 'tsv'
+    return extension if extension in FORMATS else None
+
+
+def _raise_field_limit():
+    # The csv default (128 KiB) would reject long answers before we can
+    global _csv_limit_raised
+    if not _csv_limit_raised:
+        csv.field_size_limit(MAX_TEXT_LENGTH * 4)
+        _csv_limit_raised = True
+
+
+def _header_mapping(row):
+    """Map a header row to {field: column index}, or None if it is not a header."""
+    names = [name.strip().lower() for name in row]
+    mapping = {}
+    for field, aliases in FIELD_ALIASES.items():
+        for index, name in enumerate(names):
+            if name in aliases:
+                mapping[field] = index
+                break
+    if 'question' in mapping and 'answer' in mapping:
+        return mapping
+    return None
+
+
+def _columns_mapping(columns):
+    mapping = {}
+    for index, name in enumerate(columns):
+        if name in ('', 'skip'):
+            continue
+        if name not in FIELDS:
+            raise ImportFileError(f"Unknown column {name!r}; expected {', '.join(FIELDS)} or skip")
+        mapping[name] = index
+    if 'question' not in mapping or 'answer' not in mapping:
+        raise ImportFileError("columns must include question and answer")
+    return mapping
+
+
+def _card(values, subject, topic):
+    """Validate one card's fields and return the row to insert."""
+    question = (values.get('question') or '').strip()
+    answer = (values.get('answer') or '').strip()
+    if not question or not answer:
+        raise RowError('question and answer are required')
+    if len(question) > MAX_TEXT_LENGTH or len(answer) > MAX_TEXT_LENGTH:
+        raise RowError(f'question or answer longer than {MAX_TEXT_LENGTH} characters')
+    subject = (values.get('subject') or '').strip() or subject
+    topic = (values.get('topic') or '').strip() or topic
+    if len(subject) > MAX_NAME_LENGTH or len(topic) > MAX_NAME_LENGTH:
+        raise RowError(f'subject or topic longer than {MAX_NAME_LENGTH} characters')
+    return subject, topic, question, answer
+
+
+def read_delimited(text_stream, delimiter=',', columns=None,
+                   subject=DEFAULT_SUBJECT, topic=DEFAULT_TOPIC):
+    """Yield (line, card or None, error or None) for each row of a CSV/TSV stream.
+
+    Columns are mapped from a header row naming at least question and
+    answer, or from `columns` (a list of field names, 'skip' to ignore a
+    column). Without either, four or more columns are read as subject,
+    topic, question, answer and fewer as question, answer. Empty subjects
+    and topics fall back to `subject` and `topic`.
+    """
+    _raise_field_limit()
+    reader = csv.reader(text_stream, delimiter=delimiter)
+    mapping = _columns_mapping(columns) if columns else None
+    first = True
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield reader.line_num, None, f'unreadable row: {e}'
+            continue
+        if not row or not any(field.strip() for field in row):
+            continue
+        if first:
+            first = False
+            header = _header_mapping(row)
+            if header is not None and mapping is None:
+                mapping = header
+                continue
+            if mapping is None:
+                mapping = _columns_mapping(
+                    FIELDS if len(row) >= 4 else ('question', 'answer'))
+        if len(row) <= max(mapping.values()):
+            yield reader.line_num, None, f'expected {max(mapping.values()) + 1} columns, got {len(row)}'
+            continue
+        try:
+            values = {field: row[index] for field, index in mapping.items()}
+            yield reader.line_num, _card(values, subject, topic), None
+        except RowError as e:
+            yield reader.line_num, None, str(e)
+
+
+def _anki_text(field):
+    """Turn an Anki field's HTML into plain text (line breaks kept, markup and media dropped)."""
+    text = re.sub(r'<br\s*/?>|</div>|</p>', '\n', field, flags=re.IGNORECASE)
+    text = re.sub(r'\[sound:[^\]]*\]', '', text)
+    text = re.sub(r'<[^>]+>', '', text)
+    return html.unescape(text).replace('\xa0', ' ').strip()
+
+
+def _extract_collection(archive, directory):
+    """Copy the newest collection database out of an .apkg without reading it into memory."""
+    names = set(archive.namelist())
+    for name in ANKI_COLLECTIONS:
+        if name in names:
+            break
+    else:
+        raise ImportFileError('not an Anki package: no collection database inside')
+
+    path = os.path.join(directory, 'collection.db')
+    with archive.open(name) as source, open(path, 'wb') as dest:
+        if name.endswith('b'):
+            # Anki 2.1.50+ compresses the collection with zstd
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportFileError(
+                    'this .apkg needs the zstandard package; install it, or export '
+                    'from Anki with "Support older Anki versions" checked') from None
+            zstandard.ZstdDecompressor().copy_stream(source, dest)
+        else:
+            shutil.copyfileobj(source, dest)
+    return path
+
+
+def _anki_decks(conn):
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if 'decks' in tables:
+        # Schema 18: one row per deck, path components separated by \x1f
+        return {deck_id: name.replace(ANKI_FIELD_SEPARATOR, '::')
+                for deck_id, name in conn.execute('SELECT id, name FROM decks')}
+    decks = json.loads(conn.execute('SELECT decks FROM col').fetchone()[0])
+    return {int(deck_id): deck['name'] for deck_id, deck in decks.items()}
+
+
+def read_apkg(archive_file, subject=DEFAULT_SUBJECT, topic=DEFAULT_TOPIC):
+    """Yield (note id, card or None, error or None) for each note of an Anki package.
+
+    The first field is the question and the second the answer, converted
+    from HTML to text. The top-level deck becomes the subject and the rest
+    of the deck path the topic (`topic` for cards in a top-level deck).
+    """
+    try:
+        archive = zipfile.ZipFile(archive_file)
+    except zipfile.BadZipFile:
+        raise ImportFileError('not an Anki package: not a zip file') from None
+    with archive, tempfile.TemporaryDirectory() as directory:
+        conn = sqlite3.connect(_extract_collection(archive, directory))
+        try:
+            decks = _anki_decks(conn)
+            cursor = conn.execute(
+                '''SELECT notes.id, notes.flds, MIN(cards.did)
+                   FROM notes LEFT JOIN cards ON cards.nid = notes.id
+                   GROUP BY notes.id ORDER BY notes.id''')
+            while True:
+                rows = cursor.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                for note_id, fields, deck_id in rows:
+                    fields = fields.split(ANKI_FIELD_SEPARATOR)
+                    deck = decks.get(deck_id, '').split('::')
+                    values = {
+                        'subject': deck[0] if deck[0] != 'Default' else '',
+                        'topic': '::'.join(deck[1:]),
+                        'question': _anki_text(fields[0]),
+                        'answer': _anki_text(fields[1]) if len(fields) > 1 else '',
+                    }
+                    try:
+                        yield note_id, _card(values, subject, topic), None
+                    except RowError as e:
+                        yield note_id, None, str(e)
+        except sqlite3.DatabaseError as e:
+            raise ImportFileError(f'unreadable Anki collection: {e}') from None
+        finally:
+            conn.close()
+
+
+@contextmanager
+def bulk_insert(conn):
+    """Drop the spaced_repetition insert triggers for a bulk load; the caller commits.
+
+    Yields whether insert_practices() can do the triggers' work with
+    set-based statements (see BULK_INSERT_PRACTICES). The triggers are
+    recreated on exit, also on error, in the caller's transaction, so other
+    connections never see them missing. Dropping and creating a trigger
+    changes the schema, so do it once per load, not once per chunk.
+    """
+    triggers = conn.execute(
+        """SELECT name, sql FROM sqlite_master
+           WHERE type = 'trigger' AND tbl_name = 'spaced_repetition'
+           AND sql LIKE '% AFTER INSERT ON %'"""
+    ).fetchall()
+    if sorted(name for name, _ in triggers) != sorted(BULK_INSERT_TRIGGERS):
+        yield False
+        return
+
+    if not conn.in_transaction:
+        # The sqlite3 module only opens the transaction before DML; without
+        # this the triggers would be dropped outside it and lost on rollback
+        conn.execute('BEGIN')
+    for sql in BULK_INSERT_STAGING:
+        conn.execute(sql)
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER {name}')
+    try:
+        yield True
+    finally:
+        for _, sql in triggers:
+            conn.execute(sql)
+
+
+def insert_practices(conn, rows, policy=DEFAULT_POLICY, bulk=None):
+    """Insert (subject, topic, question, answer, date) rows; the caller commits.
+
+    Duplicates of existing cards, and repeats within `rows`, are handled
+    by the duplicate `policy` (see dedup.py). Returns the number inserted.
+
+    Instead of running the insert triggers once per row, the rows are staged
+    in a temp table and their work is done with one set-based statement each.
+    `bulk` is the value yielded by an enclosing bulk_insert(); without one,
+    the call drops and recreates the triggers itself.
+    """
+    check_policy(policy)
+    if bulk is None:
+        with bulk_insert(conn) as bulk:
+            return insert_practices(conn, rows, policy, bulk)
+    if not bulk:
+        return sum(insert_practice(conn, *row, policy=policy)[0] == INSERTED for row in rows)
+
+    conn.execute('DELETE FROM import_staging')
+    conn.executemany('INSERT INTO import_staging VALUES (?, ?, ?, ?, ?, ?)',
+                     (row + (content_hash(*row[:3]),) for row in rows))
+    after = conn.execute(
+        "SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'spaced_repetition'"
+    ).fetchone()[0]
+    for sql in BULK_INSERT_PRACTICES:
+        conn.execute(sql, {'after': after, 'policy': policy})
+    inserted = conn.execute('SELECT COUNT(*) FROM import_staging').fetchone()[0]
+    conn.execute('DELETE FROM import_staging')
+    return inserted
+
+
+def import_cards(rows, write, chunk_size=CHUNK_SIZE, progress=None, policy=DEFAULT_POLICY):
+    """Insert the cards from a read_* generator in chunks; returns a report.
+
+    `write(fn)` must run fn(conn) in a transaction and commit it, e.g.
+    database.run_write. The whole import is one transaction, so the insert
+    triggers are dropped and recreated once (see bulk_insert()) and a
+    failed import leaves the deck as it was; `chunk_size` bounds the rows
+    held in memory at a time.
+    """
+    date = datetime.now().isoformat(timespec='seconds')
+    report = {'read': 0, 'imported': 0, 'duplicates': 0, 'rejected': 0, 'rejects': []}
+    started = time.perf_counter()
+    batch = []
+
+    def flush(conn, bulk):
+        inserted = insert_practices(conn, batch, policy, bulk)
+        report['imported'] += inserted
+        report['duplicates'] += len(batch) - inserted
+        batch.clear()
+        if progress:
+            progress(report)
+
+    def load(conn):
+        check_policy(policy)
+        with bulk_insert(conn) as bulk:
+            for line, card, error in rows:
+                report['read'] += 1
+                if error is not None:
+                    report['rejected'] += 1
+                    if len(report['rejects']) < MAX_REPORTED_REJECTS:
+                        report['rejects'].append({'line': line, 'error': error})
+                    continue
+                batch.append(card + (date,))
+                if len(batch) >= chunk_size:
+                    flush(conn, bulk)
+            if batch:
+                flush(conn, bulk)
+
+    write(load)
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    report['rows_per_s'] = round(report['imported'] / report['seconds']) if report['seconds'] else 0
+    return report
+
+
+def import_file(source, file_format, write, columns=None, subject=DEFAULT_SUBJECT,
+                topic=DEFAULT_TOPIC, encoding='utf-8-sig', chunk_size=CHUNK_SIZE, progress=None,
+                policy=DEFAULT_POLICY):
+    """Import a CSV, TSV or .apkg file (a path or a binary file object)."""
+    if file_format not in FORMATS:
+        raise ImportFileError(f"Unsupported format {file_format!r}; expected one of {', '.join(FORMATS)}")
+    if policy not in POLICIES:
+        raise ImportFileError(f"Unknown duplicate policy {policy!r}; expected one of {', '.join(POLICIES)}")
+
+    if file_format == 'apkg':
+        return import_cards(read_apkg(source, subject, topic), write, chunk_size, progress, policy)
+
+    binary = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+    text = io.TextIOWrapper(binary, encoding=encoding, errors='replace', newline='')
+    try:
+        rows = read_delimited(text, ',' if file_format == 'csv' else '\t', columns, subject, topic)
+        return import_cards(rows, write, chunk_size, progress, policy)
+    finally:
+        # Leave a caller's stream open
+        text.detach()
+        if binary is not source:
+            binary.close()
+
+
+def main(argv=None):
+    from database import DATABASE_PATH, connect
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(
+        description='Import practice cards from a CSV/TSV file or an Anki .apkg deck.')
+    parser.add_argument('file', help='file to import')
+    parser.add_argument('--format', choices=FORMATS, default=None,
+                        help='file format (default: from the extension)')
+    parser.add_argument('--columns', default=None,
+                        help='comma-separated column fields for files without a header, '
+                             'e.g. question,answer or subject,topic,question,answer,skip')
+    parser.add_argument('--subject', default=DEFAULT_SUBJECT,
+                        help=f'subject for rows without one (default {DEFAULT_SUBJECT!r})')
+    parser.add_argument('--topic', default=DEFAULT_TOPIC,
+                        help=f'topic for rows without one (default {DEFAULT_TOPIC!r})')
+    parser.add_argument('--encoding', default='utf-8-sig')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='rows inserted per set-based statement')
+    parser.add_argument('--duplicates', choices=POLICIES, default=DEFAULT_POLICY,
+                        help='cards already in the deck: skip them, merge their answers '
+                             f'or allow copies (default {DEFAULT_POLICY})')
+    parser.add_argument('--db', default=DATABASE_PATH, help='database file')
+    args = parser.parse_args(argv)
+
+    file_format = args.format or guess_format(args.file)
+    if file_format is None:
+        parser.error('cannot tell the format from the file name; pass --format')
+    columns = [c.strip() for c in args.columns.split(',')] if args.columns else None
+
+    conn = connect(args.db)
+    migrate(conn)
+
+    def write(fn):
+        with conn:
+            return fn(conn)
+
+    def progress(report):
+        print(f"  {report['imported']:,} imported, {report['duplicates']:,} duplicates, "
+              f"{report['rejected']:,} rejected")
+
+    try:
+        report = import_file(args.file, file_format, write, columns, args.subject, args.topic,
+                             args.encoding, args.chunk_size, progress, args.duplicates)
+    except ImportFileError as e:
+        parser.exit(1, f'Import failed: {e}\n')
+    finally:
+        conn.close()
+
+    for reject in report['rejects']:
+        print(f"Rejected line {reject['line']}: {reject['error']}")
+    if report['rejected'] > len(report['rejects']):
+        print(f"... and {report['rejected'] - len(report['rejects'])} more rejected")
+    print(f"Imported {report['imported']:,} of {report['read']:,} rows in "
+          f"{report['seconds']:.2f}s ({report['rows_per_s']:,} rows/s), "
+          f"{report['duplicates']:,} duplicates, {report['rejected']:,} rejected")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import markdown
+
+import metrics
+from database import submit_write
+
+# Markdown settings used for practice answers. They are part of the cache
+# key, so changing them (or upgrading markdown) re-renders every answer.
+MARKDOWN_EXTENSIONS = []
+MARKDOWN_EXTENSION_CONFIGS = {}
+
+# Number of rendered answers kept in memory per process
+LRU_SIZE = 1024
+
+_CONFIG_KEY = json.dumps(
+    [markdown.__version__, MARKDOWN_EXTENSIONS, MARKDOWN_EXTENSION_CONFIGS],
+    sort_keys=True
+)
+
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+
+
+def content_key(text):
+    """Return the cache key for `text` under the current markdown config."""
+    digest = hashlib.sha256()
+    digest.update(_CONFIG_KEY.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _lru_get(key):
+    with _lru_lock:
+        html = _lru.get(key)
+        if html is not None:
+            _lru.move_to_end(key)
+        return html
+
+
+def _lru_put(key, html):
+    with _lru_lock:
+        _lru[key] = html
+        _lru.move_to_end(key)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def render_markdown(conn, text):
+    """Render `text` to HTML, using the in-process LRU and the rendered_markdown table.
+
+    Only a miss in both caches parses the markdown; the result is then stored
+    in both so later views (and other processes) get it with a lookup. The
+    table is filled in the background: a read never waits for that write.
+    """
+    key = content_key(text)
+    html = _lru_get(key)
+    if html is not None:
+        metrics.markdown_lookup('memory')
+        return html
+
+    row = conn.execute('SELECT html FROM rendered_markdown WHERE hash = ?',
+                       (key,)).fetchone()
+    if row is not None:
+        metrics.markdown_lookup('database')
+        html = row[0]
+    else:
+        metrics.markdown_lookup('render')
+        started = time.perf_counter()
+        html = markdown.markdown(text, extensions=MARKDOWN_EXTENSIONS,
+                                 extension_configs=MARKDOWN_EXTENSION_CONFIGS)
+        metrics.markdown_rendered(time.perf_counter() - started)
+        submit_write(lambda write_conn: write_conn.execute(
+            'INSERT OR REPLACE INTO rendered_markdown (hash, html) VALUES (?, ?)', (key, html)))
+
+    _lru_put(key, html)
+    return html
+
+
+def invalidate(conn, text):
+    """Drop the cached rendering of `text`, e.g. after an answer is edited."""
+    key = content_key(text)
+    with _lru_lock:
+        _lru.pop(key, None)
+    conn.execute('DELETE FROM rendered_markdown WHERE hash = ?', (key,))
@@ -0,0 +1,342 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from flask import Response, request
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1, 2.5, 5, 10)
+# Upper bounds of the per-request query and fetched-row count histograms
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+# SQLite VM instructions between progress handler calls
+PROGRESS_STEPS = 1000
+# Statement labels longer than this are cut, to keep /metrics readable
+MAX_STATEMENT_LABEL = 160
+# Defaults for app.config['METRICS_SLOW_QUERY_MS'] / ['METRICS_SLOW_REQUEST_MS']
+SLOW_QUERY_MS = 100
+SLOW_REQUEST_MS = 500
+
+# Set by init_app() when app.config['METRICS'] is on. Everything below is a
+# no-op while it is False, and connections are plain sqlite3 connections.
+enabled = False
+slow_query_seconds = SLOW_QUERY_MS / 1000
+slow_request_seconds = SLOW_REQUEST_MS / 1000
+
+_lock = threading.Lock()
+# Query count, rows and VM steps of the request running on this thread
+_current = threading.local()
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """A Prometheus counter with a fixed set of label names."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, labels=(), amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield f'{self.name}{_format_labels(self.labels, labels)} {value:g}'
+
+
+class Histogram:
+    """A Prometheus histogram with fixed buckets and label names."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self.values = {}
+
+    def observe(self, labels, value):
+        with _lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self):
+        for labels, series in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, series):
+                le = _format_labels(self.labels, labels, 'le="%g"' % bound)
+                yield f'{self.name}_bucket{le} {count}'
+            le = _format_labels(self.labels, labels, 'le="+Inf"')
+            yield f'{self.name}_bucket{le} {series[-2]}'
+            yield f'{self.name}_sum{_format_labels(self.labels, labels)} {series[-1]:g}'
+            yield f'{self.name}_count{_format_labels(self.labels, labels)} {series[-2]}'
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request.',
+    ('method', 'route', 'status'))
+REQUEST_QUERIES = Histogram(
+    'http_request_sql_queries', 'SQL statements executed per request.',
+    ('route',), COUNT_BUCKETS)
+REQUEST_ROWS = Histogram(
+    'http_request_sql_rows', 'Rows fetched from SQLite per request.',
+    ('route',), COUNT_BUCKETS)
+REQUEST_STEPS = Counter(
+    'http_request_sqlite_vm_steps_total',
+    f'SQLite VM instructions run for requests, counted in units of {PROGRESS_STEPS}.',
+    ('route',))
+SLOW_REQUESTS = Counter(
+    'http_slow_requests_total', 'Requests slower than METRICS_SLOW_REQUEST_MS.', ('route',))
+STATEMENTS = Counter(
+    'sqlite_statements_total', 'Executions of each SQL statement.', ('statement',))
+STATEMENT_SECONDS = Counter(
+    'sqlite_statement_seconds_total',
+    'Time spent executing each SQL statement and fetching its rows.', ('statement',))
+STATEMENT_ROWS = Counter(
+    'sqlite_statement_rows_total', 'Rows fetched from each SQL statement.', ('statement',))
+SLOW_QUERIES = Counter(
+    'sqlite_slow_queries_total', 'Statements slower than METRICS_SLOW_QUERY_MS.',
+    ('statement',))
+MARKDOWN_SECONDS = Histogram(
+    'markdown_render_duration_seconds', 'Time spent rendering markdown answers.')
+MARKDOWN_LOOKUPS = Counter(
+    'markdown_cache_lookups_total',
+    'Rendered-answer lookups by where they were found: memory, database or render.',
+    ('result',))
+QUERY_CACHE_LOOKUPS = Counter(
+    'query_cache_lookups_total',
+    'Query-result cache lookups by outcome: hits, misses or uncached.', ('result',))
+
+REGISTRY = [REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_ROWS, REQUEST_STEPS, SLOW_REQUESTS,
+            STATEMENTS, STATEMENT_SECONDS, STATEMENT_ROWS, SLOW_QUERIES,
+            MARKDOWN_SECONDS, MARKDOWN_LOOKUPS, QUERY_CACHE_LOOKUPS]
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    """Normalize SQL into a metric label: one line, IN-lists folded to `?...`."""
+    label = re.sub(r'\?(\s*,\s*\?)+', '?...', ' '.join(sql.split()))
+    if len(label) > MAX_STATEMENT_LABEL:
+        label = label[:MAX_STATEMENT_LABEL - 3] + '...'
+    return label
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """A cursor that records the time and rows of its current statement."""
+
+    _statement = None
+    _elapsed = 0.0
+    _reported_slow = False
+
+    def _start(self, sql):
+        self._statement = statement_label(sql)
+        self._elapsed = 0.0
+        self._reported_slow = False
+        STATEMENTS.inc((self._statement,))
+        if hasattr(_current, 'queries'):
+            _current.queries += 1
+
+    def _record(self, seconds, rows):
+        self._elapsed += seconds
+        STATEMENT_SECONDS.inc((self._statement,), seconds)
+        if rows:
+            STATEMENT_ROWS.inc((self._statement,), rows)
+            if hasattr(_current, 'rows'):
+                _current.rows += rows
+        if self._elapsed >= slow_query_seconds and not self._reported_slow:
+            self._reported_slow = True
+            SLOW_QUERIES.inc((self._statement,))
+            logger.warning('Slow query (%.1f ms): %s', self._elapsed * 1000, self._statement)
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._record(time.perf_counter() - started, 0)
+
+    def execute(self, sql, parameters=()):
+        self._start(sql)
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql)
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        self._start(sql_script)
+        return self._timed(super().executescript, sql_script)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._record(time.perf_counter() - started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._record(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._record(time.perf_counter() - started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._record(time.perf_counter() - started, 0)
+            raise
+        self._record(time.perf_counter() - started, 1)
+        return row
+
+
+def _count_steps():
+    if hasattr(_current, 'steps'):
+        _current.steps += 1
+    return 0
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """A connection whose cursors (including conn.execute()) are instrumented.
+
+    The progress handler counts VM instructions, which shows the work done
+    inside SQLite even when a statement returns a single row (COUNT(*)).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_progress_handler(_count_steps, PROGRESS_STEPS)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connection_factory():
+    """Return the sqlite3 connection class to use: instrumented only when enabled."""
+    return InstrumentedConnection if enabled else sqlite3.Connection
+
+
+def markdown_lookup(result):
+    """Count a rendered-answer lookup ('memory', 'database' or 'render')."""
+    if enabled:
+        MARKDOWN_LOOKUPS.inc((result,))
+
+
+def query_cache_lookup(result):
+    """Count a query-result cache lookup ('hits', 'misses' or 'uncached')."""
+    if enabled:
+        QUERY_CACHE_LOOKUPS.inc((result,))
+
+
+def markdown_rendered(seconds):
+    """Record the time of one markdown render."""
+    if enabled:
+        MARKDOWN_SECONDS.observe((), seconds)
+
+
+def _before_request():
+    _current.queries = 0
+    _current.rows = 0
+    _current.steps = 0
+    _current.started = time.perf_counter()
+
+
+def _after_request(response):
+    started = getattr(_current, 'started', None)
+    if started is None:
+        return response
+    seconds = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe((request.method, route, str(response.status_code)), seconds)
+    REQUEST_QUERIES.observe((route,), _current.queries)
+    REQUEST_ROWS.observe((route,), _current.rows)
+    if _current.steps:
+        REQUEST_STEPS.inc((route,), _current.steps)
+    if seconds >= slow_request_seconds:
+        SLOW_REQUESTS.inc((route,))
+        logger.warning('Slow request (%.1f ms, %d queries, %d rows): %s %s',
+                       seconds * 1000, _current.queries, _current.rows,
+                       request.method, request.full_path)
+    del _current.queries, _current.rows, _current.steps, _current.started
+    return response
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for metric in REGISTRY:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Clear every recorded value."""
+    with _lock:
+        for metric in REGISTRY:
+            metric.values.clear()
+
+
+def metrics_view():
+    return Response(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app):
+    """Turn on instrumentation and /metrics if app.config['METRICS'] is set.
+
+    Call before the first request, so every pooled connection is created
+    instrumented. With METRICS off nothing is registered at all.
+    """
+    global enabled, slow_query_seconds, slow_request_seconds
+    if not app.config.get('METRICS'):
+        return
+    enabled = True
+    slow_query_seconds = app.config.get('METRICS_SLOW_QUERY_MS', SLOW_QUERY_MS) / 1000
+    slow_request_seconds = app.config.get('METRICS_SLOW_REQUEST_MS', SLOW_REQUEST_MS) / 1000
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
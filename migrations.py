@@ -0,0 +1,654 @@
+import sqlite3
+
+import dedup
+
+# Recomputes the subject/topic lookup ids and card counts from the card text.
+# Used to backfill migration 6 and after bulk loads (see DERIVED_REBUILDS).
+FACET_REBUILDS = [
+    'INSERT OR IGNORE INTO subjects (name) SELECT DISTINCT subject FROM spaced_repetition',
+    'INSERT OR IGNORE INTO topics (name) SELECT DISTINCT topic FROM spaced_repetition',
+    '''
+    UPDATE spaced_repetition
+    SET subject_id = (SELECT id FROM subjects WHERE name = spaced_repetition.subject),
+        topic_id = (SELECT id FROM topics WHERE name = spaced_repetition.topic)
+    ''',
+    '''
+    UPDATE subjects SET card_count =
+        (SELECT COUNT(*) FROM spaced_repetition WHERE subject_id = subjects.id)
+    ''',
+    '''
+    UPDATE topics SET card_count =
+        (SELECT COUNT(*) FROM spaced_repetition WHERE topic_id = topics.id)
+    ''',
+    'DELETE FROM subjects WHERE card_count = 0',
+    'DELETE FROM topics WHERE card_count = 0',
+]
+
+# Cards without a due time are due on their (local time) date
+DUE_BACKFILL = '''
+    UPDATE spaced_repetition SET due = CAST(strftime('%s', date, 'utc') AS INTEGER)
+    WHERE due IS NULL
+'''
+
+
+def epoch_sql(column):
+    """SQL for the epoch seconds of the TEXT date in `column`.
+
+    SQLite's CURRENT_TIMESTAMP default writes 'YYYY-MM-DD HH:MM:SS' in UTC;
+    every other date the app writes is local ISO time ('YYYY-MM-DDTHH:MM:SS').
+    """
+    return (f"CAST(CASE WHEN {column} LIKE '____-__-__ __:__:__' THEN strftime('%s', {column}) "
+            f"ELSE strftime('%s', {column}, 'utc') END AS INTEGER)")
+
+
+# Rewrites the UTC CURRENT_TIMESTAMP dates as local ISO time, so the text
+# dates have one shape, then fills in the epoch columns the app sorts and
+# filters on. Unreviewed cards with such a date become due at that time.
+# Used to backfill migration 14 and after bulk loads (see DERIVED_REBUILDS).
+TIMESTAMP_BACKFILLS = [
+    '''
+    UPDATE spaced_repetition
+    SET due = CASE WHEN last_review IS NULL THEN CAST(strftime('%s', date) AS INTEGER) ELSE due END,
+        date = strftime('%Y-%m-%dT%H:%M:%S',
+                        CASE WHEN last_review IS NULL THEN strftime('%s', date) ELSE due END,
+                        'unixepoch', 'localtime')
+    WHERE date LIKE '____-__-__ __:__:__'
+    ''',
+    '''
+    UPDATE notes SET date = strftime('%Y-%m-%dT%H:%M:%S', date, 'localtime')
+    WHERE date LIKE '____-__-__ __:__:__'
+    ''',
+    f'UPDATE spaced_repetition SET due = {epoch_sql("date")} WHERE due IS NULL',
+    f'UPDATE notes SET date_ts = {epoch_sql("date")} WHERE date_ts IS NULL',
+]
+
+# Recounts the notes per day from the notes table. Notes without a date
+# are counted under ''. Used to backfill migration 12 and after bulk loads.
+NOTE_DAY_REBUILDS = [
+    'DELETE FROM note_days',
+    '''
+    INSERT INTO note_days (day, note_count)
+    SELECT COALESCE(day, ''), COUNT(*) FROM notes GROUP BY COALESCE(day, '')
+    ''',
+]
+
+# Tables whose changes bump each data_versions counter. Subjects and
+# topics are only written by the practice triggers, so 'facets' moves only
+# when the filter dropdowns would change.
+DATA_VERSION_TABLES = {
+    'items': 'items',
+    'notes': 'notes',
+    'spaced_repetition': 'practices',
+    'subjects': 'facets',
+    'topics': 'facets',
+}
+
+# Counters start at a random value, so a restored or recreated database
+# never reuses a version that a running app still has cached
+DATA_VERSION_SEED = '''
+    INSERT OR REPLACE INTO data_versions (name, version)
+    SELECT name, abs(random() % 1000000000000) FROM (
+        SELECT 'items' AS name UNION SELECT 'notes'
+        UNION SELECT 'practices' UNION SELECT 'facets'
+    )
+'''
+
+# A data_versions row that no trigger bumps: it only changes when
+# DATA_VERSION_RESEED runs, after a restore or bulk load. Caches patched
+# from the changelog reload in full when it moves.
+RESEED_GENERATION = 'generation'
+
+# After a bulk load: new random versions
+DATA_VERSION_RESEED = 'UPDATE data_versions SET version = abs(random() % 1000000000000)'
+
+
+def data_version_triggers(assignments):
+    """Triggers applying `assignments` to a table's data_versions row on every write."""
+    return [
+        f'''
+        CREATE TRIGGER {table}_version_{suffix} AFTER {event} ON {table} BEGIN
+            UPDATE data_versions SET {assignments} WHERE name = '{name}';
+        END
+        '''
+        for table, name in DATA_VERSION_TABLES.items()
+        for suffix, event in (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE'))
+    ]
+
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Each migration is (version, description, steps) where a step is either an
+# SQL statement or a callable taking the connection. Never edit a migration
+# that has shipped; append a new one instead.
+MIGRATIONS = [
+    (1, 'Create base tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            stars INTEGER DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS spaced_repetition (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subject TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            stars INTEGER DEFAULT 0
+        )
+        ''',
+    ]),
+    (2, 'Add indexes for the practice and notes filter paths', [
+        # ORDER BY date, stars, id (id is the rowid, so it is implied)
+        'CREATE INDEX IF NOT EXISTS idx_practice_date_stars ON spaced_repetition (date, stars)',
+        # subject = ? [AND topic = ?] ... ORDER BY date, stars
+        'CREATE INDEX IF NOT EXISTS idx_practice_subject_topic_date_stars ON spaced_repetition (subject, topic, date, stars)',
+        # topic = ? ... ORDER BY date, stars
+        'CREATE INDEX IF NOT EXISTS idx_practice_topic_date_stars ON spaced_repetition (topic, date, stars)',
+        # stars = ? ... ORDER BY date
+        'CREATE INDEX IF NOT EXISTS idx_practice_stars_date ON spaced_repetition (stars, date)',
+        # date before/after/on filters and the home page sort
+        'CREATE INDEX IF NOT EXISTS idx_notes_date_stars ON notes (date, stars)',
+    ]),
+    (3, 'Add FTS5 full-text indexes for practices and notes', [
+        # External-content tables: the text lives only in the base tables
+        '''
+        CREATE VIRTUAL TABLE practice_fts USING fts5(
+            question, answer, subject, topic,
+            content='spaced_repetition', content_rowid='id',
+            prefix='2 3'
+        )
+        ''',
+        '''
+        CREATE VIRTUAL TABLE notes_fts USING fts5(
+            text,
+            content='notes', content_rowid='id',
+            prefix='2 3'
+        )
+        ''',
+        # Keep the indexes in sync with the base tables
+        '''
+        CREATE TRIGGER practice_fts_ai AFTER INSERT ON spaced_repetition BEGIN
+            INSERT INTO practice_fts (rowid, question, answer, subject, topic)
+            VALUES (new.id, new.question, new.answer, new.subject, new.topic);
+        END
+        ''',
+        '''
+        CREATE TRIGGER practice_fts_ad AFTER DELETE ON spaced_repetition BEGIN
+            INSERT INTO practice_fts (practice_fts, rowid, question, answer, subject, topic)
+            VALUES ('delete', old.id, old.question, old.answer, old.subject, old.topic);
+        END
+        ''',
+        '''
+        CREATE TRIGGER practice_fts_au AFTER UPDATE OF question, answer, subject, topic ON spaced_repetition BEGIN
+            INSERT INTO practice_fts (practice_fts, rowid, question, answer, subject, topic)
+            VALUES ('delete', old.id, old.question, old.answer, old.subject, old.topic);
+            INSERT INTO practice_fts (rowid, question, answer, subject, topic)
+            VALUES (new.id, new.question, new.answer, new.subject, new.topic);
+        END
+        ''',
+        '''
+        CREATE TRIGGER notes_fts_ai AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts (rowid, text) VALUES (new.id, new.text);
+        END
+        ''',
+        '''
+        CREATE TRIGGER notes_fts_ad AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        END
+        ''',
+        '''
+        CREATE TRIGGER notes_fts_au AFTER UPDATE OF text ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            INSERT INTO notes_fts (rowid, text) VALUES (new.id, new.text);
+        END
+        ''',
+        # Index the rows that already exist
+        "INSERT INTO practice_fts (practice_fts) VALUES ('rebuild')",
+        "INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')",
+    ]),
+    (4, 'Add persistent cache for rendered markdown answers', [
+        # hash is sha256 of the markdown config plus the answer text
+        '''
+        CREATE TABLE rendered_markdown (
+            hash TEXT PRIMARY KEY,
+            html TEXT NOT NULL
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (5, 'Track changed and deleted rows for incremental backups', [
+        # One entry per changed row, holding only its latest change: a
+        # REPLACE removes the old entry and appends a new one with a higher
+        # seq, so the table never grows past the number of rows touched.
+        '''
+        CREATE TABLE changelog (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('upsert', 'delete')),
+            UNIQUE (table_name, row_id)
+        )
+        ''',
+    ] + [
+        f'''
+        CREATE TRIGGER {table}_changelog_{suffix} AFTER {event} ON {table} BEGIN
+            INSERT OR REPLACE INTO changelog (table_name, row_id, op)
+            VALUES ('{table}', {row}.id, '{op}');
+        END
+        '''
+        for table in ('items', 'notes', 'spaced_repetition')
+        for suffix, event, row, op in (
+            ('ai', 'INSERT', 'new', 'upsert'),
+            ('au', 'UPDATE', 'new', 'upsert'),
+            ('ad', 'DELETE', 'old', 'delete'),
+        )
+    ]),
+    (6, 'Dictionary-encode subjects and topics with card counts', [
+        # Tiny lookup tables that feed the filter dropdowns; card_count is
+        # maintained by the triggers below and rows are removed at zero
+        '''
+        CREATE TABLE subjects (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            card_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE topics (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            card_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        'ALTER TABLE spaced_repetition ADD COLUMN subject_id INTEGER REFERENCES subjects (id)',
+        'ALTER TABLE spaced_repetition ADD COLUMN topic_id INTEGER REFERENCES topics (id)',
+        '''
+        CREATE TRIGGER practice_facets_ai AFTER INSERT ON spaced_repetition BEGIN
+            INSERT OR IGNORE INTO subjects (name) VALUES (new.subject);
+            INSERT OR IGNORE INTO topics (name) VALUES (new.topic);
+            UPDATE subjects SET card_count = card_count + 1 WHERE name = new.subject;
+            UPDATE topics SET card_count = card_count + 1 WHERE name = new.topic;
+            UPDATE spaced_repetition
+            SET subject_id = (SELECT id FROM subjects WHERE name = new.subject),
+                topic_id = (SELECT id FROM topics WHERE name = new.topic)
+            WHERE id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER practice_facets_au AFTER UPDATE OF subject, topic ON spaced_repetition
+        WHEN old.subject IS NOT new.subject OR old.topic IS NOT new.topic BEGIN
+            UPDATE subjects SET card_count = card_count - 1 WHERE id = old.subject_id;
+            UPDATE topics SET card_count = card_count - 1 WHERE id = old.topic_id;
+            DELETE FROM subjects WHERE id = old.subject_id AND card_count <= 0;
+            DELETE FROM topics WHERE id = old.topic_id AND card_count <= 0;
+            INSERT OR IGNORE INTO subjects (name) VALUES (new.subject);
+            INSERT OR IGNORE INTO topics (name) VALUES (new.topic);
+            UPDATE subjects SET card_count = card_count + 1 WHERE name = new.subject;
+            UPDATE topics SET card_count = card_count + 1 WHERE name = new.topic;
+            UPDATE spaced_repetition
+            SET subject_id = (SELECT id FROM subjects WHERE name = new.subject),
+                topic_id = (SELECT id FROM topics WHERE name = new.topic)
+            WHERE id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER practice_facets_ad AFTER DELETE ON spaced_repetition BEGIN
+            UPDATE subjects SET card_count = card_count - 1 WHERE id = old.subject_id;
+            UPDATE topics SET card_count = card_count - 1 WHERE id = old.topic_id;
+            DELETE FROM subjects WHERE id = old.subject_id AND card_count <= 0;
+            DELETE FROM topics WHERE id = old.topic_id AND card_count <= 0;
+        END
+        ''',
+    ] + FACET_REBUILDS + [
+        # Subject/topic filters now compare integer ids
+        'DROP INDEX IF EXISTS idx_practice_subject_topic_date_stars',
+        'DROP INDEX IF EXISTS idx_practice_topic_date_stars',
+        'CREATE INDEX idx_practice_subject_topic_date_stars ON spaced_repetition (subject_id, topic_id, date, stars)',
+        'CREATE INDEX idx_practice_topic_date_stars ON spaced_repetition (topic_id, date, stars)',
+    ]),
+    (7, 'Add scheduler state and an indexed due time to practices', [
+        'ALTER TABLE spaced_repetition ADD COLUMN ease REAL NOT NULL DEFAULT 2.5',
+        'ALTER TABLE spaced_repetition ADD COLUMN stability REAL',
+        'ALTER TABLE spaced_repetition ADD COLUMN difficulty REAL',
+        'ALTER TABLE spaced_repetition ADD COLUMN interval_days REAL NOT NULL DEFAULT 0',
+        'ALTER TABLE spaced_repetition ADD COLUMN reps INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE spaced_repetition ADD COLUMN lapses INTEGER NOT NULL DEFAULT 0',
+        # Epoch seconds of the last review and of the next due time
+        'ALTER TABLE spaced_repetition ADD COLUMN last_review INTEGER',
+        'ALTER TABLE spaced_repetition ADD COLUMN due INTEGER',
+        # Cards written without scheduler state are due on their date
+        '''
+        CREATE TRIGGER practice_due_ai AFTER INSERT ON spaced_repetition
+        WHEN new.due IS NULL BEGIN
+            UPDATE spaced_repetition SET due = CAST(strftime('%s', new.date, 'utc') AS INTEGER)
+            WHERE id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER practice_due_au AFTER UPDATE OF date ON spaced_repetition
+        WHEN new.due IS old.due BEGIN
+            UPDATE spaced_repetition SET due = CAST(strftime('%s', new.date, 'utc') AS INTEGER)
+            WHERE id = new.id;
+        END
+        ''',
+        DUE_BACKFILL,
+        'CREATE INDEX idx_practice_due ON spaced_repetition (due)',
+    ]),
+    (8, 'Record applied review events for idempotent batch sync', [
+        '''
+        CREATE TABLE review_log (
+            idempotency_key TEXT PRIMARY KEY,
+            card_id INTEGER NOT NULL,
+            grade INTEGER,
+            stars INTEGER,
+            days INTEGER,
+            client_ts INTEGER NOT NULL,
+            applied_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX idx_review_log_applied_at ON review_log (applied_at)',
+    ]),
+    (9, 'Count changes per data set for caches keyed on data version', [
+        '''
+        CREATE TABLE data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        DATA_VERSION_SEED,
+    ] + data_version_triggers('version = version + 1')),
+    (10, 'Record when each data set last changed, for Last-Modified headers', [
+        'ALTER TABLE data_versions ADD COLUMN changed_at INTEGER',
+        "UPDATE data_versions SET changed_at = CAST(strftime('%s', 'now') AS INTEGER)",
+    ] + [
+        f'DROP TRIGGER {table}_version_{suffix}'
+        for table in DATA_VERSION_TABLES
+        for suffix in ('ai', 'au', 'ad')
+    ] + data_version_triggers(
+        "version = version + 1, changed_at = CAST(strftime('%s', 'now') AS INTEGER)")),
+    (11, 'Add indexed content hashes to find duplicate cards and notes', [
+        'ALTER TABLE spaced_repetition ADD COLUMN content_hash TEXT',
+        'ALTER TABLE notes ADD COLUMN content_hash TEXT',
+    ] + dedup.CONTENT_HASH_BACKFILL + [
+        'CREATE INDEX idx_practice_content_hash ON spaced_repetition (content_hash)',
+        'CREATE INDEX idx_notes_content_hash ON notes (content_hash)',
+        # A content edit that does not set the hash (another tool) clears
+        # it, and the next backfill rehashes the row
+        '''
+        CREATE TRIGGER practice_hash_au AFTER UPDATE OF subject, topic, question ON spaced_repetition
+        WHEN new.content_hash IS old.content_hash BEGIN
+            UPDATE spaced_repetition SET content_hash = NULL WHERE id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER notes_hash_au AFTER UPDATE OF text ON notes
+        WHEN new.content_hash IS old.content_hash BEGIN
+            UPDATE notes SET content_hash = NULL WHERE id = new.id;
+        END
+        ''',
+    ]),
+    (12, 'Bucket notes by day for indexed sorting, paging and counting', [
+        # The calendar day of the ISO timestamp. It is a prefix of date, so
+        # it sorts like DATE(date) did, and the index can serve the sort.
+        'ALTER TABLE notes ADD COLUMN day TEXT GENERATED ALWAYS AS (substr(date, 1, 10)) VIRTUAL',
+        'DROP INDEX IF EXISTS idx_notes_date_stars',
+        # ORDER BY day ASC|DESC, stars, id (id is the rowid, so it is implied);
+        # newest-first keeps stars ascending, so it needs its own index
+        'CREATE INDEX idx_notes_day_stars ON notes (day, stars)',
+        'CREATE INDEX idx_notes_day_desc_stars ON notes (day DESC, stars)',
+        # Notes per day, maintained by the triggers below and removed at
+        # zero, so totals and date-filtered counts never scan the notes
+        '''
+        CREATE TABLE note_days (
+            day TEXT PRIMARY KEY,
+            note_count INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TRIGGER notes_days_ai AFTER INSERT ON notes BEGIN
+            INSERT INTO note_days (day, note_count) VALUES (COALESCE(new.day, ''), 1)
+            ON CONFLICT (day) DO UPDATE SET note_count = note_count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER notes_days_au AFTER UPDATE OF date ON notes
+        WHEN old.day IS NOT new.day BEGIN
+            UPDATE note_days SET note_count = note_count - 1 WHERE day = COALESCE(old.day, '');
+            DELETE FROM note_days WHERE day = COALESCE(old.day, '') AND note_count <= 0;
+            INSERT INTO note_days (day, note_count) VALUES (COALESCE(new.day, ''), 1)
+            ON CONFLICT (day) DO UPDATE SET note_count = note_count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER notes_days_ad AFTER DELETE ON notes BEGIN
+            UPDATE note_days SET note_count = note_count - 1 WHERE day = COALESCE(old.day, '');
+            DELETE FROM note_days WHERE day = COALESCE(old.day, '') AND note_count <= 0;
+        END
+        ''',
+    ] + NOTE_DAY_REBUILDS),
+    (13, 'Index practices by subject alone for the subject filter', [
+        # subject_id = ? ... ORDER BY date, stars; the subject/topic index
+        # has topic_id between them, so it could not serve the sort
+        'CREATE INDEX idx_practice_subject_date_stars ON spaced_repetition (subject_id, date, stars)',
+    ]),
+    (14, 'Sort and filter cards and notes on integer epoch timestamps', [
+        # Epoch seconds of the note's date, like due for cards. The text
+        # dates stay (local ISO time) for backups and older tools.
+        'ALTER TABLE notes ADD COLUMN date_ts INTEGER',
+        # Notes and cards written with only a text date get their epoch
+        # from it; the CURRENT_TIMESTAMP shape is UTC, not local time
+        f'''
+        CREATE TRIGGER notes_ts_ai AFTER INSERT ON notes
+        WHEN new.date_ts IS NULL BEGIN
+            UPDATE notes SET date_ts = {epoch_sql('new.date')} WHERE id = new.id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER notes_ts_au AFTER UPDATE OF date ON notes
+        WHEN new.date_ts IS old.date_ts BEGIN
+            UPDATE notes SET date_ts = {epoch_sql('new.date')} WHERE id = new.id;
+        END
+        ''',
+        'DROP TRIGGER practice_due_ai',
+        'DROP TRIGGER practice_due_au',
+        f'''
+        CREATE TRIGGER practice_due_ai AFTER INSERT ON spaced_repetition
+        WHEN new.due IS NULL BEGIN
+            UPDATE spaced_repetition SET due = {epoch_sql('new.date')} WHERE id = new.id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER practice_due_au AFTER UPDATE OF date ON spaced_repetition
+        WHEN new.due IS old.due BEGIN
+            UPDATE spaced_repetition SET due = {epoch_sql('new.date')} WHERE id = new.id;
+        END
+        ''',
+    ] + TIMESTAMP_BACKFILLS + [
+        # Cards are ordered by (due, stars, id); due is an integer, so the
+        # date filters are plain range seeks whatever the text shape
+        'DROP INDEX IF EXISTS idx_practice_date_stars',
+        'DROP INDEX IF EXISTS idx_practice_subject_topic_date_stars',
+        'DROP INDEX IF EXISTS idx_practice_topic_date_stars',
+        'DROP INDEX IF EXISTS idx_practice_stars_date',
+        'DROP INDEX IF EXISTS idx_practice_subject_date_stars',
+        # due <= ? ... ORDER BY due, stars is a prefix of the first index
+        'DROP INDEX IF EXISTS idx_practice_due',
+        'CREATE INDEX idx_practice_due_stars ON spaced_repetition (due, stars)',
+        'CREATE INDEX idx_practice_subject_topic_due_stars ON spaced_repetition (subject_id, topic_id, due, stars)',
+        'CREATE INDEX idx_practice_subject_due_stars ON spaced_repetition (subject_id, due, stars)',
+        'CREATE INDEX idx_practice_topic_due_stars ON spaced_repetition (topic_id, due, stars)',
+        'CREATE INDEX idx_practice_stars_due ON spaced_repetition (stars, due)',
+    ]),
+    (15, 'Add a data_versions row that moves only when the data is reseeded', [
+        f'''
+        INSERT OR IGNORE INTO data_versions (name, version)
+        VALUES ('{RESEED_GENERATION}', abs(random() % 1000000000000))
+        ''',
+    ]),
+    (16, 'Stop recording when each data set last changed (Last-Modified is not sent)', [
+        f'DROP TRIGGER {table}_version_{suffix}'
+        for table in DATA_VERSION_TABLES
+        for suffix in ('ai', 'au', 'ad')
+    ] + data_version_triggers('version = version + 1') + [
+        'ALTER TABLE data_versions DROP COLUMN changed_at',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Statements that recompute trigger-maintained data from the base tables.
+# Bulk loads drop the triggers for speed and run these afterwards, before
+# the triggers are recreated.
+DERIVED_REBUILDS = [
+    "INSERT INTO practice_fts (practice_fts) VALUES ('rebuild')",
+    "INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')",
+    'DELETE FROM subjects',
+    'DELETE FROM topics',
+] + FACET_REBUILDS + TIMESTAMP_BACKFILLS + NOTE_DAY_REBUILDS + dedup.CONTENT_HASH_BACKFILL + [
+    DATA_VERSION_RESEED]
+
+# The AFTER INSERT triggers on spaced_repetition, and the set-based
+# statements that do their work for a whole chunk of new cards. The importer
+# drops the triggers, runs these with the cards staged in the temp table
+# import_staging (BULK_INSERT_STAGING), :after = the last id before the
+# chunk and :policy = the duplicate policy (see dedup.py), and recreates the
+# triggers, all in one transaction. Keep both in step with the triggers:
+# when the trigger set differs, the importer falls back to plain inserts.
+BULK_INSERT_TRIGGERS = [
+    'practice_due_ai',
+    'practice_facets_ai',
+    'practice_fts_ai',
+    'spaced_repetition_changelog_ai',
+    'spaced_repetition_version_ai',
+]
+BULK_INSERT_STAGING = [
+    '''
+    CREATE TEMP TABLE IF NOT EXISTS import_staging (
+        subject TEXT, topic TEXT, question TEXT, answer TEXT, date TEXT, content_hash TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS temp.import_staging_subject ON import_staging (subject)',
+    'CREATE INDEX IF NOT EXISTS temp.import_staging_topic ON import_staging (topic)',
+    'CREATE INDEX IF NOT EXISTS temp.import_staging_hash ON import_staging (content_hash)',
+]
+BULK_INSERT_PRACTICES = [
+    # 'merge': the last copy's answer wins, in the chunk and in the deck
+    '''
+    UPDATE import_staging SET answer = (
+        SELECT answer FROM import_staging AS later
+        WHERE later.content_hash = import_staging.content_hash
+        ORDER BY later.rowid DESC LIMIT 1)
+    WHERE :policy = 'merge'
+    ''',
+    '''
+    UPDATE spaced_repetition SET answer = (
+        SELECT answer FROM import_staging
+        WHERE import_staging.content_hash = spaced_repetition.content_hash LIMIT 1)
+    WHERE :policy = 'merge'
+    AND content_hash IN (SELECT content_hash FROM import_staging)
+    AND answer IS NOT (
+        SELECT answer FROM import_staging
+        WHERE import_staging.content_hash = spaced_repetition.content_hash LIMIT 1)
+    ''',
+    # Unless duplicates are allowed, keep only the new cards' first copies
+    '''
+    DELETE FROM import_staging
+    WHERE :policy != 'allow' AND (
+        EXISTS (SELECT 1 FROM spaced_repetition
+                WHERE spaced_repetition.content_hash = import_staging.content_hash)
+        OR rowid > (SELECT MIN(rowid) FROM import_staging AS first
+                    WHERE first.content_hash = import_staging.content_hash))
+    ''',
+    'INSERT OR IGNORE INTO subjects (name) SELECT DISTINCT subject FROM import_staging',
+    'INSERT OR IGNORE INTO topics (name) SELECT DISTINCT topic FROM import_staging',
+    f'''
+    INSERT INTO spaced_repetition (subject, topic, question, answer, date, content_hash,
+                                   subject_id, topic_id, due)
+    SELECT staged.subject, staged.topic, staged.question, staged.answer, staged.date,
+           staged.content_hash, subjects.id, topics.id, {epoch_sql('staged.date')}
+    FROM import_staging AS staged
+    JOIN subjects ON subjects.name = staged.subject
+    JOIN topics ON topics.name = staged.topic
+    ORDER BY staged.rowid
+    ''',
+    '''
+    INSERT INTO practice_fts (rowid, question, answer, subject, topic)
+    SELECT id, question, answer, subject, topic FROM spaced_repetition WHERE id > :after
+    ''',
+    '''
+    INSERT OR REPLACE INTO changelog (table_name, row_id, op)
+    SELECT 'spaced_repetition', id, 'upsert' FROM spaced_repetition WHERE id > :after
+    ''',
+    '''
+    UPDATE subjects SET card_count = card_count +
+        (SELECT COUNT(*) FROM import_staging WHERE subject = subjects.name)
+    WHERE name IN (SELECT subject FROM import_staging)
+    ''',
+    '''
+    UPDATE topics SET card_count = card_count +
+        (SELECT COUNT(*) FROM import_staging WHERE topic = topics.name)
+    WHERE name IN (SELECT topic FROM import_staging)
+    ''',
+    "UPDATE data_versions SET version = version + 1 WHERE name = 'practices'",
+]
+
+
+def get_schema_version(conn):
+    """Return the schema version stored in the database file."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """Apply every pending migration up to `target` (default: latest).
+
+    Each migration runs in its own transaction together with the
+    user_version bump, so a failed migration leaves the schema untouched.
+    Returns the list of versions that were applied.
+    """
+    if target is None:
+        target = LATEST_VERSION
+
+    # Used by the content hash backfills, here and in DERIVED_REBUILDS
+    dedup.register(conn)
+    current = get_schema_version(conn)
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= current or version > target:
+            continue
+        try:
+            conn.execute('BEGIN')
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            # PRAGMA does not accept bound parameters
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+if __name__ == '__main__':
+    from database import DATABASE_PATH
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    print(f"Schema version before: {get_schema_version(conn)}")
+    migrate(conn)
+    print(f"Schema version now: {get_schema_version(conn)} (latest {LATEST_VERSION})")
+    conn.close()
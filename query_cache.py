@@ -0,0 +1,105 @@
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import metrics
+from database import data_version
+from migrations import DATA_VERSION_TABLES
+
+# Result sets kept in memory per process, and the most rows one may hold;
+# larger results are not cached
+LRU_SIZE = 1024
+MAX_ROWS = 1000
+
+# The data set (see migrations.DATA_VERSION_TABLES) whose writes can change
+# a query on each table. The per-day counts and full-text indexes are
+# written by the triggers of their base table. Queries on any other table
+# are never cached.
+TABLE_DATA_SETS = {
+    **DATA_VERSION_TABLES,
+    'note_days': 'notes',
+    'notes_fts': 'notes',
+    'practice_fts': 'practices',
+}
+
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)', re.IGNORECASE)
+
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'uncached': 0, 'evictions': 0}
+
+
+@lru_cache(maxsize=512)
+def _plan(sql):
+    """Return (normalized SQL, data sets it reads), or None if it is not cacheable."""
+    normalized = ' '.join(sql.split())
+    if not normalized.upper().startswith('SELECT'):
+        return None
+    names = set()
+    for table in _TABLE_PATTERN.findall(normalized):
+        name = TABLE_DATA_SETS.get(table.lower())
+        if name is None:
+            return None
+        names.add(name)
+    return normalized, tuple(sorted(names))
+
+
+def _count(result):
+    with _lru_lock:
+        _stats[result] += 1
+    metrics.query_cache_lookup(result)
+
+
+def fetchall(conn, sql, params=()):
+    """Return the rows of a SELECT, from the cache when nothing it reads changed.
+
+    Results are keyed on the normalized SQL, the parameters and the
+    data_version() counters of the tables the query reads, so any write to
+    those tables, by this process or another, makes the next call run the
+    query again. The returned list is shared: do not modify it.
+    """
+    plan = _plan(sql)
+    if plan is None:
+        _count('uncached')
+        return conn.execute(sql, params).fetchall()
+    normalized, names = plan
+    key = (normalized, tuple(params), data_version(conn, *names))
+    with _lru_lock:
+        rows = _lru.get(key)
+        if rows is not None:
+            _lru.move_to_end(key)
+    if rows is not None:
+        _count('hits')
+        return rows
+
+    _count('misses')
+    rows = conn.execute(sql, params).fetchall()
+    if len(rows) <= MAX_ROWS:
+        with _lru_lock:
+            _lru[key] = rows
+            _lru.move_to_end(key)
+            while len(_lru) > LRU_SIZE:
+                _lru.popitem(last=False)
+                _stats['evictions'] += 1
+    return rows
+
+
+def fetchone(conn, sql, params=()):
+    """Return the first row of a cached SELECT, or None."""
+    rows = fetchall(conn, sql, params)
+    return rows[0] if rows else None
+
+
+def stats():
+    """Return the hit/miss counters and the number of cached results."""
+    with _lru_lock:
+        return {**_stats, 'size': len(_lru)}
+
+
+def clear():
+    """Drop every cached result and reset the counters."""
+    with _lru_lock:
+        _lru.clear()
+        for name in _stats:
+            _stats[name] = 0
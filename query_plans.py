@@ -0,0 +1,249 @@
+import argparse
+import contextlib
+import html
+import io
+import itertools
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+from urllib.parse import urlencode
+
+from benchmark import DEFAULT_SEED, SCALES, deck_params, generate_deck
+
+DEFAULT_SCALE = '10k'
+# Tables whose plans are checked; the lookup and counter tables are tiny
+CHECKED_TABLES = ('spaced_repetition', 'notes')
+# Page links followed from the first page of each filter combination
+PAGINGS = ('first', 'next', 'previous', 'last', 'jump')
+# Page number used for the direct-jump (OFFSET) mode
+JUMP_PAGE = 3
+
+
+class PlanError(Exception):
+    """Raised when a route fails while its query plans are captured."""
+
+
+def practice_combinations(params):
+    """Yield every filter query string the /practice filter form can produce."""
+    for subject, topic, stars, date_filter, q in itertools.product(
+            (None, params['subject']), (None, params['topic']), (None, 3),
+            (None, 'before', 'after', 'on', 'due'), (None, params['word'])):
+        query = {}
+        if subject:
+            query['subject'] = subject
+        if topic:
+            query['topic'] = topic
+        if stars:
+            query['stars'] = stars
+        if date_filter:
+            query['filter'] = date_filter
+            if date_filter != 'due':
+                query['date'] = params['mid_date']
+        if q:
+            query['q'] = q
+        yield '/practice', query
+
+
+def note_combinations(params):
+    """Yield every filter query string the home page filter form can produce."""
+    for date_filter, sort, q in itertools.product(
+            (None, 'before', 'after', 'on'), ('asc', 'desc'), (None, params['word'])):
+        query = {}
+        if date_filter:
+            query['filter'] = date_filter
+            query['date'] = params['mid_date']
+        if sort != 'asc':
+            query['sort'] = sort
+        if q:
+            query['q'] = q
+        yield '/', query
+
+
+def _link(page, label):
+    match = re.search(r'<a href="([^"]+)"[^>]*>' + label + '</a>', page)
+    return html.unescape(match.group(1)) if match else None
+
+
+def plan_lines(conn, sql):
+    """Return EXPLAIN QUERY PLAN for `sql` as indented lines."""
+    rows = conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return lines
+
+
+def plan_problems(sql, lines):
+    """Return what is wrong with a plan.
+
+    Flagged: full table scans of the big tables, index walks that test a
+    WHERE clause row by row instead of seeking with it, and sorts that no
+    index serves. Walking an index for an unfiltered ORDER BY ... LIMIT or
+    COUNT(*) is fine, and so is sorting full-text matches, which FTS
+    returns in rank order.
+    """
+    problems = []
+    filtered = ' WHERE ' in sql.upper()
+    for line in lines:
+        detail = line.strip()
+        for table in CHECKED_TABLES:
+            if detail == f'SCAN {table}':
+                problems.append(f'full scan of {table}')
+            elif detail.startswith(f'SCAN {table} USING') and filtered:
+                problems.append(f'filter tested row by row: {detail}')
+        if detail.startswith('USE TEMP B-TREE FOR ORDER BY') and ' MATCH ' not in sql:
+            problems.append('ORDER BY sorted in a temp B-tree')
+    return problems
+
+
+def capture_plans(db_path, combinations):
+    """Request each combination and page through it with the test client.
+
+    Every SELECT the route runs on the big tables is recorded with its
+    bound values, and its EXPLAIN QUERY PLAN is taken on a separate
+    connection. Returns one result per (combination, paging) request.
+    """
+    import database
+    database.DATABASE_PATH = db_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import app
+    import fragment_cache
+    import query_cache
+
+    statements = []
+
+    def trace():
+        database.get_db_connection().set_trace_callback(statements.append)
+
+    app.before_request(trace)
+    client = app.test_client()
+    explain = database.connect(db_path)
+
+    def get(url):
+        # Nothing cached, so every query a request needs is run and traced
+        fragment_cache.clear()
+        query_cache.clear()
+        statements.clear()
+        response = client.get(url)
+        if response.status_code != 200:
+            raise PlanError(f'{url} returned {response.status_code}')
+        return response.get_data(as_text=True), list(statements)
+
+    results = []
+    try:
+        for path, query in combinations:
+            first = f'{path}?{urlencode(query)}' if query else path
+            first_page, first_statements = get(first)
+            next_url = _link(first_page, 'Next')
+            urls = {
+                'first': first,
+                'next': next_url,
+                'previous': _link(get(next_url)[0], 'Previous') if next_url else None,
+                'last': _link(first_page, 'Last'),
+                'jump': f"{path}?{urlencode({**query, 'page': JUMP_PAGE})}",
+            }
+            for paging in PAGINGS:
+                url = urls[paging]
+                if url is None:
+                    # One page only: there is no link to follow
+                    continue
+                recorded = first_statements if url == first else get(url)[1]
+                checked = []
+                for sql in recorded:
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    if not re.search(r'\b(' + '|'.join(CHECKED_TABLES) + r')\b', sql):
+                        continue
+                    lines = plan_lines(explain, sql)
+                    checked.append({'sql': ' '.join(sql.split()), 'plan': lines,
+                                    'problems': plan_problems(sql, lines)})
+                results.append({
+                    'route': path,
+                    'filters': query,
+                    'paging': paging,
+                    'url': url,
+                    'statements': checked,
+                    'ok': not any(s['problems'] for s in checked),
+                })
+    finally:
+        explain.close()
+    return results
+
+
+def print_report(results, verbose=False):
+    for result in results:
+        if result['ok'] and not verbose:
+            continue
+        print(f"{'ok  ' if result['ok'] else 'FAIL'}  {result['paging']:8}  {result['url']}")
+        for statement in result['statements']:
+            if statement['problems'] or verbose:
+                print(f"        {statement['sql']}")
+                for line in statement['plan']:
+                    print(f"          {line}")
+                for problem in statement['problems']:
+                    print(f"        -> {problem}")
+    failed = sum(1 for result in results if not result['ok'])
+    print(f"{len(results) - failed} of {len(results)} filter/paging combinations "
+          f"use indexes for every query; {failed} failed")
+
+
+def run(db_path=None, scale=DEFAULT_SCALE, seed=DEFAULT_SEED):
+    """Capture the plans on `db_path`, or on a generated deck; returns the results dict."""
+    workdir = None
+    if db_path is None:
+        workdir = tempfile.mkdtemp(prefix=f'plans-{scale}-')
+        db_path = os.path.join(workdir, 'app.db')
+        print(f"Generating {SCALES[scale]:,} cards and notes (seed {seed})")
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_deck(db_path, SCALES[scale], seed=seed)
+    try:
+        params = deck_params(db_path)
+        combinations = list(practice_combinations(params)) + list(note_combinations(params))
+        results = capture_plans(db_path, combinations)
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'sqlite': sqlite3.sqlite_version,
+        'cards': params['cards'],
+        'notes': params['notes'],
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check that every filter combination of /practice and / is served by '
+                    'indexes: no full table scans and no temp B-tree sorts.')
+    parser.add_argument('--db', default=None,
+                        help='database to check (default: generate a synthetic deck)')
+    parser.add_argument('--scale', choices=SCALES, default=DEFAULT_SCALE,
+                        help='size of the generated deck (default 10k)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--out', default=None,
+                        help='report file (default: bench/plans-<timestamp>.json)')
+    parser.add_argument('--verbose', action='store_true',
+                        help='print the plan of every combination, not just failures')
+    args = parser.parse_args(argv)
+
+    report = run(args.db, args.scale, args.seed)
+    print_report(report['results'], args.verbose)
+    out = args.out or os.path.join(
+        'bench', f"plans-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {out}")
+    return 0 if all(result['ok'] for result in report['results']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import argparse
+import math
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from reviews import INCREMENT_PRACTICE_DATE_SQL
+from scheduler import SECONDS_PER_DAY
+
+# A card may move by up to this fraction of its interval
+DEFAULT_TOLERANCE = 0.1
+MAX_TOLERANCE = 0.5
+# Days of histogram included in a preview
+PREVIEW_DAYS = 60
+
+
+def _today_start(now):
+    return datetime.fromtimestamp(now).replace(
+        hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+def _water_fill(loads, count, center):
+    """Spread `count` cards over days with the given loads, lowest days first.
+
+    Returns the number of cards put on each day. Days left tied at the final
+    level get the remainder nearest to `center` (the cards' original day).
+    """
+    ordered = np.sort(loads)
+    # Cards needed to raise the k lowest days up to the k-th lowest load
+    cost = np.arange(1, ordered.size + 1) * ordered - np.cumsum(ordered)
+    k = np.searchsorted(cost, count, side='right')
+    level = (count + ordered[:k].sum()) // k
+    alloc = np.clip(level - loads, 0, None)
+
+    remainder = count - alloc.sum()
+    if remainder:
+        tied = np.flatnonzero(loads + alloc == level)
+        nearest = tied[np.argsort(np.abs(tied - center), kind='stable')[:remainder]]
+        alloc[nearest] += 1
+    return alloc
+
+
+def plan(conn, tolerance=DEFAULT_TOLERANCE, now=None):
+    """Work out new due days that flatten the daily review histogram.
+
+    Each card due after today may move within +/- `tolerance` of its
+    interval. Cards with the narrowest windows are placed first, each group
+    of cards sharing a window being water-filled onto the least loaded days
+    in it. Returns card ids with their current and new day offsets.
+    """
+    now = now or time.time()
+    rows = conn.execute(
+        '''SELECT id, due, interval_days FROM spaced_repetition
+           WHERE due IS NOT NULL ORDER BY id''').fetchall()
+    data = np.array([tuple(row) for row in rows], dtype=np.float64).reshape(-1, 3)
+    ids = data[:, 0].astype(np.int64)
+    day = np.floor((data[:, 1] - _today_start(now)) / SECONDS_PER_DAY).astype(np.int64)
+    day = np.maximum(day, 0)  # overdue cards count towards today
+
+    # Cards only ever bumped by a fixed number of days have no interval;
+    # the distance to their due day stands in for it
+    interval = data[:, 2]
+    interval = np.where(np.isnan(interval) | (interval < 1), np.maximum(day, 1), interval)
+    slack = np.floor(interval * tolerance).astype(np.int64)
+    movable = (day >= 1) & (slack >= 1)
+    low = np.maximum(day - slack, 1)
+    high = day + slack
+
+    size = int(max(high.max(initial=0), day.max(initial=0))) + 1
+    load = np.bincount(day[~movable], minlength=size)
+    new_day = day.copy()
+
+    moving = np.flatnonzero(movable)
+    windows = np.stack([high[moving] - low[moving], low[moving], day[moving]], axis=1)
+    # Sorted by window width, so the most constrained cards go first
+    groups, inverse, counts = np.unique(
+        windows, axis=0, return_inverse=True, return_counts=True)
+    members = moving[np.argsort(inverse.reshape(-1), kind='stable')]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    for (width, first, original), start, count in zip(groups, starts, counts):
+        last = first + width + 1
+        alloc = _water_fill(load[first:last], count, original - first)
+        load[first:last] += alloc
+        new_day[members[start:start + count]] = np.repeat(np.arange(first, last), alloc)
+
+    return {'ids': ids, 'day': day, 'new_day': new_day, 'size': size}
+
+
+def summarize(result, days=PREVIEW_DAYS, now=None):
+    """Before/after histograms and peaks for a plan, ready for JSON."""
+    before = np.bincount(result['day'], minlength=result['size'])
+    after = np.bincount(result['new_day'], minlength=result['size'])
+    start = date.fromtimestamp(now or time.time())
+    return {
+        'start': start.isoformat(),
+        'cards': int(result['ids'].size),
+        'moved': int((result['day'] != result['new_day']).sum()),
+        # Today's pile (including overdue cards) is never moved
+        'peak_before': int(before[1:].max(initial=0)),
+        'peak_after': int(after[1:].max(initial=0)),
+        'dates': [(start + timedelta(days=i)).isoformat() for i in range(days)],
+        'before': before[:days].tolist() + [0] * max(days - before.size, 0),
+        'after': after[:days].tolist() + [0] * max(days - after.size, 0),
+    }
+
+
+def check_tolerance(tolerance):
+    """Return `tolerance` clamped to [0, MAX_TOLERANCE]; ValueError if not finite."""
+    tolerance = float(tolerance)
+    if not math.isfinite(tolerance):
+        raise ValueError(f"tolerance must be a finite number, got {tolerance!r}")
+    return min(max(tolerance, 0.0), MAX_TOLERANCE)
+
+
+def rebalance(conn, tolerance=DEFAULT_TOLERANCE, dry_run=True, days=PREVIEW_DAYS, now=None):
+    """Flatten review peaks; with dry_run only preview the new histogram.
+
+    To apply, call it inside a write transaction (run_write(), or BEGIN
+    IMMEDIATE), so no review can land between reading the due dates and
+    moving them. The caller commits.
+    """
+    tolerance = check_tolerance(tolerance)
+    now = now or time.time()
+    if dry_run:
+        summary = summarize(plan(conn, tolerance, now), days, now)
+    else:
+        result = plan(conn, tolerance, now)
+        shifts = result['new_day'] - result['day']
+        moved = np.flatnonzero(shifts)
+        conn.executemany(INCREMENT_PRACTICE_DATE_SQL, (
+            (f'{shift:+d} days', f'{shift:+d} days', card_id)
+            for shift, card_id in zip(shifts[moved].tolist(), result['ids'][moved].tolist())))
+        summary = summarize(result, days, now)
+    summary.update(tolerance=tolerance, applied=not dry_run)
+    return summary
+
+
+def main(argv=None):
+    from database import DATABASE_PATH
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(
+        description='Spread due dates to flatten daily review peaks.')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='fraction of its interval a card may move (default 0.1)')
+    parser.add_argument('--days', type=int, default=PREVIEW_DAYS,
+                        help='days of histogram to print')
+    parser.add_argument('--apply', action='store_true',
+                        help='write the new due dates (default is a dry run)')
+    parser.add_argument('--db', default=DATABASE_PATH, help='database file')
+    args = parser.parse_args(argv)
+    try:
+        check_tolerance(args.tolerance)
+    except ValueError as e:
+        parser.error(str(e))
+
+    conn = sqlite3.connect(args.db)
+    migrate(conn)
+    if args.apply:
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            summary = rebalance(conn, args.tolerance, dry_run=False, days=args.days)
+    else:
+        summary = rebalance(conn, args.tolerance, days=args.days)
+    conn.close()
+
+    scale = max(max(summary['before'], default=0), max(summary['after'], default=0), 1)
+    print(f"{'date':10}  {'before':>7}  {'after':>7}")
+    for day, before, after in zip(summary['dates'], summary['before'], summary['after']):
+        bar = '#' * round(after * 40 / scale)
+        print(f"{day}  {before:7d}  {after:7d}  {bar}")
+    action = 'Moved' if summary['applied'] else 'Would move'
+    print(f"{action} {summary['moved']} of {summary['cards']} cards; "
+          f"peak {summary['peak_before']} -> {summary['peak_after']} reviews/day")
+    if not summary['applied']:
+        print('Dry run; pass --apply to write the new due dates.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import time
+
+from scheduler import GRADES, GRADE_CARD_SQL
+
+# Largest batch accepted by /api/reviews
+MAX_BATCH_SIZE = 1000
+# How long applied idempotency keys are remembered
+REVIEW_LOG_RETENTION = 30 * 86400
+
+# Parameters: stars, card id
+RATE_PRACTICE_SQL = 'UPDATE spaced_repetition SET stars = ? WHERE id = ?'
+
+# Parameters: '+N days', '+N days', card id. Days are added in local time,
+# so the card keeps its time of day across DST changes.
+INCREMENT_PRACTICE_DATE_SQL = '''
+    UPDATE spaced_repetition
+    SET due = CAST(strftime('%s', due, 'unixepoch', 'localtime', ?, 'utc') AS INTEGER),
+        date = strftime('%Y-%m-%dT%H:%M:%S', due, 'unixepoch', 'localtime', ?)
+    WHERE id = ?
+'''
+
+
+class ReviewError(ValueError):
+    """Raised for a review event that cannot be applied."""
+
+
+def _int_field(event, name, low=None, high=None):
+    value = event.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ReviewError(f"{name} must be an integer")
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise ReviewError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def validate_review(event, now):
+    """Check one review event from a client and return it normalized.
+
+    An event has card_id, idempotency_key and client_ts (epoch seconds or
+    milliseconds), plus at least one of grade (1-4), stars (1-5) or days
+    (date bump).
+    """
+    if not isinstance(event, dict):
+        raise ReviewError("review must be an object")
+    key = event.get('idempotency_key')
+    if not isinstance(key, str) or not key or len(key) > 200:
+        raise ReviewError("idempotency_key must be a non-empty string")
+
+    card_id = _int_field(event, 'card_id', 1)
+    if card_id is None:
+        raise ReviewError("card_id is required")
+    grade = _int_field(event, 'grade', min(GRADES), max(GRADES))
+    stars = _int_field(event, 'stars', 1, 5)
+    days = _int_field(event, 'days', 1, 3650)
+    if grade is None and stars is None and days is None:
+        raise ReviewError("review needs a grade, stars or days")
+
+    client_ts = event.get('client_ts')
+    if isinstance(client_ts, bool) or not isinstance(client_ts, (int, float)):
+        raise ReviewError("client_ts must be a number")
+    if client_ts > 1e11:
+        client_ts /= 1000
+    # Past the retention window the key may be forgotten, so a replay could
+    # apply twice; a bogus clock would also schedule from decades ago
+    if client_ts < now - REVIEW_LOG_RETENTION:
+        raise ReviewError("client_ts is older than the review sync window")
+    # A client clock running ahead must not schedule reviews in the future
+    client_ts = int(min(client_ts, now))
+
+    return {
+        'idempotency_key': key,
+        'card_id': card_id,
+        'grade': grade,
+        'stars': stars,
+        'days': days,
+        'client_ts': client_ts,
+    }
+
+
+def apply_reviews(conn, events, algorithm, now=None):
+    """Apply a batch of review events in a single transaction.
+
+    Events are applied in client_ts order. An event whose idempotency key has
+    already been applied is skipped, so a client can safely resend a batch
+    after a dropped response. Invalid events, events for missing cards and
+    grades older than the card's last review (a stale offline batch) are
+    rejected individually and not recorded. Returns the keys applied, skipped as duplicates and
+    rejected (with the reason).
+    """
+    with conn:
+        return write_reviews(conn, events, algorithm, now)
+
+
+def write_reviews(conn, events, algorithm, now=None):
+    """apply_reviews() without the transaction, for database.run_write()."""
+    now = int(now or time.time())
+    result = {'applied': [], 'duplicates': [], 'rejected': []}
+
+    valid = []
+    for event in events:
+        try:
+            valid.append(validate_review(event, now))
+        except ReviewError as e:
+            key = event.get('idempotency_key') if isinstance(event, dict) else None
+            result['rejected'].append({'idempotency_key': key, 'error': str(e)})
+    valid.sort(key=lambda review: review['client_ts'])
+
+    for review in valid:
+        card = conn.execute('SELECT last_review FROM spaced_repetition WHERE id = ?',
+                            (review['card_id'],)).fetchone()
+        error = None
+        if card is None:
+            error = "card not found"
+        elif (review['grade'] is not None and card[0] is not None
+              and review['client_ts'] < card[0]):
+            error = "review is older than the card's last review"
+        if error:
+            duplicate = conn.execute('SELECT 1 FROM review_log WHERE idempotency_key = ?',
+                                     (review['idempotency_key'],)).fetchone()
+            if duplicate:
+                result['duplicates'].append(review['idempotency_key'])
+            else:
+                result['rejected'].append(
+                    {'idempotency_key': review['idempotency_key'], 'error': error})
+            continue
+
+        inserted = conn.execute(
+            '''INSERT OR IGNORE INTO review_log
+               (idempotency_key, card_id, grade, stars, days, client_ts, applied_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            (review['idempotency_key'], review['card_id'], review['grade'],
+             review['stars'], review['days'], review['client_ts'], now)
+        ).rowcount
+        if not inserted:
+            result['duplicates'].append(review['idempotency_key'])
+            continue
+
+        card_id = review['card_id']
+        if review['stars'] is not None:
+            conn.execute(RATE_PRACTICE_SQL, (review['stars'], card_id))
+        if review['days'] is not None:
+            modifier = f"+{review['days']} days"
+            conn.execute(INCREMENT_PRACTICE_DATE_SQL, (modifier, modifier, card_id))
+        if review['grade'] is not None:
+            # Schedule from when the card was reviewed, not when it synced
+            conn.execute(GRADE_CARD_SQL, (algorithm, review['grade'],
+                                          review['client_ts'], card_id))
+        result['applied'].append(review['idempotency_key'])
+
+    conn.execute('DELETE FROM review_log WHERE applied_at < ?',
+                 (now - REVIEW_LOG_RETENTION,))
+    return result
@@ -0,0 +1,166 @@
+import json
+import math
+
+# Review grades shown on the practice card
+GRADES = {1: 'Again', 2: 'Hard', 3: 'Good', 4: 'Easy'}
+ALGORITHMS = ('sm2', 'fsrs')
+DEFAULT_ALGORITHM = 'fsrs'
+
+SECONDS_PER_DAY = 86400
+
+# SM-2 works on a 0-5 quality scale; map our 1-4 grades onto it
+SM2_QUALITY = {1: 1, 2: 3, 3: 4, 4: 5}
+SM2_MIN_EASE = 1.3
+
+# FSRS-4.5 default weights and forgetting curve constants
+FSRS_WEIGHTS = (
+    0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+    0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755,
+)
+FSRS_DECAY = -0.5
+FSRS_FACTOR = 19 / 81
+FSRS_DESIRED_RETENTION = 0.9
+FSRS_MAX_INTERVAL = 36500
+
+
+def sm2(state, grade):
+    """Return the next SM-2 state for a card graded `grade` (1-4)."""
+    quality = SM2_QUALITY[grade]
+    ease = state['ease'] or 2.5
+    reps = state['reps'] or 0
+    interval = state['interval_days'] or 0
+    lapses = state['lapses'] or 0
+
+    if quality >= 3:
+        if reps == 0:
+            interval = 1
+        elif reps == 1:
+            interval = 6
+        else:
+            interval = round(interval * ease)
+        reps += 1
+    else:
+        reps = 0
+        interval = 1
+        lapses += 1
+
+    ease = max(SM2_MIN_EASE,
+               ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return dict(state, ease=ease, reps=reps, lapses=lapses, interval_days=interval)
+
+
+def fsrs_retrievability(elapsed_days, stability):
+    """Probability of recalling a card `elapsed_days` after its last review."""
+    return (1 + FSRS_FACTOR * elapsed_days / stability) ** FSRS_DECAY
+
+
+def fsrs_interval(stability, retention=FSRS_DESIRED_RETENTION):
+    """Days until recall probability drops to `retention`."""
+    interval = stability / FSRS_FACTOR * (retention ** (1 / FSRS_DECAY) - 1)
+    return min(max(round(interval), 1), FSRS_MAX_INTERVAL)
+
+
+def _fsrs_initial_difficulty(grade):
+    w = FSRS_WEIGHTS
+    return w[4] - (grade - 3) * w[5]
+
+
+def _clamp_difficulty(difficulty):
+    return min(max(difficulty, 1.0), 10.0)
+
+
+def fsrs(state, grade, elapsed_days):
+    """Return the next FSRS state for a card graded `grade` (1-4)."""
+    w = FSRS_WEIGHTS
+    stability = state['stability']
+    difficulty = state['difficulty']
+    reps = state['reps'] or 0
+    lapses = state['lapses'] or 0
+
+    if stability is None or difficulty is None:
+        # First review
+        stability = w[grade - 1]
+        difficulty = _clamp_difficulty(_fsrs_initial_difficulty(grade))
+    else:
+        retrievability = fsrs_retrievability(max(elapsed_days, 0), stability)
+        if grade == 1:
+            stability = (w[11] * difficulty ** -w[12]
+                         * ((stability + 1) ** w[13] - 1)
+                         * math.exp(w[14] * (1 - retrievability)))
+        else:
+            hard_penalty = w[15] if grade == 2 else 1
+            easy_bonus = w[16] if grade == 4 else 1
+            stability = stability * (
+                math.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+                * (math.exp(w[10] * (1 - retrievability)) - 1)
+                * hard_penalty * easy_bonus + 1)
+        # Move difficulty by the grade, with FSRS-4.5 mean reversion towards
+        # the initial difficulty of "Good", w[4]
+        difficulty = difficulty - w[6] * (grade - 3)
+        difficulty = w[7] * w[4] + (1 - w[7]) * difficulty
+        difficulty = _clamp_difficulty(difficulty)
+
+    if grade == 1:
+        lapses += 1
+    return dict(state, stability=stability, difficulty=difficulty,
+                reps=reps + 1, lapses=lapses,
+                interval_days=fsrs_interval(stability))
+
+
+def next_state(algorithm, grade, now, state):
+    """Grade a card and return its new scheduling state including `due`.
+
+    `state` holds ease, stability, difficulty, interval_days, reps, lapses
+    and last_review (epoch seconds or None); `now` is epoch seconds.
+    """
+    if grade not in GRADES:
+        raise ValueError(f"grade must be one of {sorted(GRADES)}")
+    if algorithm == 'sm2':
+        state = sm2(state, grade)
+    elif algorithm == 'fsrs':
+        last_review = state['last_review']
+        elapsed = (now - last_review) / SECONDS_PER_DAY if last_review else 0
+        state = fsrs(state, grade, elapsed)
+    else:
+        raise ValueError(f"Unknown scheduler {algorithm!r}, expected one of {ALGORITHMS}")
+
+    state['last_review'] = now
+    state['due'] = int(now + state['interval_days'] * SECONDS_PER_DAY)
+    return state
+
+
+def _schedule_next_sql(algorithm, grade, now, ease, stability, difficulty,
+                       interval_days, reps, lapses, last_review):
+    state = next_state(algorithm, grade, now, {
+        'ease': ease,
+        'stability': stability,
+        'difficulty': difficulty,
+        'interval_days': interval_days,
+        'reps': reps,
+        'lapses': lapses,
+        'last_review': last_review,
+    })
+    return json.dumps(state)
+
+
+def register(conn):
+    """Register schedule_next() so grading can run as one UPDATE statement."""
+    conn.create_function('schedule_next', 10, _schedule_next_sql, deterministic=True)
+
+
+# Grades one card in a single statement: the new state is computed from the
+# row's current values inside SQLite, so there is no read-modify-write from
+# Python. Parameters: algorithm, grade, now, card id.
+GRADE_CARD_SQL = '''
+    UPDATE spaced_repetition
+    SET (ease, stability, difficulty, interval_days, reps, lapses, last_review, due, date) = (
+        SELECT json_extract(s, '$.ease'), json_extract(s, '$.stability'),
+               json_extract(s, '$.difficulty'), json_extract(s, '$.interval_days'),
+               json_extract(s, '$.reps'), json_extract(s, '$.lapses'),
+               json_extract(s, '$.last_review'), json_extract(s, '$.due'),
+               strftime('%Y-%m-%dT%H:%M:%S', json_extract(s, '$.due'), 'unixepoch', 'localtime')
+        FROM (SELECT schedule_next(?, ?, ?, ease, stability, difficulty,
+                                   interval_days, reps, lapses, last_review) AS s)
+    )
+    WHERE id = ?
+'''
@@ -0,0 +1,59 @@
+import re
+
+# Markers used by highlight()/snippet() around matched terms
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+
+
+def build_match_query(text):
+    """Turn free text from a search box into a safe FTS5 MATCH expression.
+
+    Every word is quoted (so FTS5 operators in user input are taken literally)
+    and prefix-matched, and all words must match. Returns None if the text
+    contains no searchable words.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_practices(conn, text, limit=50):
+    """Return practices matching `text`, best bm25 rank first, with highlights."""
+    match = build_match_query(text)
+    if match is None:
+        return []
+    return conn.execute(
+        f'''
+        SELECT spaced_repetition.*,
+               bm25(practice_fts) AS rank,
+               highlight(practice_fts, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}') AS question_highlight,
+               snippet(practice_fts, 1, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 16) AS answer_snippet
+        FROM practice_fts
+        JOIN spaced_repetition ON spaced_repetition.id = practice_fts.rowid
+        WHERE practice_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+        ''',
+        (match, limit)
+    ).fetchall()
+
+
+def search_notes(conn, text, limit=50):
+    """Return notes matching `text`, best bm25 rank first, with a snippet."""
+    match = build_match_query(text)
+    if match is None:
+        return []
+    return conn.execute(
+        f'''
+        SELECT notes.*,
+               bm25(notes_fts) AS rank,
+               snippet(notes_fts, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 16) AS text_snippet
+        FROM notes_fts
+        JOIN notes ON notes.id = notes_fts.rowid
+        WHERE notes_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+        ''',
+        (match, limit)
+    ).fetchall()
@@ -0,0 +1,177 @@
+// Client-side card navigation for the practice page.
+// The cards after the current one are prefetched from /api/cards in
+// batches, so Next/Previous and grading swap the card in place instead of
+// loading a new page: one request per batch of cards rather than per card.
+// Without JavaScript the pagination links work as before.
+(function () {
+    let container = null;
+    let startPage = 1;
+    let totalPages = 1;
+    let batchSize = 10;
+    // Cards seen in this visit, the one on screen, and those fetched ahead
+    let shown = [];
+    let index = 0;
+    let buffer = [];
+    // Cursor to fetch the next batch from; null once the filter is exhausted
+    let nextCursor = null;
+    let fetching = null;
+
+    function apiUrl(params) {
+        const url = new URL(container.dataset.api, window.location.href);
+        Object.keys(params).forEach(function (name) {
+            url.searchParams.set(name, params[name]);
+        });
+        return url;
+    }
+
+    // The /practice URL that shows a page server-side, for reloads and links
+    function pageUrl(page, cursorName, cursor) {
+        const url = apiUrl({page: page});
+        url.pathname = '/practice';
+        if (cursor) {
+            url.searchParams.set(cursorName, cursor);
+        }
+        return url.pathname + url.search;
+    }
+
+    function prefetch() {
+        if (fetching || !nextCursor || buffer.length > batchSize / 2) {
+            return fetching;
+        }
+        fetching = fetch(apiUrl({after: nextCursor, limit: batchSize}))
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error('cards request failed: ' + response.status);
+                }
+                return response.json();
+            })
+            .then(function (result) {
+                buffer = buffer.concat(result.cards);
+                nextCursor = result.next;
+            })
+            .catch(function () {
+                // Leave the rest to the server-side links
+                nextCursor = null;
+            })
+            .finally(function () {
+                fetching = null;
+            });
+        return fetching;
+    }
+
+    function updatePager() {
+        const page = startPage + index;
+        const card = shown[index];
+        const pager = document.querySelector('.pagination');
+        if (pager) {
+            const summary = pager.querySelector('p');
+            if (summary) {
+                summary.textContent = summary.textContent.replace(/Page \d+ of/, 'Page ' + page + ' of');
+            }
+            const current = pager.querySelector('.current');
+            if (current) {
+                current.textContent = 'Page ' + page;
+            }
+        }
+        const next = document.getElementById('nextLink');
+        if (next) {
+            next.href = pageUrl(page + 1, 'after', card.cursor);
+            next.style.display = page < totalPages ? '' : 'none';
+        }
+        const prev = document.getElementById('prevLink');
+        if (prev) {
+            prev.href = pageUrl(page - 1, 'before', card.cursor);
+        }
+        if (index > 0) {
+            history.replaceState(null, '', pageUrl(page, 'after', shown[index - 1].cursor));
+        }
+    }
+
+    function show(i) {
+        index = i;
+        container.innerHTML = shown[index].html;
+        updatePager();
+        window.scrollTo(0, container.offsetTop);
+    }
+
+    // Show the next card; returns false when the page has to be loaded instead
+    function showNext() {
+        if (index + 1 < shown.length) {
+            show(index + 1);
+            return true;
+        }
+        if (buffer.length) {
+            shown.push(buffer.shift());
+            show(index + 1);
+            prefetch();
+            return true;
+        }
+        if (fetching) {
+            fetching.then(function () {
+                if (!showNext()) {
+                    window.location.reload();
+                }
+            });
+            return true;
+        }
+        return false;
+    }
+
+    function showPrevious() {
+        if (index > 0) {
+            show(index - 1);
+            return true;
+        }
+        return false;
+    }
+
+    // Send a grade/star/date click without leaving the page
+    function submitAction(link) {
+        fetch(link.href, {redirect: 'manual'})
+            .then(function () {
+                if (link.dataset.grade || link.dataset.days) {
+                    if (!showNext()) {
+                        window.location.reload();
+                    }
+                } else {
+                    link.style.outline = '2px solid #333';
+                }
+            })
+            .catch(function () {
+                window.location.href = link.href;
+            });
+    }
+
+    document.addEventListener('click', function (e) {
+        if (!container || e.defaultPrevented || e.button !== 0 ||
+                e.ctrlKey || e.metaKey || e.shiftKey) {
+            return;
+        }
+        const link = e.target.closest('a');
+        if (!link) {
+            return;
+        }
+        if (link.id === 'nextLink' && showNext()) {
+            e.preventDefault();
+        } else if (link.id === 'prevLink' && showPrevious()) {
+            e.preventDefault();
+        } else if (link.classList.contains('review-action') && container.contains(link)) {
+            e.preventDefault();
+            submitAction(link);
+        }
+    });
+
+    document.addEventListener('DOMContentLoaded', function () {
+        const cards = document.getElementById('cards');
+        if (!cards || !cards.dataset.next) {
+            return;
+        }
+        container = cards;
+        startPage = Number(cards.dataset.page) || 1;
+        totalPages = Number(cards.dataset.totalPages) || 1;
+        batchSize = Number(cards.dataset.prefetch) || batchSize;
+        shown = [{html: cards.innerHTML, cursor: cards.dataset.next}];
+        nextCursor = startPage < totalPages ? cards.dataset.next : null;
+        prefetch();
+    });
+})();
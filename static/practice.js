@@ -0,0 +1,28 @@
+// Show/hide toggles for the practice page cards and the add form.
+function toggleStars(practiceId) {
+    const starsDiv = document.getElementById('stars-' + practiceId);
+    const btn = document.getElementById('starsBtn-' + practiceId);
+    starsDiv.classList.toggle('stars-hidden');
+    btn.textContent = starsDiv.classList.contains('stars-hidden') ? 'Show Importance' : 'Hide Importance';
+}
+
+function toggleSubjectTopic(practiceId) {
+    const subjectTopicDiv = document.getElementById('subjectTopic-' + practiceId);
+    const btn = document.getElementById('subjectTopicBtn-' + practiceId);
+    subjectTopicDiv.classList.toggle('subject-topic-hidden');
+    btn.textContent = subjectTopicDiv.classList.contains('subject-topic-hidden') ? 'Show Subject & Topic' : 'Hide Subject & Topic';
+}
+
+function toggleAnswer(practiceId) {
+    const answerDiv = document.getElementById('answer-' + practiceId);
+    const btn = document.getElementById('answerBtn-' + practiceId);
+    answerDiv.classList.toggle('answer-hidden');
+    btn.textContent = answerDiv.classList.contains('answer-hidden') ? 'Show Answer' : 'Hide Answer';
+}
+
+function togglePracticeForm() {
+    const form = document.getElementById('practiceForm');
+    const btn = document.getElementById('addPracticeBtn');
+    form.classList.toggle('show');
+    btn.textContent = form.classList.contains('show') ? 'Hide Form' : 'Add New Practice Item';
+}
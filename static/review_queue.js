@@ -0,0 +1,153 @@
+// Offline-first review queue for the practice page.
+// When enabled, grade/star/date clicks are stored in localStorage and sent
+// to /api/reviews in batches instead of one request and commit per click.
+// Every event carries an idempotency key, so resending a batch is harmless.
+(function () {
+    const QUEUE_KEY = 'reviewQueue';
+    const MODE_KEY = 'reviewQueueMode';
+    const LAST_FLUSH_KEY = 'reviewQueueLastFlush';
+    const BATCH_SIZE = 25;
+    const MAX_BATCH = 500;
+    const FLUSH_INTERVAL_MS = 30000;
+    let flushing = false;
+
+    function loadQueue() {
+        try {
+            return JSON.parse(localStorage.getItem(QUEUE_KEY)) || [];
+        } catch (e) {
+            return [];
+        }
+    }
+
+    function saveQueue(queue) {
+        localStorage.setItem(QUEUE_KEY, JSON.stringify(queue));
+    }
+
+    function enabled() {
+        return localStorage.getItem(MODE_KEY) === '1';
+    }
+
+    function newKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return Date.now() + '-' + Math.random().toString(36).slice(2);
+    }
+
+    function updateStatus() {
+        const status = document.getElementById('syncStatus');
+        if (!status) {
+            return;
+        }
+        const pending = loadQueue().length;
+        if (pending) {
+            status.textContent = pending + ' review(s) waiting to sync';
+        } else {
+            status.textContent = enabled() ? 'All reviews synced' : '';
+        }
+    }
+
+    function enqueue(link) {
+        const review = {
+            card_id: Number(link.dataset.card),
+            idempotency_key: newKey(),
+            client_ts: Date.now()
+        };
+        if (link.dataset.grade) review.grade = Number(link.dataset.grade);
+        if (link.dataset.stars) review.stars = Number(link.dataset.stars);
+        if (link.dataset.days) review.days = Number(link.dataset.days);
+
+        const queue = loadQueue();
+        queue.push(review);
+        saveQueue(queue);
+        updateStatus();
+        if (queue.length >= BATCH_SIZE) {
+            flush();
+        }
+    }
+
+    async function flush() {
+        if (flushing || !navigator.onLine) {
+            return;
+        }
+        const batch = loadQueue().slice(0, MAX_BATCH);
+        if (!batch.length) {
+            return;
+        }
+        flushing = true;
+        try {
+            const response = await fetch('/api/reviews', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({reviews: batch})
+            });
+            if (response.ok) {
+                const result = await response.json();
+                const done = new Set(result.applied.concat(
+                    result.duplicates,
+                    result.rejected.map(function (r) { return r.idempotency_key; })
+                ));
+                // Re-read the queue: clicks may have been queued meanwhile
+                saveQueue(loadQueue().filter(function (r) {
+                    return !done.has(r.idempotency_key);
+                }));
+                localStorage.setItem(LAST_FLUSH_KEY, String(Date.now()));
+            }
+        } catch (e) {
+            // Offline or server unreachable: keep the queue and retry later
+        } finally {
+            flushing = false;
+            updateStatus();
+        }
+    }
+
+    function flushIfDue() {
+        const last = Number(localStorage.getItem(LAST_FLUSH_KEY) || 0);
+        const queue = loadQueue();
+        if (queue.length >= BATCH_SIZE || (queue.length && Date.now() - last >= FLUSH_INTERVAL_MS)) {
+            flush();
+        }
+    }
+
+    document.addEventListener('click', function (e) {
+        const link = e.target.closest('a.review-action');
+        if (!link || !enabled()) {
+            return;
+        }
+        e.preventDefault();
+        enqueue(link);
+        // Grading or rescheduling finishes the card; move on to the next one
+        // (a click, so the card view can show it without a page load)
+        if (link.dataset.grade || link.dataset.days) {
+            const next = document.getElementById('nextLink');
+            if (next) {
+                next.click();
+            }
+        } else {
+            link.style.outline = '2px solid #333';
+        }
+    });
+
+    document.addEventListener('DOMContentLoaded', function () {
+        const toggle = document.getElementById('offlineMode');
+        if (toggle) {
+            toggle.checked = enabled();
+            toggle.addEventListener('change', function () {
+                localStorage.setItem(MODE_KEY, toggle.checked ? '1' : '0');
+                if (!toggle.checked) {
+                    flush();
+                }
+                updateStatus();
+            });
+        }
+        const syncButton = document.getElementById('syncNow');
+        if (syncButton) {
+            syncButton.addEventListener('click', flush);
+        }
+        updateStatus();
+        flushIfDue();
+    });
+
+    window.addEventListener('online', flush);
+    setInterval(flushIfDue, 5000);
+})();
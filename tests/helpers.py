@@ -0,0 +1,25 @@
+import contextlib
+import io
+import sqlite3
+
+import scheduler
+from migrations import migrate
+
+
+def memory_db():
+    """Return an in-memory database at the latest schema, like database.connect()."""
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    scheduler.register(conn)
+    with contextlib.redirect_stdout(io.StringIO()):
+        migrate(conn)
+    return conn
+
+
+def add_card(conn, question='q'):
+    """Insert a card and return its id."""
+    cursor = conn.execute(
+        "INSERT INTO spaced_repetition (subject, topic, question, answer, date) "
+        "VALUES ('S', 'T', ?, 'a', '2026-01-01T09:00:00')", (question,))
+    conn.commit()
+    return cursor.lastrowid
@@ -0,0 +1,77 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import backup_practices
+import forecast
+import scheduler
+from migrations import migrate
+from tests.helpers import add_card
+
+
+def file_db(path):
+    conn = sqlite3.connect(path)
+    scheduler.register(conn)
+    with contextlib.redirect_stdout(io.StringIO()):
+        migrate(conn)
+    return conn
+
+
+def set_due(conn, card_id, due):
+    conn.execute('UPDATE spaced_repetition SET due = ? WHERE id = ?', (due, card_id))
+    conn.commit()
+
+
+class LoadScheduleTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'app.db')
+        self.conn = file_db(self.path)
+
+    def tearDown(self):
+        self.conn.close()
+        forecast._cache.clear()
+        self.tmp.cleanup()
+
+    def test_changes_are_patched_into_the_cached_deck(self):
+        first, second = add_card(self.conn, 'a'), add_card(self.conn, 'b')
+        forecast.load_schedule(self.conn)
+        set_due(self.conn, second, 1_900_000_000)
+        schedule = forecast.load_schedule(self.conn)
+        self.assertEqual(list(schedule['due']),
+                         [self.conn.execute('SELECT due FROM spaced_repetition WHERE id = ?',
+                                            (first,)).fetchone()[0], 1_900_000_000])
+
+    def test_restore_with_a_higher_changelog_seq_reloads_the_deck(self):
+        card = add_card(self.conn)
+        set_due(self.conn, card, 1_800_000_000)
+        self.assertEqual(list(forecast.load_schedule(self.conn)['due']), [1_800_000_000])
+
+        # A backup of another copy of the deck, with more changes since
+        other_path = os.path.join(self.tmp.name, 'other.db')
+        other = file_db(other_path)
+        card = add_card(other)
+        set_due(other, card, 1_700_000_000)
+        for due in range(1_900_000_000, 1_900_000_005):
+            set_due(other, add_card(other), due)
+        other.close()
+        backup_dir = os.path.join(self.tmp.name, 'backup')
+        with mock.patch.object(backup_practices, 'DATABASE_PATH', other_path), \
+                contextlib.redirect_stdout(io.StringIO()):
+            backup_practices.export_backup(backup_dir)
+            backup_practices.restore_backup(backup_dir, self.path)
+        # The restored changelog continues from the backup's high-water mark
+        set_due(self.conn, 6, 1_900_000_010)
+
+        schedule = forecast.load_schedule(self.conn)
+        self.assertEqual(list(schedule['due']),
+                         [1_700_000_000] + list(range(1_900_000_000, 1_900_000_004)) + [1_900_000_010])
+        self.assertEqual(forecast.forecast(self.conn, days=30, now=1_700_000_000)['cards'], 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
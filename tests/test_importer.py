@@ -0,0 +1,58 @@
+import unittest
+
+import importer
+from tests.helpers import memory_db
+
+
+def cards(count):
+    for line in range(count):
+        yield line, ('S', 'T', f'q{line}', f'a{line}'), None
+
+
+class ImportCardsTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = memory_db()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def write(self, fn):
+        with self.conn:
+            return fn(self.conn)
+
+    def schema_version(self):
+        return self.conn.execute('PRAGMA schema_version').fetchone()[0]
+
+    def test_triggers_are_recreated_once_per_import(self):
+        before = self.schema_version()
+        importer.import_cards(cards(10), self.write, chunk_size=10)
+        one_chunk = self.schema_version() - before
+        before = self.schema_version()
+        report = importer.import_cards(cards(25), self.write, chunk_size=3, policy='allow')
+        self.assertEqual(report['imported'], 25)
+        self.assertEqual(self.schema_version() - before, one_chunk)
+
+        # The triggers are back and still maintain the derived data
+        self.conn.execute("INSERT INTO spaced_repetition (subject, topic, question, answer, date) "
+                          "VALUES ('S', 'T', 'new', 'a', '2026-01-01T09:00:00')")
+        self.assertEqual(self.conn.execute(
+            "SELECT card_count FROM subjects WHERE name = 'S'").fetchone()[0], 36)
+        self.assertEqual(self.conn.execute(
+            "SELECT COUNT(*) FROM practice_fts WHERE practice_fts MATCH 'new'").fetchone()[0], 1)
+
+    def test_failed_import_leaves_the_deck_and_triggers_unchanged(self):
+        def failing():
+            yield from cards(5)
+            raise importer.ImportFileError('truncated file')
+
+        triggers = self.conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'").fetchone()[0]
+        with self.assertRaises(importer.ImportFileError):
+            importer.import_cards(failing(), self.write, chunk_size=2)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM spaced_repetition').fetchone()[0], 0)
+        self.assertEqual(self.conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'").fetchone()[0], triggers)
+
+
+if __name__ == '__main__':
+    unittest.main()
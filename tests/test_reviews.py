@@ -0,0 +1,56 @@
+import unittest
+
+from reviews import REVIEW_LOG_RETENTION, apply_reviews
+from tests.helpers import add_card, memory_db
+
+NOW = 1_800_000_000
+
+
+def review(key, card_id, client_ts, grade=3):
+    return {'idempotency_key': key, 'card_id': card_id, 'client_ts': client_ts, 'grade': grade}
+
+
+class ApplyReviewsTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = memory_db()
+        self.card = add_card(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def logged(self):
+        return [row[0] for row in self.conn.execute('SELECT idempotency_key FROM review_log')]
+
+    def test_missing_card_is_rejected_and_not_logged(self):
+        result = apply_reviews(self.conn, [review('k1', 999, NOW)], 'fsrs', now=NOW)
+        self.assertEqual(result['applied'], [])
+        self.assertEqual(result['rejected'], [{'idempotency_key': 'k1', 'error': 'card not found'}])
+        self.assertEqual(self.logged(), [])
+
+    def test_timestamp_outside_sync_window_is_rejected(self):
+        result = apply_reviews(self.conn, [review('k1', self.card, 1)], 'fsrs', now=NOW)
+        self.assertEqual([r['idempotency_key'] for r in result['rejected']], ['k1'])
+        old = NOW - REVIEW_LOG_RETENTION - 1
+        result = apply_reviews(self.conn, [review('k2', self.card, old)], 'fsrs', now=NOW)
+        self.assertEqual([r['idempotency_key'] for r in result['rejected']], ['k2'])
+        self.assertIsNone(self.conn.execute('SELECT last_review FROM spaced_repetition').fetchone()[0])
+
+    def test_stale_review_does_not_move_schedule_backwards(self):
+        apply_reviews(self.conn, [review('new', self.card, NOW - 60)], 'fsrs', now=NOW)
+        before = tuple(self.conn.execute('SELECT last_review, due FROM spaced_repetition').fetchone())
+        result = apply_reviews(self.conn, [review('old', self.card, NOW - 3600)], 'fsrs', now=NOW)
+        self.assertEqual(result['rejected'][0]['idempotency_key'], 'old')
+        after = tuple(self.conn.execute('SELECT last_review, due FROM spaced_repetition').fetchone())
+        self.assertEqual(before, after)
+        self.assertEqual(before[0], NOW - 60)
+
+    def test_resent_batch_is_reported_as_duplicates(self):
+        batch = [review('a', self.card, NOW - 120), review('b', self.card, NOW - 60)]
+        self.assertEqual(apply_reviews(self.conn, batch, 'fsrs', now=NOW)['applied'], ['a', 'b'])
+        result = apply_reviews(self.conn, batch, 'fsrs', now=NOW)
+        self.assertEqual(result['duplicates'], ['a', 'b'])
+        self.assertEqual(result['rejected'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+import numpy as np
+
+import forecast
+from scheduler import fsrs
+
+REVIEWED = {'stability': 3.0, 'difficulty': 5.0, 'reps': 2, 'lapses': 0}
+
+
+class FsrsTest(unittest.TestCase):
+    def test_difficulty_reverts_towards_the_initial_good_difficulty(self):
+        # FSRS-4.5: D' = w7 * w4 + (1 - w7) * (D - w6 * (G - 3))
+        # with D = 5, G = 1: 0.031 * 5.1618 + 0.969 * (5 + 2 * 0.8975)
+        state = fsrs(REVIEWED, 1, 3)
+        self.assertAlmostEqual(state['difficulty'], 6.7443708, places=7)
+        self.assertEqual(state['lapses'], 1)
+
+    def test_forecast_good_review_matches_the_scheduler(self):
+        state = fsrs(REVIEWED, 3, 3)
+        retrievability = forecast._retrievability(3.0, np.array([3.0]))
+        stability, difficulty, interval = forecast._good_review(
+            np.array([3.0]), np.array([5.0]), retrievability)
+        self.assertAlmostEqual(stability[0], state['stability'])
+        self.assertAlmostEqual(difficulty[0], state['difficulty'])
+        self.assertEqual(interval[0], state['interval_days'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import writer
+
+
+class WriteQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'app.db')
+        with sqlite3.connect(self.path) as conn:
+            conn.execute('CREATE TABLE t (x INTEGER)')
+        self.queue = writer.WriteQueue(lambda: sqlite3.connect(self.path))
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp.cleanup()
+
+    def rows(self):
+        with sqlite3.connect(self.path) as conn:
+            return [row[0] for row in conn.execute('SELECT x FROM t ORDER BY x')]
+
+    def test_submit_from_inside_a_write_does_not_wait_for_it(self):
+        def fn(conn):
+            conn.execute('INSERT INTO t VALUES (1)')
+            self.queue.submit(lambda conn: conn.execute('INSERT INTO t VALUES (2)'))
+            return 'done'
+
+        started = time.monotonic()
+        self.assertEqual(self.queue.call(fn, timeout=5), 'done')
+        self.assertLess(time.monotonic() - started, 5)
+        self.queue.call(lambda conn: None)  # the submitted write is ahead of this one
+        self.assertEqual(self.rows(), [1, 2])
+
+    def test_submitted_write_errors_are_dropped(self):
+        self.queue.submit(lambda conn: conn.execute('INSERT INTO missing VALUES (1)'))
+        self.queue.call(lambda conn: conn.execute('INSERT INTO t VALUES (3)'))
+        self.assertEqual(self.rows(), [3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+
+# Defaults for app.config['WRITE_QUEUE_WINDOW_MS'] / ['WRITE_QUEUE_MAX_BATCH']:
+# the writer waits up to WINDOW_MS after the first queued write for more to
+# arrive, and commits at most MAX_BATCH writes in one transaction. With no
+# window, writes queued while a commit is running still share the next one,
+# and a lone write is not delayed.
+WINDOW_MS = 0
+MAX_BATCH = 256
+# How long a request waits for its write to be committed
+WAIT_TIMEOUT = 30
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class WriteTimeout(sqlite3.OperationalError):
+    """Raised when a queued write is not committed within the wait timeout."""
+
+
+class _Pending:
+    """A queued write: the function to run and, once committed, its outcome."""
+
+    __slots__ = ('fn', 'done', 'result', 'error')
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self, timeout=WAIT_TIMEOUT):
+        if not self.done.wait(timeout):
+            raise WriteTimeout(f"write not committed after {timeout}s")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class WriteQueue:
+    """One thread and one connection that perform every write, in group commits.
+
+    Request handlers hand over a function taking the connection; the writer
+    runs a batch of them in a single transaction, each in its own savepoint
+    so a failing write is rolled back alone, commits once, and then wakes the
+    callers. Writers never compete for the database lock, and the commit
+    (the fsync) is shared by everything in the batch.
+    """
+
+    def __init__(self, connect, window=WINDOW_MS / 1000, max_batch=MAX_BATCH):
+        self.connect = connect
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self.thread.start()
+
+    def call(self, fn, timeout=WAIT_TIMEOUT):
+        """Run fn(conn) in the writer and return its result once committed."""
+        pending = _Pending(fn)
+        self.queue.put(pending)
+        return pending.wait(timeout)
+
+    def submit(self, fn):
+        """Queue fn(conn) without waiting; its result and any error are discarded."""
+        self.queue.put(_Pending(fn))
+
+    def execute(self, sql, parameters=(), timeout=WAIT_TIMEOUT):
+        """Run one statement in the writer; returns its rowcount once committed."""
+        return self.call(lambda conn: conn.execute(sql, parameters).rowcount, timeout)
+
+    def close(self):
+        """Finish the queued writes and stop the thread."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                pending = (self.queue.get(timeout=remaining) if remaining > 0
+                           else self.queue.get_nowait())
+            except queue.Empty:
+                break
+            if pending is None:
+                # Put the stop marker back for the main loop
+                self.queue.put(None)
+                break
+            batch.append(pending)
+        return batch
+
+    def _commit(self, conn, batch):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for pending in batch:
+                conn.execute('SAVEPOINT write')
+                try:
+                    pending.result = pending.fn(conn)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write')
+                    pending.error = e
+                conn.execute('RELEASE write')
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for pending in batch:
+                if pending.error is None:
+                    pending.result, pending.error = None, e
+        for pending in batch:
+            pending.done.set()
+
+    def _run(self):
+        conn = self.connect()
+        # Transactions are managed here, not by the sqlite3 module
+        conn.isolation_level = None
+        try:
+            while True:
+                first = self.queue.get()
+                if first is None:
+                    break
+                self._commit(conn, self._collect(first))
+        finally:
+            conn.close()
+
+
+def get_writer(path, connect, window=WINDOW_MS / 1000, max_batch=MAX_BATCH):
+    """Return the writer for database file `path`, starting it on first use."""
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = WriteQueue(connect, window, max_batch)
+        return writer
+
+
+@atexit.register
+def shutdown():
+    """Commit the queued writes and stop every writer thread."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()